@@ -6,11 +6,17 @@
 
 import time
 import csv
+import sys
+import signal
 import serial
 import gpiozero
 from datetime import datetime
 #import pytz                     #Olson time zone (tz) database
 
+from ltb_input import InputEngine, SWITCH_1, SWITCH_2, PRESSED   # Event driven button handling
+from ltb_journal import SessionJournal, FSYNC_IDLE              # Keeps stamp.csv open, commits when idle
+from ltb_writer import BackgroundWriter, OVERFLOW_BLOCK         # File I/O thread, keeps the SD card off the button thread
+
 #import board
 #import  digitalio
 #from adafruit_debouncer import Debouncer
@@ -141,8 +147,18 @@ print("now =", now)
 
 
 # Creates a file and writes name inside a text file along the path.
-with open("/home/pi/Desktop/Python_ltb/stamp.csv", "a") as f:
-    f.write("Date, Time In, Time Out , Total, Voice Note\r\n")
+# The file stays open in the journal, every write below goes through the background writer thread
+STAMP_CSV = "/home/pi/Desktop/Python_ltb/stamp.csv"
+log_writer = BackgroundWriter(64, OVERFLOW_BLOCK)     # Overflow policy: OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST or OVERFLOW_SPILL
+stamp_journal = SessionJournal(STAMP_CSV, FSYNC_IDLE, scheduler=log_writer.scheduler)
+log_writer.on_idle(stamp_journal.idle)
+
+def stamp_write(text):
+    """Queue text for stamp.csv on the writer thread."""
+    log_writer.submit(stamp_journal.append_text, text)
+
+# Writes the column names, queued on the background writer thread like every other entry
+stamp_write("Date, Time In, Time Out , Total, Voice Note\r\n")
 print("Logging column names into the filesystem\n")
 
 
@@ -172,6 +188,7 @@ class StateMachine(object):
     def __init__(self):                             # Needed constructor
         self.state = None
         self.states = {}
+        self.event = None                           # The button event currently being handled, read by the states "pressed" attribute
 
 
     def add_state(self, state):                     # "add state" attribute, adds states to the machine
@@ -185,12 +202,19 @@ class StateMachine(object):
         log('Entering %s' % (self.state.name))
         self.state.enter(self)
 
-    def pressed(self):                              # "button pressed" attribute. Accessed at the end of each loop, applies a pause and prints confirmaiton if setup.
+    def pressed(self, event):                       # "button pressed" attribute. Called once for every press taken from the input engine queue
         if self.state:
             log('Updating %s' % (self.state.name))
+            self.event = event
             self.state.pressed(self)
             #print("'StateMachine' Class occurrence")  # Use this print statement to understand how the states transition here to update the state in the serial monitor
-            time.sleep(.30)                             # Critial pause needed to prevent the serial monitor from being "flooded" with data and crashing
+
+    def run(self, input_engine):                    # "run" attribute. Blocks on the input queue, nothing runs until a button edge arrives
+        while True:
+            event = input_engine.get()
+            if event.edge == PRESSED:
+                log('Switch %d pressed, %d us in queue' % (event.switch, (time.monotonic_ns() - event.timestamp_ns) // 1000))
+                self.pressed(event)
 
 
 
@@ -259,9 +283,9 @@ class Home(State):
         home_scrn.value = False    # output low signal to the epaper microcontroller
 
     def pressed(self, machine):
-        if switch_1.is_pressed:                                         #
+        if machine.event.switch == SWITCH_1:                                         #
             machine.go_to_state('Profile 1')
-        if switch_2.is_pressed:
+        if machine.event.switch == SWITCH_2:
             machine.go_to_state('Profile 2')
     # Experiment clearing the screen before transitioning, perhaps load the next screen here? OR in "exit"
 
@@ -289,9 +313,9 @@ class Profile1(State):
         profile1_scrn.value = False    # output low signal to the epaper microcontroller
 
     def pressed(self, machine):
-        if switch_1.is_pressed:
+        if machine.event.switch == SWITCH_1:
             machine.go_to_state('Tracking1')
-        if switch_2.is_pressed:
+        if machine.event.switch == SWITCH_2:
             machine.go_to_state('Focus Timer 1')
     # Experiment clearing the screen before transitioning, perhaps load the next screen here? OR in "exit"
 
@@ -331,23 +355,22 @@ class Tracking1(State):
 
         print('Logging start time to .csv\n')    # Upon exit, log the global variables containing time stamps to the SD Card
 
-        # appending timestamp to file, Use "a" to append file, "w" will overwrite data in the file, "r" will read lines from the file.
-        with open("/home/pi/Desktop/Python_ltb/stamp.csv", "a") as f:
-            #led.value = True    # turn on LED to indicate writing entries
-            print("%d/%d/%d, " % (self.State.month_in, self.State.day_in, self.State.year_in)) #Prints to serial monitor the data about to be written to the SD card
-            f.write("%d/%d/%d, " % (self.State.month_in, self.State.day_in, self.State.year_in))    # Common U.S. date format
+        # Handed to the background writer thread, the file is written off the button thread
+        #led.value = True    # turn on LED to indicate writing entries
+        print("%d/%d/%d, " % (self.State.month_in, self.State.day_in, self.State.year_in)) #Prints to serial monitor the data about to be written to the SD card
+        stamp_write("%d/%d/%d, " % (self.State.month_in, self.State.day_in, self.State.year_in))    # Common U.S. date format
 
-            print("%d:%02d:%02d, " % (self.State.hour_in, self.State.min_in, self.State.sec_in)) #Prints to the serial monitor the data about to be written to the SD card
-            f.write("%d:%02d:%02d, " % (self.State.hour_in, self.State.min_in, self.State.sec_in))  # "Time in" written to file
-            #led.value = False  # turn off LED to indicate we're done
+        print("%d:%02d:%02d, " % (self.State.hour_in, self.State.min_in, self.State.sec_in)) #Prints to the serial monitor the data about to be written to the SD card
+        stamp_write("%d:%02d:%02d, " % (self.State.hour_in, self.State.min_in, self.State.sec_in))  # "Time in" written to file
+        #led.value = False  # turn off LED to indicate we're done
 
-            # Read out all lines in the .csv file to verify the last entry
-            #with open("/sd/stamp.csv", "r") as f:
-            #print("Printing lines in file:")
-            #line = f.readline()
-            #while line != '':
-            #print(line)
-            #line = f.readline()
+        # Read out all lines in the .csv file to verify the last entry
+        #with open("/sd/stamp.csv", "r") as f:
+        #print("Printing lines in file:")
+        #line = f.readline()
+        #while line != '':
+        #print(line)
+        #line = f.readline()
 
     def exit(self, machine):
         State.exit(self, machine)
@@ -360,9 +383,9 @@ class Tracking1(State):
         track1_scrn.value = False    # output low signal to the epaper microcontroller
 
     def pressed(self, machine):
-        if switch_1.is_pressed:
+        if machine.event.switch == SWITCH_1:
             machine.go_to_state('Voice Note')
-        if switch_2.is_pressed:
+        if machine.event.switch == SWITCH_2:
             machine.go_to_state('Voice Note')
 
 ########################################
@@ -394,9 +417,9 @@ class FocusTimer1(State):
 
 
     def pressed(self, machine):
-        if switch_1.is_pressed:                   # Either button press results in a transition to the "Home" state
+        if machine.event.switch == SWITCH_1:                   # Either button press results in a transition to the "Home" state
             machine.go_to_state('Home')
-        if switch_2.is_pressed:                   # Question: Perhaps a transition to "Profile1" is more appropriate?
+        if machine.event.switch == SWITCH_2:                   # Question: Perhaps a transition to "Profile1" is more appropriate?
             machine.go_to_state('Home')
     # Experiment clearing the screen before transitioning, perhaps load the next screen here? OR in "exit"
 
@@ -426,9 +449,9 @@ class Profile2(State):
 
 
     def pressed(self, machine):
-        if switch_1.is_pressed:
+        if machine.event.switch == SWITCH_1:
             machine.go_to_state('Home')     # Either button press returns to "Home" state, further profiles will be implemented in the future
-        if switch_2.is_pressed:
+        if machine.event.switch == SWITCH_2:
             machine.go_to_state('Home')
     # Experiment clearing the screen before transitioning, perhaps load the next screen here? OR in "exit"
 
@@ -471,23 +494,22 @@ class VoiceNote(State):
 
         print('Logging stop time to .csv filesystem\n')    # Upon exit, log the global variables containing time stamps to the SD Card
 
-        # appending timestamp to file, Use "a" to append file, "w" will overwrite data in the file, "r" will read lines from the file.
-        with open("/home/pi/Desktop/Python_ltb/stamp.csv", "a") as f:
-            #led.value = True    # turn on LED to indicate writing entries
-            #print("%d/%d/%d, " % (self.State.month_out, self.State.day_out, self.State.year_out)) #Prints to serial monitor the data about to be written to the SD card
-            #f.write("%d/%d/%d, " % (self.State.month_out, self.State.day_out, self.State.year_out))    # Common U.S. date format
+        # Handed to the background writer thread, the file is written off the button thread
+        #led.value = True    # turn on LED to indicate writing entries
+        #print("%d/%d/%d, " % (self.State.month_out, self.State.day_out, self.State.year_out)) #Prints to serial monitor the data about to be written to the SD card
+        #f.write("%d/%d/%d, " % (self.State.month_out, self.State.day_out, self.State.year_out))    # Common U.S. date format
 
-            print("%d:%02d:%02d, " % (self.State.hour_out, self.State.min_out, self.State.sec_out)) #Prints to the serial monitor the data about to be written to the SD card
-            f.write("%d:%02d:%02d, " % (self.State.hour_out, self.State.min_out, self.State.sec_out))  # "Time in" written to file
-            #led.value = False  # turn off LED to indicate we're done
+        print("%d:%02d:%02d, " % (self.State.hour_out, self.State.min_out, self.State.sec_out)) #Prints to the serial monitor the data about to be written to the SD card
+        stamp_write("%d:%02d:%02d, " % (self.State.hour_out, self.State.min_out, self.State.sec_out))  # "Time in" written to file
+        #led.value = False  # turn off LED to indicate we're done
 
-            # Read out all lines in the .csv file to verify the last entry
-            #with open("/sd/stamp.csv", "r") as f:
-            #print("Printing lines in file:")
-            #line = f.readline()
-            #while line != '':
-            #print(line)
-            #line = f.readline()
+        # Read out all lines in the .csv file to verify the last entry
+        #with open("/sd/stamp.csv", "r") as f:
+        #print("Printing lines in file:")
+        #line = f.readline()
+        #while line != '':
+        #print(line)
+        #line = f.readline()
 
 
 
@@ -503,9 +525,9 @@ class VoiceNote(State):
         voicenote_scrn.value = False    # output low signal to the epaper microcontroller
 
     def pressed(self, machine):
-        if switch_1.is_pressed:                   # Yes button results in a transition to the "Record" state
+        if machine.event.switch == SWITCH_1:                   # Yes button results in a transition to the "Record" state
             machine.go_to_state('Record')
-        if switch_2.is_pressed:                   # No button results in a transition to the "Home" state
+        if machine.event.switch == SWITCH_2:                   # No button results in a transition to the "Home" state
             machine.go_to_state('Home')   # APPEND AN EMPTY ENTRY INTO THE SPREADSHEET HERE, then go gine
     # Experiment clearing the screen before transitioning, perhaps load the next screen here? OR in "exit"
 
@@ -543,36 +565,35 @@ class Record(State):
 
         print('Logging a voice note to .csv filesystem\n')    # Upon exit, log the global variables containing time stamps to the SD Card
 
-        # appending timestamp to file, Use "a" to append file, "w" will overwrite data in the file, "r" will read lines from the file.
-        with open("/home/pi/Desktop/Python_ltb/stamp.csv", "a") as f:
-            #led.value = True    # turn on LED to indicate writing entries
-            f.write("Delta Formula, Speech to text voice note\r\n")
-            #f.write(None, None, None, "sum(d2:d)\r\n",None)    #THERE IS PROBABLY AN ERROR HERE, In Excel you can't really sum items separated by ":"
-            #led.value = False  # turn off LED to indicate we're done
+        # Handed to the background writer thread, the file is written off the button thread
+        #led.value = True    # turn on LED to indicate writing entries
+        stamp_write("Delta Formula, Speech to text voice note\r\n")
+        #f.write(None, None, None, "sum(d2:d)\r\n",None)    #THERE IS PROBABLY AN ERROR HERE, In Excel you can't really sum items separated by ":"
+        #led.value = False  # turn off LED to indicate we're done
 
-            # Read out all lines in the .csv file to verify the last entry
-            #with open("/sd/stamp.csv", "r") as f:
-            #print("Printing lines in file:")
-            #line = f.readline()
-            #while line != '':
-            #print(line)
-            #line = f.readline()
+        # Read out all lines in the .csv file to verify the last entry
+        #with open("/sd/stamp.csv", "r") as f:
+        #print("Printing lines in file:")
+        #line = f.readline()
+        #while line != '':
+        #print(line)
+        #line = f.readline()
 
 
-            #Functionality below is time difference and Sum, which may be handled in the spreadsheet
-            #Need correction for data types of 12 & 24 hours after some date is logging
-            #delta_hour = self.State.hour_out - self.State.hour_in # Calculate hour difference
-            #delta_min = self.State.min_out - self.State.min_in  # Calculate min difference
-            #delta_sec = self.State.sec_out - self.State.sec_in # Calculate sec difference
-            #f.write("%d:%02d:%02d, " % (delta_hour, delta_min, delta_sec))  # Write the change in time to the file
+        #Functionality below is time difference and Sum, which may be handled in the spreadsheet
+        #Need correction for data types of 12 & 24 hours after some date is logging
+        #delta_hour = self.State.hour_out - self.State.hour_in # Calculate hour difference
+        #delta_min = self.State.min_out - self.State.min_in  # Calculate min difference
+        #delta_sec = self.State.sec_out - self.State.sec_in # Calculate sec difference
+        #f.write("%d:%02d:%02d, " % (delta_hour, delta_min, delta_sec))  # Write the change in time to the file
 
 
     def pressed(self, machine):
 
-        if switch_1.is_pressed:
+        if machine.event.switch == SWITCH_1:
             #print('Put Easter Egg photo here?\n')
             machine.go_to_state('Home') # Return "Home"
-        if switch_2.is_pressed:
+        if machine.event.switch == SWITCH_2:
             machine.go_to_state('Home') # Return "Home"
 
 
@@ -589,9 +610,16 @@ LTB_state_machine.add_state(Profile2())
 LTB_state_machine.add_state(VoiceNote())
 LTB_state_machine.add_state(Record())
 
-LTB_state_machine.go_to_state('Home')   #Starts the state machine in the "Home" state
+input_engine = InputEngine(switch_1, switch_2)  # Edge callbacks on both switches feed the input queue
+
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))    # Stopping the service drains the writer as well
 
-while True:
-    switch_1.value               #Checks the switch 1 state each time the loop executes, necessary for button state changes
-    switch_2.value               #Checks the switch 1 state each time the loop executes, necessary for button state changes
-    LTB_state_machine.pressed()     #Transitions to the StateMachine attrubute, "pressed". Doesn't do much there other than report the current state
\ No newline at end of file
+try:
+    LTB_state_machine.go_to_state('Home')   #Starts the state machine in the "Home" state
+    LTB_state_machine.run(input_engine)     #Waits on the input queue and hands every press to the StateMachine attribute, "pressed"
+except KeyboardInterrupt:
+    pass
+finally:
+    log_writer.submit(stamp_journal.close)  # Everything queued is written before the program ends
+    log_writer.close()
+    print('Writer:', log_writer.stats())
@@ -6,39 +6,195 @@
 
 # pylint: disable=global-statement,stop-iteration-return,no-self-use,useless-super-delegation
 
+import os
 import csv
+import sys
+import json
+import signal
+import asyncio
+import argparse
 import serial
-import gpiozero
 
 import time as t    # call the time module with "t"
 
-from datetime import datetime, date, timedelta
-
-import dateutil as du   # call the dateutil module with "du"
-from dateutil import tz
-from dateutil.relativedelta import relativedelta
+from collections import deque
+
+from ltb_input import InputEngine, SWITCH_1, SWITCH_2, PRESSED   # Event driven button handling
+from ltb_scheduler import Scheduler                             # Timer heap for deferred actions
+from ltb_async import AsyncStateMachine                         # Optional asyncio runtime, "--asyncio" on the command line
+from ltb_stats import latency_report                             # Percentile summaries for the latency samples
+from ltb_journal import SessionJournal, FSYNC_IDLE              # Group commit writer for the spreadsheet
+from ltb_writer import BackgroundWriter, OVERFLOW_BLOCK         # File I/O thread, keeps the SD card off the button thread
+from ltb_store import SessionStore, SessionRecord, NOTE_NONE, NOTE_PLACEHOLDER   # Binary session records
+from ltb_checkpoint import SessionCheckpoint, Checkpoint        # Survives a reboot in the middle of a session
+from ltb_index import SessionIndex                              # Optional SQLite index for queries over tracked time
+from ltb_summary import open_summary                            # Running totals for today and this week
+from ltb_store import format_duration, format_offset
+from ltb_clock import Stamp, NS, stamp_now, resume_stamp, elapsed, hms   # Session durations from the monotonic clock
+from ltb_tasks import load_tasks                                # Named tasks, each with its own open session
+from ltb_profiles import load_profiles, LazyState               # Profiles from a file, their states made on first use
+from ltb_focus import FocusEngine, PHASES, PAUSED               # Focus timer countdown on one deadline timer
+from ltb_counter import LiveCounter                             # Tracked time shown, refreshed only when it changes
+from ltb_timezone import TimeZone                               # Local UTC offset, resolved once and cached
+from ltb_hal import Hardware, ScriptedPresses, BACKENDS, parse_script   # Real, mock or simulated pins
+from ltb_display import open_link, FakeM4, FIELD_TIME, FIELD_PHASE, FIELD_TODAY, FIELD_WEEK   # Screen commands over serial
+from ltb_coalesce import ScreenCoalescer                        # Only the screen wanted at the end of a burst is drawn
+from ltb_render import FrameCache, Panel                        # Screens drawn on the Pi, only the changed rectangles sent
+from ltb_metrics import instrument_machine, MetricsSocket       # Per state timing histograms, "--metrics"
+from ltb_transitions import Transition, compile_transitions, state_path     # Transition table, compiled to integer dispatch
+from ltb_trace import TraceRing, trace_event, install_dump_handlers, TR_ENTER, TR_EXIT, TR_PRESSED, TR_DEFERRED   # Binary trace ring
 
 
 ###############################################################################
 
-# Set to false to disable testing/tracing code
+# Set to True to print every trace entry as it is recorded, otherwise the trace is only formatted when dumped
 TESTING = False
 
+# Entries kept in the trace ring (32 bytes each). "kill -USR1 <pid>" dumps it, so does a crash.
+TRACE_SIZE = 4096
+
+# Seconds each state holds its screen after it is entered, presses during the hold are replayed when it ends.
+# Set a state to 0 to make it respond immediately. The states of further profiles hold as long as those of "Profile 1"
+# unless they are listed here.
+HOLD_TIMES = {
+    'Home': 2,
+    'Profile 1': 3,
+    'Tracking1': 3,
+    'Focus Timer 1': 2,
+    'Profile 2': 2,
+    'Voice Note': 3,
+    'Record': 3,
+}
+
+# Refresh steps of the tracked time counter in the "Tracking<n>" states, (from seconds, step seconds): to the second
+# for the first ten minutes, then to the minute. A frame only goes to the screen when its text changes
+COUNTER_STEPS = ((0, 1), (600, 60))
+
+# Seconds per step of the time left shown by the "Focus Timer <n>" states, the program wakes once per step while a
+# focus timer runs. Completed work intervals are logged as sessions of the profile's first task
+FOCUS_TICK = 60
+
+# Spreadsheet of tracked sessions. The journal keeps it open and writes complete rows only,
+# JOURNAL_FSYNC is one of FSYNC_ROW, FSYNC_INTERVAL or FSYNC_IDLE (see ltb_journal.py)
+TRACKING_CSV = "/home/pi/Desktop/LTB_Code_Release/Tracking_1.csv"
+TRACKING_HEADER = ['"Time In, Zone"', ' Timestamp In', '" Time Out, Zone "', 'Timestamp Out', 'Total Time', 'Voice Note']
+JOURNAL_FSYNC = FSYNC_IDLE
+JOURNAL_INTERVAL_MS = 1000
+VOICE_NOTE = "'Speech to text voice note'"
+
+# Every completed session is also kept as a fixed width binary record, the spreadsheet can be
+# regenerated from it with "python3 ltb_store.py export"
+SESSION_STORE = "/home/pi/Desktop/LTB_Code_Release/sessions.ltb"
+
+# Profiles shown after "Home", with their tasks and focus timer settings (see ltb_profiles.py). Without the file
+# there are the two original profiles. With more than two, button 2 on "Home" picks the profile button 1 opens
+PROFILES_FILE = "/home/pi/Desktop/LTB_Code_Release/profiles.json"
+DEFAULT_PROFILES = {'profiles': [
+    {'name': 'Profile 1', 'tasks': [1], 'focus': {'work': 1500, 'break': 300, 'rounds': 4}},
+    {'name': 'Profile 2'},      # Implement at a later date, either button returns to "Home"
+]}
+
+# Tasks that can be tracked, [id, name] pairs (see ltb_tasks.py). Without the file there is only TASK_ID.
+# The "Tracking<n>" states track TASK_ID (the first task of the file if it has no TASK_ID) until a profile picks another one. In a profile with more than one task
+# button 1 switches to its next task ("switch_task") and button 2 stops tracking
+TASKS_FILE = "/home/pi/Desktop/LTB_Code_Release/tasks.json"
+TASK_ID = 1
+
+# Checkpoint of the sessions in progress, one per task being tracked. After a restart an open session is either resumed
+# ('resume', back in "Tracking<n>" with the original start time) or closed at the restart time ('close')
+SESSION_CHECKPOINT = "/home/pi/Desktop/LTB_Code_Release/session.ckpt"
+RECOVER_SESSION = 'resume'
+
+# Optional SQLite (WAL) index of the sessions, set to None to disable. Older spreadsheets can be
+# added with "python3 ltb_index.py import sessions.db Tracking_1.csv"
+SESSION_INDEX = "/home/pi/Desktop/LTB_Code_Release/sessions.db"
+
+# Today's and this week's totals shown on the "Home" screen, rebuilt from the session store if lost
+SUMMARY_FILE = "/home/pi/Desktop/LTB_Code_Release/summary.json"
+
+# The journal runs on the background writer thread. WRITER_OVERFLOW is one of OVERFLOW_BLOCK,
+# OVERFLOW_DROP_OLDEST or OVERFLOW_SPILL (see ltb_writer.py)
+WRITER_QUEUE_SIZE = 64
+WRITER_OVERFLOW = OVERFLOW_BLOCK
+
+# Screens are either selected by one pin each ('pins') or shown with their fields by commands to the M4 over the
+# serial port ('serial', see ltb_display.py). 'pty' talks to a stand in for the M4 on a pty, for running without the board.
+# "--display" on the command line overrides DISPLAY
+DISPLAY = 'pins'
+DISPLAYS = ('pins', 'serial', 'pty')
+DISPLAY_PORT = "/dev/serial0"
+DISPLAY_BAUDRATE = 115200
+
+# With the serial display, True draws the screens on the Pi (see ltb_render.py) and sends the M4 the rectangles that
+# changed, False sends the screen and its fields for the M4 to draw. The static part of every screen is rendered once
+# into SCREEN_CACHE and mapped from there, it is rendered again when the layouts change
+SCREEN_RENDER = True
+SCREEN_CACHE = "/home/pi/Desktop/LTB_Code_Release/screens.cache"
+
+# Seconds screen changes wait for the ones after them, only the screens wanted at the end are drawn (see ltb_coalesce.py).
+# 0 still takes the changes of one transition, and of the presses replayed after a hold, together. A window adds
+# straight to the button to screen time, set one only to also merge quick presses
+SCREEN_WINDOW = 0
+
+# Per state timings, only collected with "--metrics" on the command line (see ltb_metrics.py).
+# They are served on the Unix socket and rewritten to the Prometheus text file every METRICS_INTERVAL seconds,
+# set either path to None to leave it out
+METRICS_SOCKET = "/tmp/ltb-metrics.sock"
+METRICS_TEXTFILE = "/home/pi/Desktop/LTB_Code_Release/ltb.prom"
+METRICS_INTERVAL = 15
+
 ################################################################################
 # Setup hardware
 
-# Input Pins
-switch_1 = gpiozero.Button(5, pull_up=False)
-switch_2 = gpiozero.Button(6, pull_up=False)
-
-# Output Pins
-home_scrn = gpiozero.DigitalOutputDevice(17,active_high=True, initial_value=False)
-profile1_scrn = gpiozero.DigitalOutputDevice(27, active_high=True, initial_value=False)
-track1_scrn = gpiozero.DigitalOutputDevice(22, active_high=True, initial_value=False)
-focus1_scrn = gpiozero.DigitalOutputDevice(23, active_high=True, initial_value=False)
-profile2_scrn = gpiozero.DigitalOutputDevice(25, active_high=True, initial_value=False)
-voicenote_scrn = gpiozero.DigitalOutputDevice(13, active_high=True, initial_value=False)
-record_scrn = gpiozero.DigitalOutputDevice(19, active_high=True, initial_value=False)
+# Button pins by the switch numbers in the button events (see ltb_input.py)
+SWITCH_PINS = {SWITCH_1: 5, SWITCH_2: 6}
+
+def setup_hardware(backend='gpio', record=False, display='pins'):
+    """Creates the pins on the "--hardware" backend (see ltb_hal.py) and the screens on the "--display", the states
+    use them as globals."""
+    global switch_1, switch_2
+    global home_scrn, profile1_scrn, track1_scrn, focus1_scrn, profile2_scrn, voicenote_scrn, record_scrn
+    global screens, display_link, fake_m4, screen_coalescer, panel
+
+    hardware = Hardware(backend, record)
+    screen_coalescer = ScreenCoalescer(SCREEN_WINDOW)     # Writes at once until "create_state_machine" gives it the scheduler
+    display_link = fake_m4 = panel = None
+    screens = {}                    # By name, for the profile states
+    if display == 'serial':
+        display_link = open_link(DISPLAY_PORT, DISPLAY_BAUDRATE)
+    elif display == 'pty':
+        fake_m4 = FakeM4()
+        display_link = open_link(fake_m4.device, DISPLAY_BAUDRATE)
+    if display_link is not None and SCREEN_RENDER:
+        panel = Panel(display_link, FrameCache(SCREEN_CACHE))
+        screen_coalescer.on_flush(panel.commit)         # Draws the screen on top once the outputs are written
+
+    def screen_output(pin, name):   # The select pin, or the same screen shown over the serial link, behind the coalescer
+        if display_link is None:
+            output = hardware.output(pin, name, active_high=True, initial_value=False)
+        elif panel is not None:
+            output = hardware.outputs[name] = panel.output(hardware, name)
+        else:
+            output = hardware.outputs[name] = display_link.output(hardware, name)
+        screens[name] = screen_coalescer.wrap(output)
+        return screens[name]
+
+    # Input Pins
+    switch_1 = hardware.button(SWITCH_PINS[SWITCH_1], pull_up=False)
+    switch_2 = hardware.button(SWITCH_PINS[SWITCH_2], pull_up=False)
+
+    # Output Pins
+    home_scrn = screen_output(17, 'home_scrn')
+    profile1_scrn = screen_output(27, 'profile1_scrn')
+    track1_scrn = screen_output(22, 'track1_scrn')
+    focus1_scrn = screen_output(23, 'focus1_scrn')
+    profile2_scrn = screen_output(25, 'profile2_scrn')
+    voicenote_scrn = screen_output(13, 'voicenote_scrn')
+    record_scrn = screen_output(19, 'record_scrn')
+    return hardware
+
+# Screen pin of each profile that does not name its own, profiles past the second share the last one
+PROFILE_SCREENS = ['profile1_scrn', 'profile2_scrn']
 
 #################################################################################################
 # Setting up the Real Time Clock and set the initial time
@@ -49,9 +205,9 @@ record_scrn = gpiozero.DigitalOutputDevice(19, active_high=True, initial_value=F
 #rtc = adafruit_pcf8523.PCF8523(myI2C)
 
 ################################################################################
-#Python datetime function
-now = datetime.now(tz=tz.tzlocal())    #Use the actual time set in the Pi
-print("Current device time:", now)     # uncomment for debugging
+# Local time zone of the Pi, every stamp and record takes its UTC offset from here
+local_zone = TimeZone()
+print("Current device time:", t.strftime('%Y-%m-%d %H:%M:%S'), local_zone.name(), format_offset(local_zone.offset()))     # uncomment for debugging
 print('\n')
 
 
@@ -64,11 +220,134 @@ print('\n')
 ################################################################################
 # Support functions
 
-# Code tracing feature located in the "pressed" method of the "StateMachine" Class
-def log(s):
-    """Print the argument if testing/tracing is enabled."""
-    if TESTING:
-        print(s)
+# Code tracing. The states record numbers into the trace ring (see ltb_trace.py), the text below is
+# only produced when the ring is dumped, or straight away when TESTING is on.
+trace = TraceRing(TRACE_SIZE, echo=TESTING)
+
+def trace_stamp(epoch, utc_offset):
+    return format_stamp(epoch, utc_offset) + ' ' + format_offset(utc_offset)
+
+TR_TOTALS = trace_event(16, 'totals', lambda state, a, b: 'Tracked today %s, this week %s' % (format_duration(a), format_duration(b)))
+TR_START = trace_event(17, 'start', lambda state, a, b: 'Logging a START time, %s' % trace_stamp(a, b))
+TR_STOP = trace_event(18, 'stop', lambda state, a, b: 'Logging a STOP time, %s' % trace_stamp(a, b))
+TR_TRACKED = trace_event(19, 'tracked', lambda state, a, b: 'The time tracked is %s' % format_duration(a))
+TR_COUNTER = trace_event(20, 'counter', lambda state, a, b: 'Tracked time %s, frame %d' % (format_duration(a), b))
+TR_RESUMED = trace_event(21, 'resumed', lambda state, a, b: 'Resuming the session interrupted by a restart, started %s' % trace_stamp(a, b))
+TR_RECOVERED = trace_event(22, 'recovered', lambda state, a, b: 'Closing the session interrupted by a restart, started %s' % trace_stamp(a, b))
+TR_VOICE_NOTE = trace_event(23, 'voice note', 'Logging a voice note')
+TR_SWITCHED = trace_event(24, 'switch', 'Switched from task {a} to task {b}')
+TR_SELECTED = trace_event(25, 'select', 'Profile {a} selected')
+TR_FOCUS = trace_event(26, 'focus', lambda state, a, b: 'Focus %s %d, %s left%s' % (PHASES[a & 1], a >> 2, format_duration(b), ' (paused)' if a & 2 else ''))
+TR_FOCUS_DONE = trace_event(27, 'focus done', lambda state, a, b: 'Logging a focus interval of task %d, %s' % (a, format_duration(b)))
+
+# The row for the session being tracked is built up here, "Tracking<n>" adds the in and out stamps
+# and the row is handed to the journal once the voice note choice is made
+session_row = []
+session_record = None           # Binary record of the same session, see ltb_store.py
+tasks = None                    # TaskTable, the open session and running total of every task, loaded by "create_state_machine"
+current_task = TASK_ID          # Task tracked by the "Tracking<n>" states
+profiles = None                 # ProfileRegistry, loaded by "create_state_machine"
+selected_profile = 1            # Number of the profile button 1 opens from "Home" when there are more than two
+focus_engine = None             # FocusEngine of the "Focus Timer <n>" state being shown
+live_counter = None             # LiveCounter of the "Tracking<n>" state being shown
+
+def hold_time(state_name, like):
+    """Hold time of state_name, the one of the first profile's state "like" if it is not listed."""
+    return HOLD_TIMES.get(state_name, HOLD_TIMES[like])
+
+def format_stamp(epoch, utc_offset):
+    """Date and time the way the spreadsheet has always shown them."""
+    wall = local_zone.wall_fields(epoch, utc_offset)
+    return '%d-%02d-%02d_%d:%d:%d' % (wall.tm_year, wall.tm_mon, wall.tm_mday, wall.tm_hour, wall.tm_min, wall.tm_sec)
+
+def close_session(stamp_in, stamp_out, task):
+    """Completes the row and record of a session, the voice note is added by "finish_session_row".
+    Returns the tracked time in seconds, taken from the monotonic clock (see ltb_clock.py)."""
+    global session_row, session_record
+    duration = elapsed(stamp_in, stamp_out)
+    offset_in = local_zone.offset(stamp_in.wall)
+    wall_out = stamp_in.wall + duration     # Agrees with the duration and the record's end, whatever the wall clock did meanwhile
+    offset_out = local_zone.offset(wall_out)
+    # The zone columns hold the numeric offset ("UTC-07:00"), reports convert to UTC without looking zones up
+    session_row = [format_offset(offset_in), format_stamp(stamp_in.wall, offset_in),
+                   format_offset(offset_out), format_stamp(wall_out, offset_out),
+                   "%d:%d:%02d" % hms(duration)]
+    # The record ends "duration" after the start, a clock correction during the session does not change it
+    session_record = SessionRecord(stamp_in.wall, stamp_in.wall + duration, offset_in, NOTE_NONE, task)
+    return duration
+
+def finish_session_row(voice_note, note_ref):
+    """Complete the tracked session row and queue it in the journal and the session store."""
+    global session_row, session_record
+    if session_row:
+        log_writer.submit(tracking_journal.append_row, session_row + [voice_note])
+        session_row = []
+    if session_record is not None:
+        time_summary.add(session_record, save=False)            # Totals change here so "Home" shows them straight away
+        log_writer.submit(time_summary.save)
+        log_writer.submit(session_store.append, session_record._replace(note=note_ref))
+        if session_index is not None:
+            log_writer.submit(session_index.add, session_record._replace(note=note_ref))
+        session_record = None
+    log_writer.submit(save_checkpoint, tasks.open_sessions())
+
+def save_checkpoint(open_sessions):
+    """Runs on the writer thread after the finished session, the row and the store record are on the card before the
+    session leaves the checkpoint."""
+    tracking_journal.commit()
+    session_store.sync()
+    session_checkpoint.save_all(open_sessions)
+
+def switch_task(task_id):
+    """Stops the current task and starts task_id at the same instant. The stopped session is written as one complete
+    row without a voice note, the start of the next one only goes into the checkpoint. Outside "Tracking<n>" it only
+    changes the task tracked next."""
+    global current_task
+    if task_id not in tasks:
+        raise KeyError(task_id)
+    if task_id == current_task:
+        return
+    if not tasks.is_open(current_task):
+        current_task = task_id
+        return
+    stamp = stamp_now()
+    stamp_in = tasks.switch(current_task, task_id, stamp, local_zone.offset(stamp.wall))
+    trace.emit(TR_SWITCHED, current_task, task_id)
+    close_session(stamp_in, stamp, current_task)
+    current_task = task_id
+    finish_session_row('', NOTE_NONE)
+    if live_counter is not None:
+        live_counter.start()        # Shows the new task's time at once, not at the old task's next step
+
+def known_tasks(spec):
+    """The tasks of the profile spec that are in the task table, in the profile's order."""
+    return [task for task in spec.tasks if task in tasks]
+
+def recover_session():
+    """Deals with the sessions left open by a reboot or power loss, returns the state to start in."""
+    global current_task
+    checkpoints = session_checkpoint.load_all()
+    closing = []
+    for checkpoint in checkpoints:          # Resumed first, the checkpoints written while closing the rest keep them
+        if checkpoint.end == 0 and RECOVER_SESSION == 'resume' and checkpoint.task in tasks and not tasks.is_open(checkpoint.task):
+            trace.emit(TR_RESUMED, checkpoint.start, checkpoint.utc_offset)
+            tasks.start(checkpoint.task, resume_stamp(checkpoint.start), checkpoint.utc_offset)
+        else:
+            closing.append(checkpoint)
+    for checkpoint in closing:
+        # Stopped before the restart, or closing it now. The voice note choice was never made.
+        stamp_in = resume_stamp(checkpoint.start)
+        stamp_out = resume_stamp(checkpoint.end) if checkpoint.end else stamp_now()
+        trace.emit(TR_RECOVERED, checkpoint.start, checkpoint.utc_offset)
+        close_session(stamp_in, stamp_out, checkpoint.task)
+        finish_session_row('', NOTE_NONE)
+    resumed = [checkpoint.task for checkpoint in tasks.open_sessions()]
+    if not resumed:
+        return 'Home'
+    if current_task not in resumed:
+        current_task = resumed[0]
+    spec = profiles.for_task(current_task) or next((spec for spec in profiles.specs if spec.tasks), None)
+    return spec.tracking if spec is not None else 'Home'
 
 
 ################################################################################
@@ -79,25 +358,101 @@ class StateMachine(object):
     def __init__(self):                             # Needed constructor
         self.state = None
         self.states = {}
+        self.parents = {}                           # State name -> name of the state it sits in, see "add_state"
+        self.paths = {}                             # (from, to) -> (states to exit, states to enter), see "path_to"
+        self.event = None                           # The button event currently being handled, read by the states "pressed" attribute
 
+        self.scheduler = Scheduler()                # Deferred and periodic actions, replaces the sleeps inside "enter"
+        self.state_timers = {}                      # State name -> timers it started, cancelled when that state exits
+        self.timer_owner = None                     # State whose "enter" is running, owns the timers started meanwhile
+        self.holding = False                        # True while a state holds its screen, presses are deferred until it ends
+        self.hold_timer = None
+        self.deferred = deque(maxlen=8)             # Presses that arrived during a screen hold
+        self.latencies = deque(maxlen=1024)         # Nanoseconds spent in each transition, see "latency_report"
 
-    def add_state(self, state):                     # "add state" attribute, adds states to the machine
-        self.states[state.name] = state
 
-    def go_to_state(self, state_name):              # "go to state" attribute, facilittes transition to other states. Prints confirmation when "Testing = True"
-        if self.state:
-            log('Exiting %s\n' % (self.state.name))
-            self.state.exit(self)
+    def add_state(self, state, parent=None):        # "add state" attribute, adds states to the machine. A state added with a parent sits inside it
+        self.states[state.name] = state
+        if parent is not None:
+            self.parents[state.name] = parent
+
+    def path_to(self, state_name):                  # States to exit and enter to get from the current state to "state_name", worked out once per pair
+        key = (self.state.name if self.state else None, state_name)
+        path = self.paths.get(key)
+        if path is None:
+            path = self.paths[key] = state_path(key[0], state_name, self.parents)
+        return path
+
+    def go_to_state(self, state_name, path=None):   # "go to state" attribute, facilittes transition to other states. Traced, printed when "Testing = True"
+        start = t.perf_counter_ns()                 # Only the states below the common parent are exited and entered, "path" is precomputed by the transition table
+        exits, enters = path or self.path_to(state_name)
+        for name in exits:
+            trace.enter(name)
+            trace.emit(TR_EXIT)
+            self.states[name].exit(self)
+            self.cancel_state_timers(name)
+        self.cancel_hold()
         self.state = self.states[state_name]
-        log('Entering %s' % (self.state.name))
-        self.state.enter(self)
-
-    def pressed(self):                              # "button pressed" attribute. Accessed at the end of each loop, applies a pause and prints confirmaiton if setup.
+        for name in enters:
+            trace.enter(name)
+            trace.emit(TR_ENTER)
+            self.timer_owner = name
+            self.states[name].enter(self)
+        self.timer_owner = None
+        trace.enter(state_name)
+        self.latencies.append(t.perf_counter_ns() - start)
+
+    def pressed(self, event):                       # "button pressed" attribute. Called once for every press taken from the input engine queue
         if self.state:
-            log('Updating %s' % (self.state.name))
+            if self.holding:
+                trace.emit(TR_DEFERRED, event.switch)
+                self.deferred.append(event)
+                return
+            self.event = event
             self.state.pressed(self)
             #print("'StateMachine' Class occurrence")  # Use this print statement to understand how the states transition here to update the state in the serial monitor
-            t.sleep(.50)                             # Critial pause needed to prevent the serial monitor from being "flooded" with data and crashing
+
+    def run(self, input_engine):                    # "run" attribute. Blocks on the input queue until a button edge arrives or the next timer is due
+        while True:
+            event = input_engine.get(self.scheduler.next_timeout())
+            if event is not None and event.edge == PRESSED:
+                trace.emit(TR_PRESSED, event.switch, (t.monotonic_ns() - event.timestamp_ns) // 1000)
+                self.pressed(event)
+            self.scheduler.run_due()
+
+    # Deferred actions for the current state
+
+    def call_later(self, delay, callback, *args):   # Runs once after "delay" seconds unless the state exits first
+        timer = self.scheduler.call_later(delay, callback, *args)
+        self.state_timers.setdefault(self.timer_owner or self.state.name, []).append(timer)
+        return timer
+
+    def call_every(self, interval, callback, *args):    # Runs every "interval" seconds until the state exits
+        timer = self.scheduler.call_every(interval, callback, *args)
+        self.state_timers.setdefault(self.timer_owner or self.state.name, []).append(timer)
+        return timer
+
+    def cancel_state_timers(self, state_name):
+        for timer in self.state_timers.pop(state_name, ()):
+            timer.cancel()
+
+    def cancel_hold(self):                          # A hold belongs to the screen shown, any transition ends it
+        if self.hold_timer is not None:
+            self.hold_timer.cancel()
+        self.holding = False
+        self.hold_timer = None
+
+    def hold(self, seconds):                        # Keeps the current screen up for "seconds", presses meanwhile are kept and replayed afterwards
+        if seconds > 0:
+            self.cancel_hold()                      # A parent's hold is replaced by the hold of the state entered inside it
+            self.holding = True
+            self.hold_timer = self.call_later(seconds, self.release_hold)
+
+    def release_hold(self):
+        self.holding = False
+        self.hold_timer = None
+        while self.deferred and not self.holding:   # A replayed press may enter a state that holds again
+            self.pressed(self.deferred.popleft())
 
 
 
@@ -123,8 +478,13 @@ class State(object):
     def exit(self, machine):    # Class Attribute. Does what is commanded when exiting the state
         pass
 
-    def pressed(self, machine): # Class Attribute. Does what is commanded when a button is pressed
-        print("'State' Class occurrence")   #This hasn't been called yet, I used this as a test to investigate the "inheritance" of child classes below.
+    def pressed(self, machine): # Class Attribute. Takes the row of TRANSITIONS for this state and the button pressed, at most one per press
+        row = transitions.lookup(self.state_id, machine.event.switch, machine)
+        if row is not None:
+            for action in row.actions:
+                action(machine)
+            if row.target_name is not None:     # None stays in the state
+                machine.go_to_state(row.target_name, row.path)
 
 
 ########################################
@@ -144,187 +504,139 @@ class Home(State):
 
         #Screen Placeholders
         home_scrn.value = True    # output high signal to the epaper microcontroller
-        print('#### Home State ####')
-        print('Placeholder to display date and time\n')
-        t.sleep(2)
+        # Placeholder to display date and time
+        # Placeholder: tracked today and this week
+        today, week = time_summary.today_total(), time_summary.week_total()
+        home_scrn.update({FIELD_TODAY: format_duration(today), FIELD_WEEK: format_duration(week)})
+        trace.emit(TR_TOTALS, today, week)
+        machine.hold(HOLD_TIMES[self.name])
 
     def exit(self, machine):
 
         State.exit(self, machine)
         home_scrn.value = False    # output low signal to the epaper microcontroller
 
-    def pressed(self, machine):
-
-        if switch_1.is_pressed:                                         #
-            machine.go_to_state('Profile 1')
-        if switch_2.is_pressed:
-            machine.go_to_state('Profile 2')
-
 
 ########################################
-# The "Profile 1" state. Either choose to track a task or use a focus timer.
-class Profile1(State):
+# A profile state ("Profile 1", ...), one for each entry of the profile file. Either choose to track a task or use a focus timer.
+# Its "Tracking<n>" and "Focus Timer <n>" states sit inside it: its screen pin stays high while they are shown, so moving
+# into them only raises their own pin and the profile's date and time are not drawn again.
+class Profile(State):
 
-    def __init__(self):
+    def __init__(self, spec):
         super().__init__()
         self.State = State()
+        self.spec = spec            # ProfileSpec, see ltb_profiles.py
+        self.screen = screens[spec.screen or PROFILE_SCREENS[min(spec.number, len(PROFILE_SCREENS)) - 1]]
 
 
     @property
     def name(self):
-        return 'Profile 1'
+        return self.spec.name
 
     def enter(self, machine):
 
         State.enter(self, machine)
 
         #Screen Placeholders
-        profile1_scrn.value = True    # output high signal to the epaper microcontroller
-        print('#### Profile 1 State ####')
-        print('Placeholder to display date and time\n')
-        t.sleep(3)
+        self.screen.value = True    # output high signal to the epaper microcontroller
+        # Placeholder to display the profile, date and time
+        machine.hold(hold_time(self.name, 'Profile 1'))
 
     def exit(self, machine):
 
         State.exit(self, machine)
-        profile1_scrn.value = False    # output low signal to the epaper microcontroller
-
-    def pressed(self, machine):
-
-        if switch_1.is_pressed:
-            machine.go_to_state('Tracking1')
-        if switch_2.is_pressed:
-            machine.go_to_state('Focus Timer 1')
+        self.screen.value = False    # output low signal to the epaper microcontroller
 
 
 ########################################
-# The "Tracking 1" state. Begin tracking task 1 in this state
-class Tracking1(State):
-
-    #Declare global variables for Tracking1 State
-    global time_zone_in, time_zone_out
-    global timestamp_in, timestamp_out
-
-    # Intitalize the global variables within "Tracking1"
-    time_zone_in = None
-    timestamp_in = None
-
-    time_zone_out = 0
-    timestamp_out = 0
-
+# The "Tracking<n>" state of a profile. Begin tracking the current task in this state, the profile's first task
+# if the current one is not in its list. The open session lives in the task table, see ltb_tasks.py
+class Tracking(State):
 
-
-    def __init__(self):
+    def __init__(self, spec):
         super().__init__()
         self.State = State()
+        self.spec = spec
 
 
     @property
     def name(self):
-        return 'Tracking1'
+        return self.spec.tracking
 
     def enter(self, machine):
-        global time_zone_in, time_zone_out
-        global timestamp_in, timestamp_out
 
-        today = date.today()
-        timestamp_in = datetime.now(tz=tz.tzlocal())
+        if current_task not in self.spec.tasks:
+            known = known_tasks(self.spec)
+            if known:
+                switch_task(known[0])
+        if not tasks.is_open(current_task):     # Already open when resumed from the checkpoint at start up
+            stamp = stamp_now()
+            tasks.start(current_task, stamp, local_zone.offset(stamp.wall))
+        stamp_in = tasks.started(current_task)
+        offset_in = tasks.offset(current_task)
 
 
         State.enter(self, machine)
 
-        # Components of the "time in" stamp
-        time_zone_in = timestamp_in.tzname()    # Stores the timezone from datetime
-
         #Screen Placeholders
         track1_scrn.value = True    # output high signal to the epaper microcontroller
-        print('#### Tracking Task 1 State ####')
-        print('Placeholder: Display date and time')
-        print('Placeholder: Display counter for tracked time\n')
-
-        print('Logging a START time to .csv file')
-         # appending timestamp to file, Use "a" to append file, "w" will overwrite data in the file, "r" will read lines from the file.
-        with open("/home/pi/Desktop/LTB_Code_Release/Tracking_1.csv", "a") as f:
-
-            #led.value = True    # turn on LED to indicate writing entries
-            print("Time zone 'in':",time_zone_in) #Prints data about to be written to the SD card
-            print(str(today) + '_' + str(timestamp_in.hour) + ':' + str(timestamp_in.minute) + ":" + str(timestamp_in.second) + ",")
-            f.write("%s," % (time_zone_in))    #
-            f.write(str(today) + '_' + str(timestamp_in.hour) + ':' + str(timestamp_in.minute) + ":" + str(timestamp_in.second) + ",")
-            #led.value = False  # turn off LED to indicate we're done
-
-            # Read out all lines in the .csv file to verify the last entry
-            #with open("/sd/stamp.csv", "r") as f:
-            #print("Printing lines in file:")
-            #line = f.readline()
-            #while line != '':
-            #print(line)
-            #line = f.readline()
-            t.sleep(3)
+        # Placeholder: Display counter for tracked time, date and time are shown by the profile
 
+        # The start of the row is kept in memory, the journal writes the whole row once the session is complete
+        trace.emit(TR_START, stamp_in.wall, offset_in)
 
-    def exit(self, machine):
+        # Checkpoint of the open sessions, written on the writer thread so the transition does not wait for it
+        log_writer.submit(session_checkpoint.save_all, tasks.open_sessions())
 
-        global time_zone_in, time_zone_out
-        global timestamp_in, timestamp_out
+        machine.hold(hold_time(self.name, 'Tracking1'))
+        # Counter keeps running while the screen is held, it follows "switch_task" to the task tracked next. Its one timer is
+        # on the scheduler itself, as for the focus engine, and "exit" stops it
+        global live_counter
+        live_counter = LiveCounter(lambda: tasks.started(current_task).mono_ns, machine.scheduler.call_later, self.show_counter,
+                                   COUNTER_STEPS)
+        live_counter.start()
 
-        today = date.today()
-        timestamp_out = datetime.now(tz=tz.tzlocal())
+    def show_counter(self, text, seconds):      # Called only when text differs from the last frame
+        track1_scrn.update({FIELD_TIME: text})
+        trace.emit(TR_COUNTER, seconds, live_counter.pushed)
 
-        # Track the previous variables
-        print('Time Zone of "out" timestamp:',time_zone_out)
-        print('"out" timestamp:', timestamp_out)
+    def exit(self, machine):
 
+        stamp_out = stamp_now()
+        global live_counter
+        live_counter.stop()
+        live_counter = None
 
         State.exit(self, machine)
 
-        # Components of the "time out" stamp
-        time_zone_out = timestamp_out.tzname()    # Stores the timezone from datetime
-        delta_time = relativedelta(timestamp_out,timestamp_in)
-
-        print('Logging a STOP time to .csv\n')
-        # appending timestamp to file, Use "a" to append file, "w" will overwrite data in the file, "r" will read lines from the file.
-        with open("/home/pi/Desktop/LTB_Code_Release/Tracking_1.csv", "a") as f:
-            #led.value = True    # turn on LED to indicate writing entries
-            print("Time zone 'out':",time_zone_out) #Prints data about to be written to the SD card
-            print(str(today) + '_' + str(timestamp_out.hour) + ':' + str(timestamp_out.minute) + ":" + str(timestamp_out.second) + ",")
-            print("The time tracked is:", str(delta_time.hours) + ":" + str(delta_time.minutes) + ":" + str(delta_time.seconds))
-            print('\n') # Prints a blank line
-            f.write("%s," % (time_zone_out))
-            f.write(str(today) + '_' + str(timestamp_out.hour) + ':' + str(timestamp_out.minute) + ":" + str(timestamp_out.second) + ",")
-            f.write("%d:%d:%02d," % (delta_time.hours,delta_time.minutes,delta_time.seconds))
-            #led.value = False  # turn off LED to indicate we're done
-
-            # Read out all lines in the .csv file to verify the last entry
-            #with open("/sd/stamp.csv", "r") as f:
-            #print("Printing lines in file:")
-            #line = f.readline()
-            #while line != '':
-            #print(line)
-            #line = f.readline()
-
-        track1_scrn.value = False    # output low signal to the epaper microcontroller
+        stamp_in = tasks.stop(current_task, stamp_out)
+        duration = close_session(stamp_in, stamp_out, current_task)
+        trace.emit(TR_STOP, stamp_out.wall, local_zone.offset(stamp_out.wall))
+        trace.emit(TR_TRACKED, duration)
 
-    def pressed(self, machine):
+        # The session is stopped, the checkpoint keeps the stop time until the row is written
+        stopped = Checkpoint(session_record.start, session_record.end, session_record.utc_offset, current_task)
+        log_writer.submit(session_checkpoint.save_all, tasks.open_sessions() + [stopped])
 
-        if switch_1.is_pressed:
-            machine.go_to_state('Voice Note')
-        if switch_2.is_pressed:
-            machine.go_to_state('Voice Note')
+        track1_scrn.value = False    # output low signal to the epaper microcontroller
 
 
 ########################################
-# The "Focus Timer 1" state. Begin the focus timer here
-class FocusTimer1(State):
+# The "Focus Timer <n>" state of a profile. Counts down work and break phases with the profile's settings, button 1
+# pauses and resumes, button 2 returns "Home". Each completed work phase is logged like a tracked session
+class FocusTimer(State):
 
-    def __init__(self):
+    def __init__(self, spec):
         super().__init__()
         self.State = State()
+        self.spec = spec
+        self.settings = spec.focus  # FocusSettings, work and break in seconds and the number of rounds
 
 
     @property
     def name(self):
-        return 'Focus Timer 1'
+        return self.spec.focus_timer
 
 
     def enter(self, machine):
@@ -333,61 +645,39 @@ class FocusTimer1(State):
 
         #Screen Placeholders
         focus1_scrn.value = True    # output high signal to the epaper microcontroller
-        print('#### Focus Timer 1 State ####')
-        print('Plateholder: Display Focus Timer counting down')
-        print('Placeholder: Display date and time\n')
-        t.sleep(2)
+        # Placeholder: Display Focus Timer counting down, date and time are shown by the profile
+        global focus_engine
+        # On the scheduler itself, not "machine.call_later": the engine keeps its one timer and "exit" stops it, while the
+        # state's timer list would keep every one shot fired over the session
+        focus_engine = FocusEngine(self.settings, machine.scheduler.call_later, t.monotonic, FOCUS_TICK,
+                                   on_tick=self.show, on_work_done=self.log_interval)
+        focus_engine.start()        # Wakes at the next step of the display or the end of the phase, never polls
+        machine.hold(hold_time(self.name, 'Focus Timer 1'))
+
+    def show(self, engine):         # Time left, phase and round
+        focus1_scrn.update({FIELD_TIME: format_duration(engine.shown()),
+                            FIELD_PHASE: '%s %d%s' % (PHASES[engine.phase], engine.round, ' paused' if engine.status == PAUSED else '')})
+        trace.emit(TR_FOCUS, engine.phase | (engine.status == PAUSED) << 1 | engine.round << 2, engine.shown())
+
+    def log_interval(self, engine, seconds):
+        """A completed work phase, written as a session of the profile's task that ended now."""
+        known = known_tasks(self.spec)
+        task = known[0] if known else current_task
+        stamp_out = stamp_now()
+        stamp_in = Stamp(stamp_out.wall - seconds, stamp_out.mono_ns - seconds * NS)
+        close_session(stamp_in, stamp_out, task)
+        trace.emit(TR_FOCUS_DONE, task, seconds)
+        finish_session_row('', NOTE_NONE)
 
 
     def exit(self, machine):
 
         State.exit(self, machine)
+        global focus_engine
+        focus_engine.stop()
+        focus_engine = None
         focus1_scrn.value = False    # output low signal to the epaper microcontroller
 
-    def pressed(self, machine):
-
-        if switch_1.is_pressed:                   # Either button press results in a transition to the "Home" state
-            machine.go_to_state('Home')
-        if switch_2.is_pressed:                   # Question: Perhaps a transition to "Profile1" is more appropriate?
-            machine.go_to_state('Home')
-
-
-########################################
-# The "Profile 2" state. Implement at a later date. Any button press in this state causes a transition to the "Home" state.
-class Profile2(State):
-
-    def __init__(self):
-        super().__init__()
-        self.State = State()
-
-
-    @property
-    def name(self):
-        return 'Profile 2'
-
-    def enter(self, machine):
-
-        State.enter(self, machine)
-
-        #Screen Placeholders
-        profile2_scrn.value = True    # output high signal to the epaper microcontroller
-        print('#### Profile 2 State ####')
-        print('Placeholder to display Profile 2 Screen, date and time\n')
-        t.sleep(2)
-
-    def exit(self, machine):
-
-        State.exit(self, machine)
-        profile2_scrn.value = False    # output low signal to the epaper microcontroller
-
-
-    def pressed(self, machine):
-
-        if switch_1.is_pressed:
-            machine.go_to_state('Home')     # Either button press returns to "Home" state, further profiles will be implemented in the future
-        if switch_2.is_pressed:
-            machine.go_to_state('Home')
-
 
 ########################################
 # The "Voice Note" state. A placeholder state that has an option to record a voice note or return to the "home" state
@@ -407,9 +697,8 @@ class VoiceNote(State):
 
         #Screen Placeholders
         voicenote_scrn.value = True    # output high signal to the epaper microcontroller
-        print('#### Voice Note State ####')
-        print('Placeholder: "Yes or No" to record a note\n')
-        t.sleep(3)
+        # Placeholder: "Yes or No" to record a note
+        machine.hold(HOLD_TIMES[self.name])
 
 
     def exit(self, machine):
@@ -418,13 +707,6 @@ class VoiceNote(State):
 
         voicenote_scrn.value = False    # output low signal to the epaper microcontroller
 
-    def pressed(self, machine):
-
-        if switch_1.is_pressed:                   # Yes button results in a transition to the "Record" state
-            machine.go_to_state('Record')
-        if switch_2.is_pressed:                   # No button results in a transition to the "Home" state
-            machine.go_to_state('Home')   # APPEND AN EMPTY ENTRY INTO THE SPREADSHEET HERE, then go gine
-
 
 ########################################
 # The "Record Note" state. A placeholder state that will record a note then transition to the "home" state
@@ -445,48 +727,236 @@ class Record(State):
 
         #Screen Placeholders
         record_scrn.value = True    # output high signal to the epaper microcontroller #Easter egg
-        print('#### Record Note State ####')
-        print('"Placeholder: Second Semester Functionality"\n')
-        t.sleep(3)
+        # Placeholder: Second Semester Functionality
+        machine.hold(HOLD_TIMES[self.name])
 
     def exit(self, machine):
 
         State.exit(self, machine)
 
-        print('Logging a voice note to .csv\n')    #
-        # appending timestamp to file, Use "a" to append file, "w" will overwrite data in the file, "r" will read lines from the file.
-        with open("/home/pi/Desktop/LTB_Code_Release/Tracking_1.csv", "a") as f:
-            #led.value = True    # turn on LED to indicate writing entries
-            f.write("'Speech to text voice note'\r\n")
-            #led.value = False  # turn off LED to indicate we're done
+        trace.emit(TR_VOICE_NOTE)
+        finish_session_row(VOICE_NOTE, NOTE_PLACEHOLDER)
 
         record_scrn.value = False    # output low signal to the epaper microcontroller
 
-    def pressed(self, machine):
 
-        if switch_1.is_pressed:
-            #print('Put Easter Egg photo here?\n')
-            machine.go_to_state('Home') # Return "Home"
-        if switch_2.is_pressed:
-            machine.go_to_state('Home') # Return "Home"
+################################################################################
+# Transitions. One row per (state, button, guard) -> (target, actions), compiled by
+# "create_state_machine" into integer indexed slots, see ltb_transitions.py. A guard is None or a
+# function of the machine, actions are functions of the machine run before the transition.
+
+def no_voice_note(machine):
+    finish_session_row('', NOTE_NONE)     # Closes the row with an empty voice note entry
+
+def select_next_profile(machine):
+    global selected_profile
+    selected_profile = selected_profile % len(profiles) + 1
+    trace.emit(TR_SELECTED, selected_profile)
+
+def toggle_focus(machine):
+    focus_engine.toggle()           # Pauses or resumes the focus timer shown
+
+def is_selected(number):
+    return lambda machine: selected_profile == number
+
+def has_other_task(spec):
+    return lambda machine: len(known_tasks(spec)) > 1
+
+def next_task(spec):
+    """Action switching to the task after the current one in the profile spec, back to its first after the last."""
+    def switch_to_next(machine):
+        known = known_tasks(spec)
+        following = known.index(current_task) + 1 if current_task in known else 0
+        switch_task(known[following % len(known)])
+    return switch_to_next
+
+def profile_transitions(profiles):
+    """Rows for the states of every profile in the registry, added to TRANSITIONS."""
+    specs = profiles.specs
+    if len(specs) <= 2:         # One button for each, as with the original two profiles
+        rows = [Transition('Home', switch, None, spec.name, ()) for switch, spec in zip((SWITCH_1, SWITCH_2), specs)]
+    else:                       # Button 1 opens the selected profile, button 2 selects the next one
+        rows = [Transition('Home', SWITCH_1, is_selected(spec.number), spec.name, ()) for spec in specs]
+        rows.append(Transition('Home', SWITCH_2, None, 'Home', (select_next_profile,)))
+    for spec in specs:
+        rows.append(Transition(spec.name, SWITCH_1, None, spec.tracking if spec.tasks else 'Home', ()))
+        rows.append(Transition(spec.name, SWITCH_2, None, spec.focus_timer if spec.focus else 'Home', ()))
+        if spec.tasks:
+            rows.append(Transition(spec.tracking, SWITCH_1, has_other_task(spec), None, (next_task(spec),)))    # Stays, next task
+            for switch in (SWITCH_1, SWITCH_2):
+                rows.append(Transition(spec.tracking, switch, None, 'Voice Note', ()))      # Stops tracking, button 1 with one task
+        if spec.focus:
+            rows.append(Transition(spec.focus_timer, SWITCH_1, None, None, (toggle_focus,)))    # Stays, pause or resume
+            rows.append(Transition(spec.focus_timer, SWITCH_2, None, 'Home', ()))         # Question: Perhaps a transition to the profile is more appropriate?
+    return rows
+
+TRANSITIONS = [
+    Transition('Voice Note',    SWITCH_1, None, 'Record',        ()),     # Yes
+    Transition('Voice Note',    SWITCH_2, None, 'Home',          (no_voice_note,)),     # No
+    Transition('Record',        SWITCH_1, None, 'Home',          ()),     # Put Easter Egg photo here?
+    Transition('Record',        SWITCH_2, None, 'Home',          ()),
+]
+INITIAL_STATE = 'Home'
+transitions = None                # The compiled TRANSITIONS and profile rows, set by "create_state_machine"
+
 
+################################################################################
+# Command line. Without options the script runs on the Pi as before. "--hardware sim --script 1,1,1,2"
+# runs the whole flow headless on any Linux machine and "--record" saves the screen pin changes.
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Little Time Buddy')
+    parser.add_argument('--asyncio', action='store_true', help='run the states on an asyncio event loop')
+    parser.add_argument('--hardware', choices=BACKENDS, default='gpio', help='real pins, gpiozero mock pins or the simulator')
+    parser.add_argument('--script', type=parse_script, help='button presses to play, "1,1,1,2", "1@4" waits 4 s before the press')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between scripted presses')
+    parser.add_argument('--no-hold', action='store_true', help='states respond at once instead of holding their screen')
+    parser.add_argument('--data-dir', help='directory for the task and profile files, spreadsheet, store, checkpoint, index and summary')
+    parser.add_argument('--record', metavar='FILE', help='save the output pin changes and press times as JSON')
+    parser.add_argument('--metrics', action='store_true', help='time every state and serve the histograms')
+    parser.add_argument('--display', choices=DISPLAYS, default=DISPLAY, help='screen select pins, the M4 over serial, or a fake M4 on a pty')
+    return parser.parse_args(argv)
+
+
+def save_recording(path, hardware, script):
+    origin = script.pressed_ns[0] if script is not None and script.pressed_ns else 0
+    recording = {
+        'backend': hardware.backend,
+        'presses_ms': [(ns - origin) / 1e6 for ns in (script.pressed_ns if script is not None else [])],
+        'changes': [{'ms': (change.timestamp_ns - origin) / 1e6, 'name': change.name, 'pin': change.pin, 'value': change.value}
+                    for change in hardware.changes],
+    }
+    with open(path, 'w') as f:
+        json.dump(recording, f, indent=1)
 
 
 ################################################################################
 # Create the state machine
 
-LTB_state_machine = StateMachine()          # Defines the state machine
-LTB_state_machine.add_state(Home())         # Adds the listed states to the machine (Except for the class, "State"
-LTB_state_machine.add_state(Profile1())
-LTB_state_machine.add_state(Tracking1())
-LTB_state_machine.add_state(FocusTimer1())
-LTB_state_machine.add_state(Profile2())
-LTB_state_machine.add_state(VoiceNote())
-LTB_state_machine.add_state(Record())
-
-LTB_state_machine.go_to_state('Home')   #Starts the state machine in the "Home" state
-
-while True:
-    switch_1.value               #Checks the switch 1 state each time the loop executes, necessary for button state changes
-    switch_2.value               #Checks the switch 1 state each time the loop executes, necessary for button state changes
-    LTB_state_machine.pressed()     #Transitions to the StateMachine attrubute, "pressed". Doesn't do much there other than report the current state
+def create_state_machine(async_runtime=False):
+    if async_runtime:
+        machine = AsyncStateMachine()     # Synchronous states are wrapped by "SyncStateAdapter"
+    else:
+        machine = StateMachine()          # Defines the state machine
+    global transitions, profiles
+    open_tasks()                      # Before the profiles, which are checked against it
+    profiles = load_profiles(PROFILES_FILE, DEFAULT_PROFILES)
+    fixed = [Home(), VoiceNote(), Record()]
+    profiles.check([state.name for state in fixed], screens, tasks)     # Before any profile state is made
+    machine.add_state(fixed[0])       # Adds the listed states to the machine (Except for the class, "State"
+    for spec in profiles.specs:       # The profile states are only made when first entered, see ltb_profiles.py
+        machine.add_state(LazyState(spec.name, lambda spec=spec: Profile(spec)))
+        if spec.tasks:
+            machine.add_state(LazyState(spec.tracking, lambda spec=spec: Tracking(spec)), parent=spec.name)     # Inside the profile, see the class
+        if spec.focus:
+            machine.add_state(LazyState(spec.focus_timer, lambda spec=spec: FocusTimer(spec)), parent=spec.name)
+    machine.add_state(fixed[1])
+    machine.add_state(fixed[2])
+    transitions = compile_transitions(TRANSITIONS + profile_transitions(profiles), machine.states, (SWITCH_1, SWITCH_2),
+                                      INITIAL_STATE, machine.parents)
+    trace.name_states(machine.states)
+    screen_coalescer.attach(machine.scheduler.call_later)
+    if async_runtime:
+        machine.trace = trace           # StateMachine uses the module's trace directly
+    return machine
+
+def use_data_dir(directory):
+    """Keeps the file names but puts them in directory instead of the Pi's desktop."""
+    global TRACKING_CSV, SESSION_STORE, SESSION_CHECKPOINT, SESSION_INDEX, SUMMARY_FILE, METRICS_TEXTFILE, TASKS_FILE, PROFILES_FILE
+    global SCREEN_CACHE
+    TRACKING_CSV, SESSION_STORE, SESSION_CHECKPOINT, SUMMARY_FILE, TASKS_FILE, PROFILES_FILE, SCREEN_CACHE = (
+        os.path.join(directory, os.path.basename(path))
+        for path in (TRACKING_CSV, SESSION_STORE, SESSION_CHECKPOINT, SUMMARY_FILE, TASKS_FILE, PROFILES_FILE, SCREEN_CACHE))
+    if SESSION_INDEX:
+        SESSION_INDEX = os.path.join(directory, os.path.basename(SESSION_INDEX))
+    if METRICS_TEXTFILE:
+        METRICS_TEXTFILE = os.path.join(directory, os.path.basename(METRICS_TEXTFILE))
+
+def open_tasks():
+    """Loads the task table. TASK_ID is tracked first if the table has it, the table's first task otherwise."""
+    global tasks, current_task
+    tasks = load_tasks(TASKS_FILE, [(TASK_ID, 'Task %d' % TASK_ID)])
+    if current_task not in tasks and len(tasks):
+        current_task = tasks.ids[0]
+
+def open_logs():
+    """Starts the writer thread and opens the files the states log to, they are used as globals."""
+    global log_writer, tracking_journal, session_store, session_checkpoint, session_index, time_summary
+    log_writer = BackgroundWriter(WRITER_QUEUE_SIZE, WRITER_OVERFLOW)
+    tracking_journal = SessionJournal(TRACKING_CSV, JOURNAL_FSYNC, JOURNAL_INTERVAL_MS, header=TRACKING_HEADER, scheduler=log_writer.scheduler)
+    log_writer.on_idle(tracking_journal.idle)      # Journal commits whenever the writer runs out of work
+    time_summary = open_summary(SUMMARY_FILE, SESSION_STORE, TRACKING_CSV)     # Before the store is created, see the function
+    session_store = SessionStore(SESSION_STORE)
+    session_checkpoint = SessionCheckpoint(SESSION_CHECKPOINT)
+    session_index = SessionIndex(SESSION_INDEX) if SESSION_INDEX else None
+
+def close_logs():
+    """Drains the writer, everything queued before this is on disk when it returns."""
+    log_writer.submit(tracking_journal.close)   # Commits anything still waiting
+    log_writer.submit(session_store.close)
+    if session_index is not None:
+        log_writer.submit(session_index.close)
+    log_writer.close()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    ASYNC_RUNTIME = args.asyncio                # Run the same states on an asyncio event loop
+    if args.no_hold:
+        HOLD_TIMES = dict.fromkeys(HOLD_TIMES, 0)
+    if args.data_dir:
+        use_data_dir(args.data_dir)
+
+    hardware = setup_hardware(args.hardware, record=bool(args.record), display=args.display)
+
+    LTB_state_machine = create_state_machine(ASYNC_RUNTIME)
+
+    input_engine = InputEngine(switch_1, switch_2)  # Edge callbacks on both switches feed the input queue
+
+    open_logs()
+
+    metrics = metrics_socket = None
+    if args.metrics:
+        metrics = instrument_machine(LTB_state_machine, log_writer)
+        if METRICS_SOCKET:
+            metrics_socket = MetricsSocket(METRICS_SOCKET, metrics)
+        if METRICS_TEXTFILE:                    # The writer's scheduler is only used from the writer thread
+            log_writer.submit(log_writer.scheduler.call_every, METRICS_INTERVAL, metrics.write_textfile, METRICS_TEXTFILE)
+
+    initial_state = recover_session()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))    # Stopping the service drains the writer as well
+    install_dump_handlers(trace)                                        # "kill -USR1" or a crash prints the trace
+
+    script = None
+    if args.script:                             # Headless run, stops like Ctrl-C once the presses are played
+        script = ScriptedPresses(hardware, args.script, SWITCH_PINS, args.interval,
+                                 done=lambda: os.kill(os.getpid(), signal.SIGINT))  # A real signal also wakes the asyncio loop
+        script.start()
+
+    try:
+        if ASYNC_RUNTIME:
+            asyncio.run(LTB_state_machine.run(input_engine, initial_state))
+        else:
+            LTB_state_machine.go_to_state(initial_state)   #Starts the state machine in the "Home" state, or "Tracking<n>" to resume a session
+            LTB_state_machine.run(input_engine)     #Waits on the input queue and hands every press to the StateMachine attribute, "pressed"
+    except KeyboardInterrupt:
+        print('\nTransition latency:', latency_report(LTB_state_machine.latencies))
+    finally:
+        if metrics is not None and METRICS_TEXTFILE:
+            log_writer.submit(metrics.write_textfile, METRICS_TEXTFILE)
+        if metrics_socket is not None:
+            metrics_socket.close()
+        close_logs()
+        print('Writer:', log_writer.stats())
+        print('Screens:', screen_coalescer.stats())
+        if display_link is not None:
+            display_link.close()
+            print('Display:', display_link.stats())
+        if panel is not None:
+            print('Panel:', panel.stats())
+        if fake_m4 is not None:
+            fake_m4.close()
+        if args.record:
+            save_recording(args.record, hardware, script)
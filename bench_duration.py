@@ -0,0 +1,85 @@
+# Little Time Buddy duration benchmark
+# Per session cost of the old dateutil path in "Tracking1" (tzlocal stamps and relativedelta)
+# against the monotonic stamps of ltb_clock.py, and what each reports for a session over a day.
+#
+#   python3 bench_duration.py --sessions 20000
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from dateutil import tz
+from dateutil.relativedelta import relativedelta
+
+from ltb_clock import NS, Stamp, stamp_now, elapsed, durations, hms
+
+
+################################################################################
+# One session each way, stamp in, stamp out, duration field
+
+def dateutil_session():
+    timestamp_in = datetime.now(tz=tz.tzlocal())
+    timestamp_out = datetime.now(tz=tz.tzlocal())
+    delta_time = relativedelta(timestamp_out, timestamp_in)
+    return "%d:%d:%02d" % (delta_time.hours, delta_time.minutes, delta_time.seconds)
+
+
+def monotonic_session():
+    stamp_in = stamp_now()
+    stamp_out = stamp_now()
+    return "%d:%d:%02d" % hms(elapsed(stamp_in, stamp_out))
+
+
+def timed(func, count):
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        func()
+    return (time.perf_counter_ns() - start) / count / 1000
+
+
+################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description='dateutil vs monotonic session durations')
+    parser.add_argument('--sessions', type=int, default=20000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    starts = list(range(0, args.sessions * NS, NS))
+    ends = [start + 5400 * NS for start in starts]
+    batch_start = time.perf_counter_ns()
+    durations(starts, ends)
+    batch_us = (time.perf_counter_ns() - batch_start) / args.sessions / 1000
+
+    # A session of 1 day 2:03:04
+    timestamp_in = datetime(2022, 5, 1, 9, 0, 0, tzinfo=tz.tzlocal())
+    long_delta = relativedelta(timestamp_in + timedelta(days=1, hours=2, minutes=3, seconds=4), timestamp_in)
+    long_seconds = elapsed(Stamp(0, 0), Stamp(0, (86400 + 7384) * NS))
+
+    results = {
+        'sessions': args.sessions,
+        'dateutil_us': timed(dateutil_session, args.sessions),
+        'monotonic_us': timed(monotonic_session, args.sessions),
+        'monotonic_batch_us': batch_us,
+        'day_long_session': {
+            'dateutil': "%d:%d:%02d" % (long_delta.hours, long_delta.minutes, long_delta.seconds),
+            'monotonic': "%d:%d:%02d" % hms(long_seconds),
+        },
+    }
+    results['speedup'] = results['dateutil_us'] / results['monotonic_us']
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('%d sessions, per session cost\n' % args.sessions)
+    print('dateutil (tzlocal + relativedelta)  %8.2f us' % results['dateutil_us'])
+    print('monotonic stamps                    %8.2f us  (%.0fx)' % (results['monotonic_us'], results['speedup']))
+    print('monotonic, durations() in bulk      %8.3f us' % results['monotonic_batch_us'])
+    print('\n1 day 2:03:04 session: dateutil %s, monotonic %s' % (results['day_long_session']['dateutil'],
+                                                               results['day_long_session']['monotonic']))
+
+
+if __name__ == '__main__':
+    main()
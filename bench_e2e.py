@@ -0,0 +1,160 @@
+# Little Time Buddy end to end benchmark
+# Drives LTB_Release_Rev0.py through the simulated pins (ltb_hal.py) and measures, with
+# percentiles, the time from a switch edge to the matching screen pin going high. It also reports
+# transitions per second, screen pin changes per press, spreadsheet rows per second,
+# "go_to_state" latency and the writer queue. Each journal fsync policy is a phase, so the cost of flushing the log shows in the p99.
+# The screen coalescer (ltb_coalesce.py) runs with a window of 0 unless "--screen-window" says otherwise, a window adds
+# straight to the edge to screen time.
+#
+#   python3 bench_e2e.py --cycles 200 --json > e2e.json
+#   python3 bench_e2e.py --asyncio
+#   python3 bench_e2e.py --metrics        (the same with ltb_metrics.py timing every state)
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from ltb_input import InputEngine, SWITCH_1, SWITCH_2
+from ltb_journal import FSYNC_IDLE, FSYNC_INTERVAL, FSYNC_ROW
+from ltb_metrics import instrument_machine
+from ltb_stats import latency_report
+
+with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):   # The device time printed on import
+    import LTB_Release_Rev0 as ltb
+
+
+PHASES = (FSYNC_IDLE, FSYNC_INTERVAL, FSYNC_ROW)
+
+# One tracked session per cycle, alternately closed with "No" and through "Record"
+CYCLES = (
+    ((SWITCH_1, 'profile1_scrn'), (SWITCH_1, 'track1_scrn'), (SWITCH_1, 'voicenote_scrn'), (SWITCH_2, 'home_scrn')),
+    ((SWITCH_1, 'profile1_scrn'), (SWITCH_1, 'track1_scrn'), (SWITCH_1, 'voicenote_scrn'), (SWITCH_1, 'record_scrn'),
+     (SWITCH_1, 'home_scrn')),
+)
+
+SCREEN_TIMEOUT = 2.0
+
+
+################################################################################
+# Driving the simulated pins
+
+def press_and_wait(hardware, switch, screen):
+    """Nanoseconds from the switch edge to screen going high, read from the recorded pin changes."""
+    seen = len(hardware.changes)
+    pressed_ns = time.monotonic_ns()
+    hardware.press(ltb.SWITCH_PINS[switch], length=0)
+    deadline = time.monotonic() + SCREEN_TIMEOUT
+    while time.monotonic() < deadline:
+        changes = hardware.changes
+        for change in changes[seen:]:
+            if change.name == screen and change.value:
+                return change.timestamp_ns - pressed_ns
+        seen = len(changes)
+        time.sleep(0.00005)
+    raise RuntimeError('%s did not go high within %.1f s' % (screen, SCREEN_TIMEOUT))
+
+
+def start_machine(machine, input_engine, async_runtime):
+    """Runs the machine on its own thread, the benchmark thread plays the part of the pin thread."""
+    if async_runtime:
+        target = lambda: asyncio.run(machine.run(input_engine, 'Home'))
+    else:
+        def target():
+            machine.go_to_state('Home')
+            machine.run(input_engine)
+    threading.Thread(target=target, name='ltb-machine', daemon=True).start()
+
+
+def run_phase(policy, cycles, async_runtime, directory, metrics=False):
+    ltb.use_data_dir(directory)
+    ltb.JOURNAL_FSYNC = policy
+    hardware = ltb.setup_hardware('sim', record=True)
+    machine = ltb.create_state_machine(async_runtime)
+    input_engine = InputEngine(ltb.switch_1, ltb.switch_2, debounce=0)    # Simulated switches do not bounce
+    ltb.open_logs()
+    if metrics:
+        instrument_machine(machine, ltb.log_writer)
+    start_machine(machine, input_engine, async_runtime)
+
+    deadline = time.monotonic() + SCREEN_TIMEOUT
+    while not hardware.outputs['home_scrn'].value:
+        if time.monotonic() > deadline:
+            raise RuntimeError('the state machine did not start')
+        time.sleep(0.001)
+
+    latencies = {}
+    transitions = 0
+    pin_changes = len(hardware.changes)
+    start = time.perf_counter()
+    for number in range(cycles):
+        for switch, screen in CYCLES[number % len(CYCLES)]:
+            latencies.setdefault(screen, []).append(press_and_wait(hardware, switch, screen))
+            transitions += 1
+    drive_s = time.perf_counter() - start
+    pin_changes = len(hardware.changes) - pin_changes
+    ltb.close_logs()                    # Rows count once they are on disk
+    total_s = time.perf_counter() - start
+
+    with open(ltb.TRACKING_CSV) as f:
+        rows = sum(1 for _ in f) - 1
+    everything = [sample for samples in latencies.values() for sample in samples]
+    return {
+        'fsync': policy,
+        'transitions': transitions,
+        'transitions_per_s': transitions / drive_s,
+        'pin_changes_per_transition': pin_changes / transitions,
+        'rows': rows,
+        'rows_per_s': rows / total_s,
+        'edge_to_screen': latency_report(everything),
+        'edge_to_screen_by_screen': {screen: latency_report(samples) for screen, samples in latencies.items()},
+        'go_to_state': latency_report(machine.latencies),
+        'writer': ltb.log_writer.stats(),
+        'screens': ltb.screen_coalescer.stats(),
+        'journal': ltb.tracking_journal.stats(),
+    }
+
+
+################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description='Button to screen latency through the simulated pins')
+    parser.add_argument('--cycles', type=int, default=100, help='tracked sessions per phase')
+    parser.add_argument('--phases', default=','.join(PHASES), help='journal fsync policies to run, comma separated')
+    parser.add_argument('--asyncio', action='store_true', help='run the states on the asyncio runtime')
+    parser.add_argument('--metrics', action='store_true', help='with the per state histograms of ltb_metrics.py')
+    parser.add_argument('--screen-window', type=float, default=0.0, help='seconds screen changes are coalesced over')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    ltb.SCREEN_WINDOW = args.screen_window
+
+    ltb.HOLD_TIMES = dict.fromkeys(ltb.HOLD_TIMES, 0)        # Screens respond at once, as with "--no-hold"
+    results = {'runtime': 'asyncio' if args.asyncio else 'sync', 'metrics': args.metrics, 'cycles': args.cycles, 'phases': []}
+    for policy in args.phases.split(','):
+        with tempfile.TemporaryDirectory() as directory:
+            results['phases'].append(run_phase(policy, args.cycles, args.asyncio, directory, args.metrics))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    print('%s runtime, %d sessions per phase\n' % (results['runtime'], args.cycles))
+    print('%-9s %12s %10s %12s %12s %12s %14s %12s %8s' % ('fsync', 'transitions/s', 'rows/s', 'edge p50 us', 'edge p99 us',
+                                                       'edge max us', 'go_to_state p99', 'pins/press', 'avoided'))
+    for phase in results['phases']:
+        edge = phase['edge_to_screen']
+        print('%-9s %12.0f %10.0f %12.1f %12.1f %12.1f %14.1f %12.2f %8d' % (phase['fsync'], phase['transitions_per_s'], phase['rows_per_s'],
+                                                                          edge['p50_us'], edge['p99_us'], edge['max_us'],
+                                                                          phase['go_to_state']['p99_us'], phase['pin_changes_per_transition'],
+                                                                          phase['screens']['avoided']))
+
+
+if __name__ == '__main__':
+    main()
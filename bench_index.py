@@ -0,0 +1,131 @@
+# Little Time Buddy index benchmark
+# Query latency of the SQLite session index against a full scan of a multi-year Tracking_1.csv.
+#
+#   python3 bench_index.py --years 5 --per-day 12
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from ltb_index import SessionIndex, local_day, day_parts, week_start
+from ltb_logformat import read_tracking_csv
+from ltb_store import SessionRecord, CSV_HEADER, DEFAULT_NOTES, NOTE_NONE, NOTE_PLACEHOLDER, csv_row
+
+
+OFFSET = -7 * 3600
+
+
+################################################################################
+# Synthetic log
+
+def synthetic_sessions(years, per_day, tasks, seed=1):
+    rng = random.Random(seed)
+    first = 1577865600              # 2020-01-01 08:00 UTC
+    for day in range(years * 365):
+        clock = first + day * 86400
+        for _ in range(per_day):
+            clock += rng.randint(60, 1800)
+            length = rng.randint(60, 3600)
+            note = NOTE_PLACEHOLDER if rng.random() < 0.3 else NOTE_NONE
+            yield SessionRecord(clock, clock + length, OFFSET, note, rng.randint(1, tasks))
+            clock += length
+
+
+def write_log(path, sessions):
+    with open(path, 'w', newline='') as f:
+        f.write(','.join(CSV_HEADER) + '\r\n')
+        for record in sessions:
+            f.write(','.join(csv_row(record, DEFAULT_NOTES)) + '\r\n')
+
+
+################################################################################
+# Queries answered by scanning the whole spreadsheet
+
+def scan_total_for_day(path, day):
+    return sum(seconds for record in read_tracking_csv(path)
+               for part_day, seconds in day_parts(record) if part_day == day)
+
+
+def scan_week_per_task(path, day):
+    first = week_start(day)
+    totals = {}
+    for record in read_tracking_csv(path):
+        for part_day, seconds in day_parts(record):
+            if first <= part_day <= first + 6:
+                totals[record.task] = totals.get(record.task, 0) + seconds
+    return totals
+
+
+def scan_longest(path):
+    return max(read_tracking_csv(path), key=lambda record: record.end - record.start)
+
+
+def timed(func, *args, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite index vs full CSV scan')
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--per-day', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=8)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, 'Tracking_1.csv')
+        sessions = list(synthetic_sessions(args.years, args.per_day, args.tasks))
+        # Rows carry a numeric zone so the scan and the index agree on local days
+        write_log(log, sessions)
+        day = local_day(sessions[-1].start, OFFSET)
+
+        index = SessionIndex(os.path.join(directory, 'sessions.db'))
+        import_ms, _ = timed(index.import_csv, log)
+
+        results = {
+            'rows': len(sessions),
+            'csv_bytes': os.path.getsize(log),
+            'import_ms': import_ms,
+            'queries': {},
+        }
+        pairs = {
+            'total_today': ((scan_total_for_day, log, day), (index.total_for_day, day)),
+            'week_per_task': ((scan_week_per_task, log, day), (index.week_per_task, day)),
+            'longest': ((scan_longest, log), (index.longest,)),
+        }
+        for name, (scan, indexed) in pairs.items():
+            scan_ms, scan_result = timed(*scan)
+            index_ms, index_result = timed(*indexed, repeat=200)
+            if name == 'longest':
+                scan_result = scan_result.end - scan_result.start
+                index_result = index_result.end - index_result.start
+            results['queries'][name] = {
+                'csv_scan_ms': scan_ms,
+                'index_ms': index_ms,
+                'speedup': scan_ms / index_ms if index_ms else None,
+                'agree': scan_result == index_result,
+            }
+        index.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('%d sessions over %d years, %d bytes of CSV, import %.0f ms\n' % (results['rows'], args.years,
+                                                                           results['csv_bytes'], results['import_ms']))
+    print('%-15s %12s %12s %10s %6s' % ('query', 'csv scan ms', 'index ms', 'speedup', 'agree'))
+    for name, result in results['queries'].items():
+        print('%-15s %12.1f %12.4f %10.0f %6s' % (name, result['csv_scan_ms'], result['index_ms'],
+                                                 result['speedup'], result['agree']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# Little Time Buddy journal benchmark
+# Compares the old open/append/close per event path of LTB_Release_Rev0.py with ltb_journal.SessionJournal.
+#
+#   python3 bench_journal.py --sessions 1000 --dir /home/pi/Desktop/LTB_Code_Release
+#
+# Syscalls: write() calls are counted on the raw file object. Every open(path, "a") ... close() in
+# CPython also costs openat, fstat, ioctl (isatty check) and lseek besides the close itself.
+# Write amplification: flash pages programmed / payload bytes. Each time data reaches the card the
+# partly filled tail page is programmed again, plus one page for the inode (size and mtime). The
+# old path never fsyncs, but tracked sessions are minutes apart so every close is written back on
+# its own by the kernel flusher, which is what the model assumes for it.
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+from ltb_journal import SessionJournal, FSYNC_ROW, FSYNC_INTERVAL, FSYNC_IDLE
+from ltb_scheduler import Scheduler
+
+
+PAGE = 4096
+OPEN_SYSCALLS = 5               # openat, fstat, ioctl, lseek, close
+
+HEADER = ['"Time In, Zone"', ' Timestamp In', '" Time Out, Zone "', 'Timestamp Out', 'Total Time', 'Voice Note']
+ZONE = 'PDT'
+NOTE = "'Speech to text voice note'"
+
+
+################################################################################
+# Support functions
+
+def pages_programmed(offset, length):
+    """Pages touched by writing length bytes at offset, plus the inode update."""
+    first = offset // PAGE
+    last = (offset + length - 1) // PAGE
+    return last - first + 2
+
+
+def stamp(i):
+    return '2022-05-%02d_%d:%d:%d' % (1 + i % 28, i % 24, i % 60, (i * 7) % 60)
+
+
+class CountingFileIO(io.FileIO):
+
+    def __init__(self, path, mode, counters):
+        super().__init__(path, mode)
+        self.counters = counters
+
+    def write(self, data):
+        self.counters['writes'] += 1
+        return super().write(data)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+################################################################################
+# Old path, the same open and f.write calls the states made
+
+def run_legacy(path, sessions):
+    counters = {'writes': 0, 'opens': 0, 'programmed': 0}
+    payload = 0
+
+    def append(fragments):
+        nonlocal payload
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        raw = CountingFileIO(path, 'a', counters)
+        with io.TextIOWrapper(io.BufferedWriter(raw), encoding='utf-8', newline='') as f:
+            for fragment in fragments:
+                f.write(fragment)
+        counters['opens'] += 1
+        length = sum(len(fragment) for fragment in fragments)
+        counters['programmed'] += pages_programmed(offset, length) * PAGE
+        payload += length
+
+    append([','.join(HEADER) + '\r\n'])
+    start = time.perf_counter()
+    for i in range(sessions):
+        append(["%s," % ZONE, stamp(i) + ","])                                     # Tracking1.enter
+        append(["%s," % ZONE, stamp(i + 1) + ",", "%d:%d:%02d," % (0, i % 60, 7)])   # Tracking1.exit
+        append([NOTE + "\r\n"])                                                      # Record.exit
+    elapsed = time.perf_counter() - start
+
+    return {
+        'syscalls': counters['writes'] + counters['opens'] * OPEN_SYSCALLS,
+        'writes': counters['writes'],
+        'fsyncs': 0,
+        'bytes': payload,
+        'amplification': counters['programmed'] / payload,
+        'us_per_session': elapsed / sessions * 1e6,
+    }
+
+
+################################################################################
+# Journal path
+
+class MeasuredJournal(SessionJournal):
+
+    def __init__(self, *args, **kwargs):
+        self.programmed = 0
+        super().__init__(*args, **kwargs)
+
+    def commit(self, sync=True):
+        offset = self.bytes_written
+        super().commit(sync)
+        if self.bytes_written > offset:
+            self.programmed += pages_programmed(offset, self.bytes_written - offset) * PAGE
+
+
+def run_journal(path, sessions, policy, interval_ms, gap):
+    clock = FakeClock()
+    scheduler = Scheduler(clock)
+    journal = MeasuredJournal(path, policy, interval_ms, header=HEADER, scheduler=scheduler)
+    start = time.perf_counter()
+    for i in range(sessions):
+        journal.append_row([ZONE, stamp(i), ZONE, stamp(i + 1), "%d:%d:%02d" % (0, i % 60, 7), NOTE])
+        clock.now += gap            # Simulated time between sessions
+        scheduler.run_due()
+        journal.idle()
+    journal.close()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'syscalls': journal.writes + journal.fsyncs + 3,       # open, fstat, close
+        'writes': journal.writes,
+        'fsyncs': journal.fsyncs,
+        'bytes': journal.bytes_written,
+        'amplification': journal.programmed / journal.bytes_written,
+        'us_per_session': elapsed / sessions * 1e6,
+    }
+
+
+################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description='Journal vs per event open/append benchmark')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--dir', default=None, help='directory on the card under test, a temp dir by default')
+    parser.add_argument('--interval-ms', type=int, default=1000)
+    parser.add_argument('--gap', type=float, default=0.2, help='simulated seconds between sessions')
+    parser.add_argument('--json', action='store_true', help='print machine readable results')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        results['legacy'] = run_legacy(os.path.join(directory, 'legacy.csv'), args.sessions)
+        for policy in (FSYNC_ROW, FSYNC_INTERVAL, FSYNC_IDLE):
+            path = os.path.join(directory, 'journal_%s.csv' % policy)
+            results['journal_' + policy] = run_journal(path, args.sessions, policy, args.interval_ms, args.gap)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('%d sessions, %.1f s between sessions, interval %d ms\n' % (args.sessions, args.gap, args.interval_ms))
+    print('%-18s %10s %8s %8s %10s %8s %12s' % ('path', 'syscalls', 'writes', 'fsyncs', 'bytes', 'amplif.', 'us/session'))
+    for name, result in results.items():
+        print('%-18s %10d %8d %8d %10d %8.1f %12.1f' % (name, result['syscalls'], result['writes'], result['fsyncs'],
+                                                       result['bytes'], result['amplification'], result['us_per_session']))
+
+
+if __name__ == '__main__':
+    main()
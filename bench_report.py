@@ -0,0 +1,133 @@
+# Little Time Buddy report benchmark
+# Rows per second through the report pipeline for each of the log formats, and the peak memory of
+# a one month report over two file sizes to show it does not grow with the log (a report over
+# every day grows by one total per day). Run it on the Pi for Pi numbers.
+#
+#   python3 bench_report.py --rows 200000
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from ltb_report import build_report
+from ltb_store import SessionRecord, CSV_HEADER, DEFAULT_NOTES, NOTE_NONE, NOTE_PLACEHOLDER, csv_row
+
+
+OFFSET = -7 * 3600
+FIRST_DAY = 1577865600 // 86400  # The synthetic logs start on 2020-01-01
+STAMP_HEADER = 'Date, Time In, Time Out , Total, Voice Note\r\n'
+
+
+################################################################################
+# Synthetic logs
+
+def synthetic_sessions(rows, seed=1):
+    rng = random.Random(seed)
+    clock = 1577865600              # 2020-01-01 08:00 UTC
+    for _ in range(rows):
+        clock += rng.randint(60, 7200)
+        length = rng.randint(60, 3600)
+        note = NOTE_PLACEHOLDER if rng.random() < 0.3 else NOTE_NONE
+        yield SessionRecord(clock, clock + length, OFFSET, note, 1)
+        clock += length
+
+
+def tracking_line(record):
+    return ','.join(csv_row(record, DEFAULT_NOTES)) + '\r\n'
+
+
+def wall_clock(epoch):
+    return time.gmtime(epoch + OFFSET)
+
+
+def stamp_line(record):
+    t_in, t_out = wall_clock(record.start), wall_clock(record.end)
+    note = 'Speech to text voice note' if record.note else ''
+    return '%d/%d/%d, %d:%02d:%02d, %d:%02d:%02d, Delta Formula, %s\r\n' % (
+        t_in.tm_mon, t_in.tm_mday, t_in.tm_year, t_in.tm_hour, t_in.tm_min, t_in.tm_sec,
+        t_out.tm_hour, t_out.tm_min, t_out.tm_sec, note)
+
+
+def delta_line(record):
+    t_in, t_out = wall_clock(record.start), wall_clock(record.end)
+    # Field by field like Test_Pi_SM_TimeCalcs.py, so minutes and seconds go negative
+    return "%d/%d/%d, %d:%02d:%02d, %d:%02d:%02d, %d:%d:%d, 'Speech to text voice note'\r\n" % (
+        t_in.tm_mon, t_in.tm_mday, t_in.tm_year, t_in.tm_hour, t_in.tm_min, t_in.tm_sec,
+        t_out.tm_hour, t_out.tm_min, t_out.tm_sec, t_out.tm_hour - t_in.tm_hour,
+        t_out.tm_min - t_in.tm_min, t_out.tm_sec - t_in.tm_sec)
+
+
+FORMATS = {
+    'tracking': (','.join(CSV_HEADER) + '\r\n', tracking_line),
+    'stamp': (STAMP_HEADER, stamp_line),
+    'delta': (STAMP_HEADER, delta_line),
+}
+
+
+def write_log(path, rows, fmt):
+    header, line = FORMATS[fmt]
+    with open(path, 'w', newline='') as f:
+        f.write(header)
+        for record in synthetic_sessions(rows):
+            f.write(line(record))
+
+
+################################################################################
+
+def run(path):
+    counts = {'lines': 0}
+    start = time.perf_counter()
+    report = build_report([path], counts=counts)
+    elapsed = time.perf_counter() - start
+    return counts['lines'], elapsed, report
+
+
+def peak_memory(path):
+    tracemalloc.start()
+    build_report([path], FIRST_DAY, FIRST_DAY + 30)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report pipeline throughput')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in FORMATS:
+            path = os.path.join(directory, fmt + '.csv')
+            write_log(path, args.rows, fmt)
+            lines, elapsed, report = run(path)
+            small = os.path.join(directory, fmt + '_small.csv')
+            write_log(small, args.rows // 10, fmt)
+            results[fmt] = {
+                'lines': lines,
+                'bytes': os.path.getsize(path),
+                'seconds': elapsed,
+                'rows_per_s': lines / elapsed,
+                'days': len(report.days),
+                'total_s': report.total(),
+                'peak_bytes': peak_memory(path),
+                'peak_bytes_tenth': peak_memory(small),
+            }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('%-9s %9s %10s %12s %12s %14s' % ('format', 'lines', 'seconds', 'rows/s', 'peak KiB', 'peak KiB 1/10'))
+    for fmt, result in results.items():
+        print('%-9s %9d %10.2f %12.0f %12.1f %14.1f' % (fmt, result['lines'], result['seconds'], result['rows_per_s'],
+                                                       result['peak_bytes'] / 1024, result['peak_bytes_tenth'] / 1024))
+
+
+if __name__ == '__main__':
+    main()
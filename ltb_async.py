@@ -0,0 +1,250 @@
+# Little Time Buddy asyncio runtime
+# Optional runtime where "enter", "exit" and "pressed" may be coroutines.
+#
+# The machine runs on one event loop. Button events come in from the gpiozero pin thread through
+# "call_soon_threadsafe", timers are event loop timers, and a state that awaits I/O lets the loop
+# keep servicing everything else. The synchronous states in LTB_Release_Rev0.py run through
+# "SyncStateAdapter" without any change.
+
+import asyncio
+import inspect
+import time
+from collections import deque
+
+from ltb_input import PRESSED
+from ltb_trace import TR_ENTER, TR_EXIT, TR_PRESSED, TR_DEFERRED
+from ltb_transitions import state_path
+
+
+################################################################################
+# Support functions
+
+def is_async_state(state):
+    return any(inspect.iscoroutinefunction(getattr(state, attr, None)) for attr in ('enter', 'exit', 'pressed'))
+
+
+################################################################################
+# Periodic timer on the event loop, cancelled the same way as an asyncio TimerHandle
+
+class PeriodicTimer(object):
+
+    def __init__(self, loop, interval, callback, args):
+        self.loop = loop
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.deadline = loop.time() + interval
+        self.handle = loop.call_at(self.deadline, self.fire)
+
+    def fire(self):
+        self.deadline += self.interval
+        now = self.loop.time()
+        if self.deadline <= now:
+            self.deadline = now + self.interval
+        self.handle = self.loop.call_at(self.deadline, self.fire)
+        run_callback(self.loop, self.callback, self.args)
+
+    def cancel(self):
+        self.handle.cancel()
+
+
+def run_callback(loop, callback, args):
+    result = callback(*args)
+    if inspect.isawaitable(result):
+        loop.create_task(result)
+
+
+################################################################################
+# Scheduler interface on top of the event loop, same "call_later"/"call_every" as ltb_scheduler.Scheduler
+
+class LoopScheduler(object):
+
+    def __init__(self, machine):
+        self.machine = machine      # The loop only exists once the machine is running
+
+    def call_later(self, delay, callback, *args):
+        loop = self.machine.loop
+        return loop.call_later(delay, run_callback, loop, callback, args)
+
+    def call_every(self, interval, callback, *args):
+        return PeriodicTimer(self.machine.loop, interval, callback, args)
+
+
+################################################################################
+# Adapter for the synchronous states
+
+class SyncMachineView(object):
+    # What a synchronous state sees as "machine". A "go_to_state" call is recorded and awaited by
+    # the asyncio machine once the synchronous attribute returns.
+
+    def __init__(self, machine):
+        self.machine = machine
+        self.next_state = None
+        self.next_path = None
+
+    @property
+    def event(self):
+        return self.machine.event
+
+    @property
+    def states(self):
+        return self.machine.states
+
+    @property
+    def scheduler(self):
+        return self.machine.scheduler
+
+    def go_to_state(self, state_name, path=None):
+        self.next_state = state_name
+        self.next_path = path
+
+    def hold(self, seconds):
+        self.machine.hold(seconds)
+
+    def call_later(self, delay, callback, *args):
+        return self.machine.call_later(delay, callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        return self.machine.call_every(interval, callback, *args)
+
+
+class SyncStateAdapter(object):
+
+    def __init__(self, state):
+        self.state = state
+
+    @property
+    def name(self):
+        return self.state.name
+
+    async def enter(self, machine):
+        self.state.enter(machine.sync_view)
+
+    async def exit(self, machine):
+        self.state.exit(machine.sync_view)
+
+    async def pressed(self, machine):
+        view = machine.sync_view
+        view.next_state = None
+        self.state.pressed(view)
+        if view.next_state is not None:
+            await machine.go_to_state(view.next_state, view.next_path)
+
+
+################################################################################
+# State machine
+
+class AsyncStateMachine(object):
+
+    def __init__(self):
+        self.state = None
+        self.states = {}
+        self.parents = {}                       # Nested states, as in StateMachine
+        self.paths = {}
+        self.event = None
+        self.loop = None
+
+        self.sync_view = SyncMachineView(self)
+        self.scheduler = LoopScheduler(self)
+        self.state_timers = {}
+        self.timer_owner = None
+        self.holding = False
+        self.hold_timer = None
+        self.deferred = deque(maxlen=8)
+        self.latencies = deque(maxlen=1024)     # Nanoseconds per transition, compare with StateMachine.latencies
+        self.trace = None                       # Optional TraceRing, see ltb_trace.py
+
+    def add_state(self, state, parent=None):
+        if not is_async_state(state):
+            state = SyncStateAdapter(state)
+        self.states[state.name] = state
+        if parent is not None:
+            self.parents[state.name] = parent
+
+    def path_to(self, state_name):
+        key = (self.state.name if self.state else None, state_name)
+        path = self.paths.get(key)
+        if path is None:
+            path = self.paths[key] = state_path(key[0], state_name, self.parents)
+        return path
+
+    async def go_to_state(self, state_name, path=None):
+        start = time.perf_counter_ns()
+        trace = self.trace
+        exits, enters = path or self.path_to(state_name)
+        for name in exits:
+            if trace is not None:
+                trace.enter(name)
+                trace.emit(TR_EXIT)
+            await self.states[name].exit(self)
+            self.cancel_state_timers(name)
+        self.cancel_hold()
+        self.state = self.states[state_name]
+        for name in enters:
+            if trace is not None:
+                trace.enter(name)
+                trace.emit(TR_ENTER)
+            self.timer_owner = name
+            await self.states[name].enter(self)
+        self.timer_owner = None
+        if trace is not None:
+            trace.enter(state_name)
+        self.latencies.append(time.perf_counter_ns() - start)
+
+    async def pressed(self, event):
+        if self.state:
+            if self.holding:
+                if self.trace is not None:
+                    self.trace.emit(TR_DEFERRED, event.switch)
+                self.deferred.append(event)
+                return
+            self.event = event
+            await self.state.pressed(self)
+
+    async def run(self, input_engine, initial_state):
+        """Start in initial_state and handle button events until cancelled."""
+        self.loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        input_engine.sink = lambda event: self.loop.call_soon_threadsafe(events.put_nowait, event)
+
+        await self.go_to_state(initial_state)
+        while True:
+            event = await events.get()
+            if event.edge == PRESSED:
+                if self.trace is not None:
+                    self.trace.emit(TR_PRESSED, event.switch, (time.monotonic_ns() - event.timestamp_ns) // 1000)
+                await self.pressed(event)
+
+    # Deferred actions for the current state, same interface as StateMachine
+
+    def call_later(self, delay, callback, *args):
+        timer = self.scheduler.call_later(delay, callback, *args)
+        self.state_timers.setdefault(self.timer_owner or self.state.name, []).append(timer)
+        return timer
+
+    def call_every(self, interval, callback, *args):
+        timer = self.scheduler.call_every(interval, callback, *args)
+        self.state_timers.setdefault(self.timer_owner or self.state.name, []).append(timer)
+        return timer
+
+    def cancel_state_timers(self, state_name):
+        for timer in self.state_timers.pop(state_name, ()):
+            timer.cancel()
+
+    def cancel_hold(self):
+        if self.hold_timer is not None:
+            self.hold_timer.cancel()
+        self.holding = False
+        self.hold_timer = None
+
+    def hold(self, seconds):
+        if seconds > 0:
+            self.cancel_hold()
+            self.holding = True
+            self.hold_timer = self.call_later(seconds, self.release_hold)
+
+    async def release_hold(self):
+        self.holding = False
+        self.hold_timer = None
+        while self.deferred and not self.holding:
+            await self.pressed(self.deferred.popleft())
@@ -0,0 +1,110 @@
+# Little Time Buddy session checkpoint
+# A tiny file that says "a session is in progress" so a reboot or power loss does not lose it.
+#
+# The checkpoint is written to a temp file and renamed over the old one, so the file on the card is
+# always either the old or the new version, never half of each. fsync is off by default to keep the
+# write well under a millisecond: on ext4 (the Pi OS default) a rename over an existing file
+# already forces the new data out before the rename is committed (auto_da_alloc).
+#
+# With several tasks tracked at once the file holds every open session ("save_all"), in a second
+# layout with its own magic. "load_all" reads either layout.
+
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+
+
+MAGIC = b'LTBC'
+
+# magic, start epoch, end epoch (0 while the session is open), UTC offset in seconds, task id, crc32
+CHECKPOINT = struct.Struct('<4sqqiH2xI')
+
+# Several sessions: magic, count, then count entries and a crc32 over everything before it
+MAGIC_ALL = b'LTBK'                  # Not ltb_store.py's b'LTBS', neither file passes for the other
+HEADER_ALL = struct.Struct('<4sI')
+ENTRY = struct.Struct('<qqiH2x')        # start, end, UTC offset, task
+
+Checkpoint = namedtuple('Checkpoint', ['start', 'end', 'utc_offset', 'task'])
+
+
+################################################################################
+# Support functions
+
+def atomic_write(path, data, fsync=False):
+    """Replace path with data using write-temp-and-rename."""
+    tmp = path + '.tmp'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, data)
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+
+
+################################################################################
+# Checkpoint file
+
+class SessionCheckpoint(object):
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.last_save_ns = 0           # Time the last save took, for checking the transition budget
+
+    def save(self, start, utc_offset, task, end=0):
+        begin = time.perf_counter_ns()
+        body = CHECKPOINT.pack(MAGIC, start, end, utc_offset, task, 0)[:-4]
+        atomic_write(self.path, body + struct.pack('<I', zlib.crc32(body)), self.fsync)
+        self.last_save_ns = time.perf_counter_ns() - begin
+
+    def load(self):
+        """The checkpointed session, None if there is none or the file is damaged."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read(CHECKPOINT.size + 1)
+        except FileNotFoundError:
+            return None
+        if len(data) != CHECKPOINT.size:
+            return None
+        magic, start, end, utc_offset, task, crc = CHECKPOINT.unpack(data)
+        if magic != MAGIC or crc != zlib.crc32(data[:-4]):
+            return None
+        return Checkpoint(start, end, utc_offset, task)
+
+    def save_all(self, checkpoints):
+        """Every open (or stopped but not yet written) session, the file is removed if there are none."""
+        if not checkpoints:
+            self.clear()
+            return
+        begin = time.perf_counter_ns()
+        body = HEADER_ALL.pack(MAGIC_ALL, len(checkpoints)) + b''.join(
+            ENTRY.pack(checkpoint.start, checkpoint.end, checkpoint.utc_offset, checkpoint.task) for checkpoint in checkpoints)
+        atomic_write(self.path, body + struct.pack('<I', zlib.crc32(body)), self.fsync)
+        self.last_save_ns = time.perf_counter_ns() - begin
+
+    def load_all(self):
+        """[Checkpoint] from either layout, empty if there is no file or it is damaged."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        if data[:4] == MAGIC:
+            checkpoint = self.load()
+            return [checkpoint] if checkpoint is not None else []
+        if len(data) < HEADER_ALL.size + 4 or data[:4] != MAGIC_ALL:
+            return []
+        _, count = HEADER_ALL.unpack_from(data)
+        if len(data) != HEADER_ALL.size + count * ENTRY.size + 4 or struct.unpack_from('<I', data, len(data) - 4)[0] != zlib.crc32(data[:-4]):
+            return []
+        return [Checkpoint(*ENTRY.unpack_from(data, HEADER_ALL.size + number * ENTRY.size)) for number in range(count)]
+
+    def clear(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,54 @@
+# Little Time Buddy session clock
+# Session durations from the monotonic clock, wall clock stamps for display only.
+#
+# The Pi has no RTC and sets its clock over NTP after boot, so the wall clock can step while a
+# session is being tracked. A Stamp keeps both clocks: the duration is the difference of the
+# monotonic readings and does not move when the wall clock is corrected. Durations are plain
+# integer seconds rounded to the nearest second, longer than a day included, so they add up and
+# can be handled in bulk. Wall stamps are rounded to the nearest second as well, and the end
+# shown for a session is its start plus the duration, so the columns of a row always add up.
+
+import time
+from array import array
+from collections import namedtuple
+
+
+NS = 1000000000
+HALF = NS // 2
+
+# wall: epoch seconds shown in the spreadsheet, mono_ns: time.monotonic_ns() at the same moment
+Stamp = namedtuple('Stamp', ['wall', 'mono_ns'])
+
+
+################################################################################
+# Stamps
+
+def stamp_now():
+    return Stamp(round(time.time()), time.monotonic_ns())
+
+
+def resume_stamp(wall):
+    """Stamp for a session started before a restart, the monotonic clock starts again at boot
+    so its reading is worked out from the wall clock once and the session is timed from there."""
+    return Stamp(wall, time.monotonic_ns() - (time.time_ns() - wall * NS))
+
+
+################################################################################
+# Durations
+
+def elapsed(stamp_in, stamp_out=None):
+    """Seconds between two stamps, or from stamp_in until now."""
+    mono_out = time.monotonic_ns() if stamp_out is None else stamp_out.mono_ns
+    return max(0, (mono_out - stamp_in.mono_ns + HALF) // NS)
+
+
+def durations(starts_ns, ends_ns):
+    """Seconds for many sessions at once, from monotonic readings."""
+    return array('q', [max(0, (end - start + HALF) // NS) for start, end in zip(starts_ns, ends_ns)])
+
+
+def hms(seconds):
+    """(hours, minutes, seconds), hours keep counting past a day."""
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return hours, minutes, seconds
@@ -0,0 +1,129 @@
+# Little Time Buddy screen coalescer
+# Sits between the states and the screen outputs, so only the screen that ends up wanted is drawn.
+#
+# The states raise and lower their screen as before, but on a stand in for the output. Each change
+# only records what is wanted and, if nothing is waiting yet, arms one timer "window" seconds
+# away on the machine's scheduler. When it fires the outputs are brought to what is wanted then:
+# screens no longer wanted are lowered first, then the new ones are raised with their fields, and
+# a screen still shown only gets fields that changed. Passing straight through a state (presses
+# replayed after a hold, or quick presses within the window) never shows its screen, leaving and
+# entering the same screen draws nothing, and a counter update equal to what is shown is dropped.
+#
+# With a window of 0 the changes of one transition, and of the presses replayed after a hold, are
+# still taken together, since the timer only fires once the machine is done with them.
+#
+# Screens are raised in the order the states asked for them, the one asked for last on top, and
+# the hooks given to "on_flush" run once every output is written (ltb_render.Panel draws then).
+
+import itertools
+
+SCREEN_WINDOW = 0               # Seconds a change waits for the ones after it, added to every button to screen time
+
+
+################################################################################
+# Coalescer
+
+class ScreenCoalescer(object):
+
+    def __init__(self, window=SCREEN_WINDOW, schedule=None):
+        self.window = window
+        self.schedule = schedule        # schedule(delay, callback), e.g. the machine scheduler's call_later. None writes at once
+        self.outputs = []
+        self.timer = None
+        self.flush_hooks = []
+        self.order = itertools.count(1)     # Stamps each raise, later ones go on top
+
+        # Statistics
+        self.requested = 0              # Screens raised and field updates asked for by the states
+        self.refreshes = 0              # The ones that reached the screens
+        self.writes = 0                 # Output writes, lowering included
+        self.flushes = 0
+
+    def wrap(self, output):
+        """CoalescedOutput in place of output, a pin from ltb_hal.py or a ScreenOutput from ltb_display.py."""
+        coalesced = CoalescedOutput(self, output)
+        self.outputs.append(coalesced)
+        return coalesced
+
+    def attach(self, schedule):
+        self.schedule = schedule
+
+    def on_flush(self, hook):
+        self.flush_hooks.append(hook)
+
+    def changed(self):
+        if self.schedule is None:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.schedule(self.window, self.flush)
+
+    def flush(self):
+        """Writes the difference between what is wanted and what is shown."""
+        self.timer = None
+        self.flushes += 1
+        for screen in self.outputs:             # The screen leaving goes first, as when the states drive the pins
+            if screen.shown and not screen.wanted:
+                screen.output.value = False
+                screen.shown = False
+                screen.shown_fields = {}
+                self.writes += 1
+        for screen in sorted(self.outputs, key=lambda screen: screen.raised_at):
+            if not screen.wanted:
+                continue
+            if not screen.shown:
+                screen.output.update(screen.fields)     # Sent with the screen, not after it
+                screen.output.value = True
+                screen.shown = True
+            elif screen.fields != screen.shown_fields:
+                screen.output.update({field: value for field, value in screen.fields.items()
+                                      if screen.shown_fields.get(field) != value})
+            else:
+                continue
+            screen.shown_fields = dict(screen.fields)
+            self.refreshes += 1
+            self.writes += 1
+        for hook in self.flush_hooks:
+            hook()
+
+    def stats(self):
+        return {
+            'requested': self.requested,
+            'refreshes': self.refreshes,
+            'avoided': self.requested - self.refreshes,
+            'writes': self.writes,
+            'flushes': self.flushes,
+        }
+
+
+class CoalescedOutput(object):
+    """Same "value" and "update" as the output it stands in for, the write waits for the coalescer."""
+
+    def __init__(self, coalescer, output):
+        self.coalescer = coalescer
+        self.output = output
+        self.name = output.name
+        self.pin = output.pin
+        self.wanted = bool(output.value)
+        self.shown = self.wanted
+        self.fields = {}                # Fields wanted while the screen is up
+        self.raised_at = 0
+        self.shown_fields = {}
+
+    @property
+    def value(self):
+        return self.wanted
+
+    @value.setter
+    def value(self, value):
+        self.wanted = bool(value)
+        if self.wanted:
+            self.raised_at = next(self.coalescer.order)
+            self.coalescer.requested += 1
+        else:
+            self.fields = {}
+        self.coalescer.changed()
+
+    def update(self, fields):
+        self.fields.update(fields)
+        self.coalescer.requested += 1
+        self.coalescer.changed()
@@ -0,0 +1,108 @@
+# Little Time Buddy live counter
+# The tracked time shown by the "Tracking<n>" states, refreshed only when the text on the screen changes.
+#
+# The time shown is always worked out from the start of the session on the monotonic clock, never
+# by adding up ticks, so a late or skipped refresh shows the right time at the next one. How often
+# it changes depends on how long the session has run: steps is a list of (from seconds, step
+# seconds), by default to the second for the first ten minutes and to the minute after that, when
+# the seconds are dropped from the text. One one shot timer is armed for the next change, lined
+# up with the session start, and a frame is only pushed when its text differs from the last one
+# pushed. A full e-paper refresh takes a second or two, so an eight hour session costs about a
+# thousand of them instead of one every second.
+#
+#   python3 ltb_counter.py          (frames pushed over an eight hour session, on a simulated clock)
+
+import time
+
+from ltb_clock import NS
+
+
+DEFAULT_STEPS = ((0, 1), (600, 60))    # Seconds to the second for ten minutes, then minutes
+
+
+def counter_step(steps, seconds):
+    """Step of the time shown after seconds of the session."""
+    step = steps[0][1]
+    for start, length in steps:
+        if seconds < start:
+            break
+        step = length
+    return step
+
+
+def counter_text(seconds, step):
+    """Time shown for seconds at step, "H:MM:SS" to the second, "H:MM" for longer steps."""
+    seconds -= seconds % step
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if step < 60:
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
+    return '%d:%02d' % (hours, minutes)
+
+
+################################################################################
+# Counter
+
+class LiveCounter(object):
+
+    def __init__(self, started, schedule, push, steps=DEFAULT_STEPS, clock=time.monotonic_ns):
+        self.started = started          # started() -> monotonic ns the session began, read at every refresh
+        self.schedule = schedule        # schedule(delay, callback) -> timer with "cancel", e.g. machine.scheduler.call_later
+        self.push = push                # push(text, seconds) sends a frame to the screen
+        self.steps = tuple(sorted(steps))
+        self.clock = clock
+        self.timer = None
+        self.shown = None               # Text of the last frame pushed
+        self.pushed = 0
+        self.suppressed = 0             # Refreshes whose frame was the same as the one on the screen
+
+    def elapsed(self):
+        """Whole seconds since the session start."""
+        return max(0, (self.clock() - self.started()) // NS)
+
+    def start(self):
+        """Pushes the time now and arms the timer for the next change, again after "switch_task" without a stop first."""
+        self.stop()                     # "refresh" keeps one timer, the one it arms
+        self.shown = None
+        self.refresh()
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def refresh(self):
+        self.timer = None
+        now_ns = self.clock()
+        seconds = max(0, (now_ns - self.started()) // NS)
+        step = counter_step(self.steps, seconds)
+        text = counter_text(seconds, step)
+        if text != self.shown:
+            self.shown = text
+            self.pushed += 1
+            self.push(text, seconds)
+        else:
+            self.suppressed += 1
+        # Next change is at the next multiple of step from the session start
+        next_ns = self.started() + (seconds - seconds % step + step) * NS
+        self.timer = self.schedule(max(0, next_ns - now_ns) / NS, self.refresh)
+
+
+################################################################################
+
+def main():
+    from ltb_focus import SimClock
+
+    hours = 8
+    for label, steps in (('every second', ((0, 1),)), ('adaptive', DEFAULT_STEPS)):
+        clock = SimClock()
+        counter = LiveCounter(lambda: 0, clock.schedule, lambda text, seconds: None, steps,
+                              clock=lambda: round(clock.now * NS))
+        counter.start()
+        clock.scheduler.call_later(hours * 3600, counter.stop)
+        clock.run()
+        print('%-12s %d h session: %d frames pushed, %d suppressed' % (label, hours, counter.pushed, counter.suppressed))
+
+
+if __name__ == '__main__':
+    main()
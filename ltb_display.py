@@ -0,0 +1,407 @@
+# Little Time Buddy display link
+# Screen commands to the M4 e-paper controller over one serial port, in place of a select pin per screen.
+#
+# Every command is a frame:
+#
+#   0x7E | seq | command | length | payload (length bytes) | CRC-16/CCITT of seq..payload, little endian
+#
+# CMD_SHOW carries the screen id and its fields, each as (field id, length, UTF-8 text), e.g. the
+# tracked time for "track1_scrn". When the screens are drawn on the Pi (ltb_render.py) the M4 gets
+# CMD_DRAW instead, a rectangle of the 1-bit framebuffer (x, y, width, height, then the rows), and
+# CMD_REFRESH to update the panel, fully or only where it was drawn on. The M4 answers every good
+# frame with CMD_ACK carrying its seq.
+# Frames are not byte stuffed: the reader looks for 0x7E and takes the frame only if its CRC
+# matches, otherwise it moves on one byte and looks again, so it falls back into step after noise.
+#
+# "show" and "draw" never wait: the commands go on a short queue and a thread writes them, waits
+# up to ACK_TIMEOUT for each ACK and sends a command again with the same seq up to RETRIES times.
+# A show the same as the one before it is dropped before it reaches the queue, and the M4 redraws
+# nothing for a frame with the seq and payload it has just had, so a retry whose ACK was lost
+# costs no refresh. The rectangles of one "draw" go as one job that is never pushed out of the
+# queue, and a job stops at the first command that is not acknowledged.
+#
+# FakeM4 is a stand in for the board on a pty pair, the link opens its other end as it would
+# /dev/serial0:
+#
+#   python3 ltb_display.py 500      (500 commands to a FakeM4 losing every 5th ACK)
+
+import os
+import select
+import threading
+import time
+from binascii import crc_hqx
+from collections import deque, namedtuple
+from struct import Struct
+
+from ltb_hal import PinChange
+from ltb_stats import latency_report
+
+
+SOF = 0x7E
+HEADER = Struct('<BBBB')        # SOF, seq, command, length
+CRC = Struct('<H')
+MAX_PAYLOAD = 255
+
+CMD_SHOW = 0x01
+CMD_DRAW = 0x02
+CMD_REFRESH = 0x03
+CMD_ACK = 0x81
+
+REFRESH_FULL = 0
+REFRESH_PARTIAL = 1
+
+RECT = Struct('<HHHH')          # x, y, width, height of a CMD_DRAW, x and width in whole bytes of pixels
+
+# Screen ids on the M4, by the names of the select pins they replace
+SCREEN_IDS = {
+    'home_scrn': 1,
+    'profile1_scrn': 2,
+    'track1_scrn': 3,
+    'focus1_scrn': 4,
+    'profile2_scrn': 5,
+    'voicenote_scrn': 6,
+    'record_scrn': 7,
+}
+
+# Fields of a screen
+FIELD_TIME = 1                  # Tracked time or focus time left
+FIELD_PHASE = 2                 # Focus timer phase and round
+FIELD_TODAY = 3
+FIELD_WEEK = 4
+
+ACK_TIMEOUT = 0.1               # Seconds to wait for an ACK before sending again
+RETRIES = 3
+QUEUE_SIZE = 16                 # Commands waiting to be written, the oldest is dropped past this
+
+Frame = namedtuple('Frame', ['seq', 'command', 'payload'])
+
+
+################################################################################
+# Frames
+
+def encode_frame(seq, command, payload=b''):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError('payload of %d bytes, at most %d' % (len(payload), MAX_PAYLOAD))
+    body = bytes((seq, command, len(payload))) + payload
+    return bytes((SOF,)) + body + CRC.pack(crc_hqx(body, 0xFFFF))
+
+
+def encode_show(screen, fields=None):
+    """CMD_SHOW payload: the screen id, then (field id, length, text) for each field in field order."""
+    parts = [bytes((screen,))]
+    for field, value in sorted((fields or {}).items()):
+        data = value.encode('utf-8') if isinstance(value, str) else bytes(value)
+        parts.append(bytes((field, len(data))) + data)
+    return b''.join(parts)
+
+
+def decode_show(payload):
+    """(screen, {field id: text}) from a CMD_SHOW payload."""
+    fields = {}
+    offset = 1
+    while offset + 2 <= len(payload):
+        field, length = payload[offset], payload[offset + 1]
+        fields[field] = payload[offset + 2:offset + 2 + length].decode('utf-8', 'replace')
+        offset += 2 + length
+    return payload[0], fields
+
+
+class FrameDecoder(object):
+    """Frames from a byte stream fed in pieces of any size."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.skipped = 0                # Bytes thrown away looking for a frame
+        self.errors = 0                 # Frames with a bad CRC
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        while True:
+            start = buffer.find(SOF)
+            if start < 0:
+                self.skipped += len(buffer)
+                buffer.clear()
+                break
+            if start:
+                self.skipped += start
+                del buffer[:start]
+            if len(buffer) < HEADER.size:
+                break
+            end = HEADER.size + buffer[3] + CRC.size
+            if len(buffer) < end:
+                break
+            body = bytes(buffer[1:end - CRC.size])
+            if CRC.unpack_from(buffer, end - CRC.size)[0] == crc_hqx(body, 0xFFFF):
+                frames.append(Frame(body[0], body[1], body[3:]))
+                del buffer[:end]
+            else:
+                self.errors += 1
+                del buffer[:1]          # Not a frame after all, look for the next 0x7E
+        return frames
+
+
+################################################################################
+# Link to the M4
+
+class DisplayLink(object):
+
+    def __init__(self, port, ack_timeout=ACK_TIMEOUT, retries=RETRIES, maxsize=QUEUE_SIZE, name='ltb-display'):
+        self.port = port                # serial.Serial, or anything with "write", "read" and a settable "timeout"
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.maxsize = maxsize
+        self.decoder = FrameDecoder()
+        self.commands = deque()
+        self.condition = threading.Condition()
+        self.closing = False
+        self.last = None                # Payload of the last show queued, for dropping repeats
+        self.seq = 0
+
+        # Statistics
+        self.queued = 0
+        self.duplicates = 0             # Commands the same as the one before, never sent
+        self.dropped = 0                # Shows pushed out of a full queue by newer ones
+        self.sent = 0
+        self.resent = 0
+        self.acked = 0
+        self.failed = 0                 # Commands without an ACK after every retry
+        self.ack_latencies = deque(maxlen=1024)     # Nanoseconds from first write to ACK
+
+        self.thread = threading.Thread(target=self.worker, name=name, daemon=True)
+        self.thread.start()
+
+    def show(self, screen, fields=None):
+        """Queue the command showing screen with fields, returns False if it repeats the one before."""
+        payload = encode_show(screen, fields)
+        with self.condition:
+            if payload == self.last:
+                self.duplicates += 1
+                return False
+            self.last = payload
+            self.queue(((CMD_SHOW, payload),), True)
+        return True
+
+    def draw(self, rects, refresh):
+        """Queue CMD_DRAW for every (Rect, bits) and then CMD_REFRESH with refresh, as one job."""
+        commands = []
+        for rect, bits in rects:
+            stride = rect.width // 8
+            rows = max(1, (MAX_PAYLOAD - RECT.size) // stride)     # Taller rectangles go in bands of whole rows
+            for top in range(0, rect.height, rows):
+                height = min(rows, rect.height - top)
+                commands.append((CMD_DRAW, RECT.pack(rect.x, rect.y + top, rect.width, height)
+                                 + bytes(bits[top * stride:(top + height) * stride])))
+        commands.append((CMD_REFRESH, bytes((refresh,))))
+        with self.condition:
+            self.last = None            # The screen no longer shows what the last CMD_SHOW said
+            self.queue(tuple(commands), False)
+
+    def queue(self, commands, droppable):
+        """Called with the condition held."""
+        if len(self.commands) >= self.maxsize:
+            oldest = next((job for job in self.commands if job[1]), None)
+            if oldest is not None:          # An older screen is not worth showing any more
+                self.commands.remove(oldest)
+                self.dropped += 1
+        self.commands.append((commands, droppable))
+        self.queued += 1
+        self.condition.notify()
+
+    def output(self, hardware, name, screen=None):
+        """ScreenOutput standing in for the select pin called name."""
+        return ScreenOutput(self, hardware, name, SCREEN_IDS[name] if screen is None else screen)
+
+    def worker(self):
+        while True:
+            with self.condition:
+                while not self.commands and not self.closing:
+                    self.condition.wait()
+                if not self.commands:
+                    return
+                commands, droppable = self.commands.popleft()
+            for command, payload in commands:
+                if not self.send(command, payload):
+                    break
+
+    def send(self, command, payload):
+        self.seq = self.seq % 255 + 1           # 1..255, the M4 starts out with 0
+        frame = encode_frame(self.seq, command, payload)
+        start = time.monotonic_ns()
+        for attempt in range(1 + self.retries):
+            try:
+                self.port.write(frame)
+            except Exception as error:          # A dead port must not kill the thread
+                print('Display write failed:', repr(error))
+                break
+            if attempt:
+                self.resent += 1
+            else:
+                self.sent += 1
+            if self.wait_ack(self.seq, time.monotonic() + self.ack_timeout):
+                self.acked += 1
+                self.ack_latencies.append(time.monotonic_ns() - start)
+                return True
+        self.failed += 1
+        with self.condition:
+            if command == CMD_SHOW and self.last == payload:
+                self.last = None                # Not known to be shown, let the same command through again
+        return False
+
+    def wait_ack(self, seq, deadline):
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.port.timeout = remaining
+            data = self.port.read(max(1, getattr(self.port, 'in_waiting', 0)))
+            for frame in self.decoder.feed(data):
+                if frame.command == CMD_ACK and frame.payload[:1] == bytes((seq,)):
+                    return True
+
+    def close(self, timeout=None):
+        """Send every queued command, then stop the thread."""
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'duplicates': self.duplicates,
+            'dropped': self.dropped,
+            'sent': self.sent,
+            'resent': self.resent,
+            'acked': self.acked,
+            'failed': self.failed,
+            'crc_errors': self.decoder.errors,
+            'ack_latency': latency_report(self.ack_latencies),
+        }
+
+
+class ScreenOutput(object):
+    """Stands in for a screen select pin: setting "value" True shows the screen over the link, and
+    "update" sends new fields while it is shown. Going low sends nothing, the next screen replaces it."""
+
+    def __init__(self, link, hardware, name, screen):
+        self.link = link
+        self.hardware = hardware        # Records the changes like the pins do, see ltb_hal.py
+        self.name = name
+        self.pin = screen
+        self.fields = {}
+        self.shown = False
+
+    @property
+    def value(self):
+        return self.shown
+
+    @value.setter
+    def value(self, value):
+        self.shown = bool(value)
+        if self.shown:
+            self.link.show(self.pin, self.fields)
+        else:
+            self.fields = {}
+        if self.hardware is not None and self.hardware.record:
+            self.hardware.changes.append(PinChange(time.monotonic_ns(), self.name, self.pin, self.shown))
+
+    def update(self, fields):
+        self.fields.update(fields)
+        if self.shown:
+            self.link.show(self.pin, self.fields)
+
+
+################################################################################
+# Stand in for the M4 on a pty
+
+class FakeM4(object):
+
+    def __init__(self, lose_acks=0, width=None, height=None):
+        from ltb_render import Framebuffer, PANEL_WIDTH, PANEL_HEIGHT     # ltb_render.py imports this module
+        self.master, self.slave = os.openpty()
+        self.device = os.ttyname(self.slave)    # Path the link opens
+        self.lose_acks = lose_acks      # Leave out every n-th ACK, 0 for none
+        self.decoder = FrameDecoder()
+        self.screen = None
+        self.fields = {}
+        self.last = None                # (seq, payload) last shown
+        self.panel = Framebuffer(width or PANEL_WIDTH, height or PANEL_HEIGHT)     # What CMD_DRAW drew
+        self.redraws = 0
+        self.full_refreshes = 0
+        self.partial_refreshes = 0
+        self.repeats = 0                # Frames sent again after a lost ACK, acknowledged without a redraw
+        self.frames = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='fake-m4', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            for frame in self.decoder.feed(data):
+                if frame.command in (CMD_SHOW, CMD_DRAW, CMD_REFRESH):
+                    self.received(frame)
+
+    def received(self, frame):
+        self.frames += 1
+        if (frame.seq, frame.payload) == self.last:
+            self.repeats += 1
+        else:
+            self.last = (frame.seq, frame.payload)
+            if frame.command == CMD_SHOW:
+                self.screen, self.fields = decode_show(frame.payload)
+                self.redraws += 1
+            elif frame.command == CMD_DRAW:
+                self.panel.paste(RECT.unpack_from(frame.payload), frame.payload[RECT.size:])
+            elif frame.payload[0] == REFRESH_FULL:
+                self.full_refreshes += 1
+            else:
+                self.partial_refreshes += 1
+        if self.lose_acks and self.frames % self.lose_acks == 0:
+            return
+        os.write(self.master, encode_frame(frame.seq, CMD_ACK, bytes((frame.seq,))))
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def open_link(device, baudrate=115200, **options):
+    """DisplayLink on the serial port at device."""
+    import serial
+    return DisplayLink(serial.Serial(device, baudrate, timeout=ACK_TIMEOUT, write_timeout=1), **options)
+
+
+################################################################################
+
+def main():
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    m4 = FakeM4(lose_acks=5)
+    link = open_link(m4.device, ack_timeout=0.02)
+    for number in range(count):
+        link.show(SCREEN_IDS['track1_scrn'], {FIELD_TIME: '0:%02d:%02d' % divmod(number // 2, 60)})   # Every other one repeats
+        time.sleep(0.002)
+    link.close()
+    m4.close()
+    stats = link.stats()
+    print('%d commands: %d repeats dropped, %d pushed out of the queue, %d sent, %d resent, %d acked, %d failed'
+          % (count, stats['duplicates'], stats['dropped'], stats['sent'], stats['resent'], stats['acked'], stats['failed']))
+    print('M4: %d redraws, %d frames sent again without a redraw, %d CRC errors, shows %r'
+          % (m4.redraws, m4.repeats, m4.decoder.errors, m4.fields.get(FIELD_TIME)))
+    print('ACK latency:', stats['ack_latency'])
+
+
+if __name__ == '__main__':
+    main()
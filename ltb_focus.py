@@ -0,0 +1,192 @@
+# Little Time Buddy focus timer
+# Countdown for the "Focus Timer <n>" states: work and break phases for a number of rounds, with
+# pause and resume.
+#
+# The engine keeps the end of the current phase as an absolute monotonic deadline and arms a
+# single one shot timer for whichever comes first, the next change of the displayed time or the
+# end of the phase. The display counts down in steps of "tick" seconds (a minute by default, the
+# e-paper is not redrawn faster than that), so a running timer wakes the program once per tick
+# and once per phase change, and never polls. Each wakeup works out the next one from the
+# deadline, not from the time it fired, so late wakeups do not add up. A phase ends at the
+# previous phase's deadline plus its length for the same reason.
+#
+#   python3 ltb_focus.py        (wakeups per minute for a 25/5 x 4 plan, on a simulated clock)
+
+import math
+import time
+
+
+WORK = 0
+BREAK = 1
+PHASES = ('work', 'break')
+
+RUNNING = 0
+PAUSED = 1
+DONE = 2
+
+DISPLAY_TICK = 60               # Seconds per step of the displayed time left
+
+
+################################################################################
+# Engine
+
+class FocusEngine(object):
+
+    def __init__(self, settings, schedule, clock=time.monotonic, tick=DISPLAY_TICK, on_tick=None, on_work_done=None):
+        self.settings = settings        # ltb_profiles.FocusSettings, work and break in seconds and the rounds
+        self.schedule = schedule        # schedule(delay, callback) -> timer with "cancel", e.g. machine.scheduler.call_later
+        self.clock = clock
+        self.tick = tick
+        self.on_tick = on_tick          # on_tick(engine) whenever the displayed time changes, and on phase changes
+        self.on_work_done = on_work_done    # on_work_done(engine, seconds) when a work phase is completed
+        self.phase = WORK
+        self.round = 1
+        self.status = DONE
+        self.deadline = 0.0
+        self.left = 0.0                 # Seconds left in the phase while paused
+        self.paused_at = 0.0
+        self.timer = None
+        self.wakeups = 0
+        self.started = None             # Clock at start, for the wakeup rate
+
+    def start(self):
+        self.phase = WORK
+        self.round = 1
+        self.status = RUNNING
+        self.started = self.clock()
+        self.deadline = self.started + self.settings.work
+        self.display()
+        self.arm()
+
+    def stop(self):
+        self.disarm()
+        self.status = DONE
+
+    def pause(self):
+        if self.status == RUNNING:
+            self.disarm()
+            self.paused_at = self.clock()
+            self.left = max(0.0, self.deadline - self.paused_at)
+            self.status = PAUSED
+            self.display()
+
+    def resume(self):
+        if self.status == PAUSED:
+            self.deadline = self.clock() + self.left
+            self.status = RUNNING
+            self.display()
+            self.arm()
+
+    def toggle(self):
+        if self.status == RUNNING:
+            self.pause()
+        else:
+            self.resume()
+
+    def remaining(self):
+        """Seconds left in the current phase."""
+        if self.status == PAUSED:
+            return self.left
+        if self.status == DONE:
+            return 0.0
+        return max(0.0, self.deadline - self.clock())
+
+    def shown(self):
+        """Time left as displayed, in whole ticks rounded up."""
+        return math.ceil(self.remaining() / self.tick - 1e-9) * self.tick
+
+    def wakeups_per_minute(self):
+        minutes = (self.clock() - self.started) / 60 if self.started is not None else 0
+        return self.wakeups / minutes if minutes > 0 else 0.0
+
+    # Timer
+
+    def arm(self):
+        """One timer for the next display step or the end of the phase, whichever is first."""
+        remaining = self.deadline - self.clock()
+        steps = max(0, math.ceil(remaining / self.tick - 1e-9) - 1)     # Display steps still to come after the next change
+        self.timer = self.schedule(max(0.0, remaining - steps * self.tick), self.fire)
+
+    def disarm(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def fire(self):
+        self.timer = None
+        self.wakeups += 1
+        if self.clock() >= self.deadline:
+            self.end_phase()
+            if self.status != RUNNING:
+                return
+        else:
+            self.display()
+        self.arm()
+
+    def end_phase(self):
+        if self.phase == WORK:
+            if self.on_work_done is not None:
+                self.on_work_done(self, self.settings.work)
+            if self.round >= self.settings.rounds:
+                self.status = DONE
+                self.display()
+                return
+            if self.settings.rest > 0:
+                self.phase = BREAK
+                self.deadline += self.settings.rest
+                self.display()
+                return
+        self.phase = WORK
+        self.round += 1
+        self.deadline += self.settings.work
+        self.display()
+
+    def display(self):
+        if self.on_tick is not None:
+            self.on_tick(self)
+
+
+################################################################################
+# Simulated run
+
+class SimClock(object):
+    """Clock and schedule for running the engine without waiting, in the manner of ltb_scheduler.Scheduler."""
+
+    def __init__(self):
+        from ltb_scheduler import Scheduler
+        self.now = 0.0
+        self.scheduler = Scheduler(clock=lambda: self.now)
+
+    def __call__(self):
+        return self.now
+
+    def schedule(self, delay, callback):
+        return self.scheduler.call_later(delay, callback)
+
+    def run(self):
+        while True:
+            timeout = self.scheduler.next_timeout()
+            if timeout is None:
+                return
+            self.now += timeout
+            self.scheduler.run_due()
+
+
+def main():
+    from ltb_profiles import FocusSettings
+
+    settings = FocusSettings(25 * 60, 5 * 60, 4)
+    for tick in (1, DISPLAY_TICK):
+        clock = SimClock()
+        completed = []
+        engine = FocusEngine(settings, clock.schedule, clock, tick, on_work_done=lambda engine, seconds: completed.append(seconds))
+        engine.start()
+        clock.run()
+        minutes = clock.now / 60
+        print('tick %2d s: %d min, %d wakeups, %.2f per minute, %d work intervals completed'
+              % (tick, minutes, engine.wakeups, engine.wakeups / minutes, len(completed)))
+    print('polling every second: 60.00 per minute')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# Little Time Buddy hardware layer
+# The buttons and screen select pins behind one interface, so the state machine runs with or
+# without a Pi.
+#
+#   gpio  gpiozero on the real pins (the default on the Pi)
+#   mock  gpiozero with its MockFactory, the gpiozero code paths run but no pins are touched
+#   sim   an in-process simulator, needs neither a Pi nor gpiozero
+#
+# Every output change can be recorded with a monotonic timestamp, and "ScriptedPresses" plays a
+# list of button presses into the inputs from a thread, so whole flows run headless in CI.
+
+import threading
+import time
+from collections import namedtuple
+
+
+BACKENDS = ('gpio', 'mock', 'sim')
+
+PinChange = namedtuple('PinChange', ['timestamp_ns', 'name', 'pin', 'value'])
+
+
+################################################################################
+# Simulator devices, the parts of gpiozero.Button and DigitalOutputDevice the scripts use
+
+class SimButton(object):
+
+    def __init__(self, pin, pull_up=True):
+        self.pin = pin
+        self.pull_up = pull_up
+        self.is_pressed = False
+        self.when_pressed = None
+        self.when_released = None
+
+    def drive(self, pressed):
+        """Called by the press script, runs the callbacks in the calling thread like gpiozero's pin thread does."""
+        if pressed == self.is_pressed:
+            return
+        self.is_pressed = pressed
+        callback = self.when_pressed if pressed else self.when_released
+        if callback is not None:
+            callback()
+
+
+class SimOutput(object):
+
+    def __init__(self, pin, active_high=True, initial_value=False):
+        self.pin = pin
+        self.active_high = active_high
+        self.value = initial_value
+
+    def close(self):
+        pass
+
+
+################################################################################
+# Hardware
+
+class Output(object):
+    """A screen select pin, "value" is written through to the device and recorded if enabled."""
+
+    def __init__(self, hardware, device, name, pin):
+        self.hardware = hardware
+        self.device = device
+        self.name = name
+        self.pin = pin
+
+    @property
+    def value(self):
+        return self.device.value
+
+    @value.setter
+    def value(self, value):
+        self.device.value = value
+        if self.hardware.record:
+            self.hardware.changes.append(PinChange(time.monotonic_ns(), self.name, self.pin, bool(value)))
+
+    def update(self, fields):
+        """A pin carries no fields, only the screens shown over the serial link do (see ltb_display.py)."""
+
+
+class Hardware(object):
+
+    def __init__(self, backend='gpio', record=False):
+        if backend not in BACKENDS:
+            raise ValueError('unknown hardware backend %r, one of %s' % (backend, ', '.join(BACKENDS)))
+        self.backend = backend
+        self.record = record
+        self.changes = []               # PinChange for every output write while recording
+        self.buttons = {}               # pin number -> button device
+        self.outputs = {}               # name -> Output
+        self.factory = None
+
+        if backend == 'mock':
+            from gpiozero import Device
+            from gpiozero.pins.mock import MockFactory
+            self.factory = Device.pin_factory = MockFactory()
+
+    def button(self, pin, pull_up=True):
+        if self.backend == 'sim':
+            device = SimButton(pin, pull_up)
+        else:
+            import gpiozero
+            device = gpiozero.Button(pin, pull_up=pull_up)
+        self.buttons[pin] = device
+        return device
+
+    def output(self, pin, name, active_high=True, initial_value=False):
+        if self.backend == 'sim':
+            device = SimOutput(pin, active_high, initial_value)
+        else:
+            import gpiozero
+            device = gpiozero.DigitalOutputDevice(pin, active_high=active_high, initial_value=initial_value)
+        output = self.outputs[name] = Output(self, device, name, pin)
+        return output
+
+    def drive(self, pin, pressed):
+        """Press or release the button on pin, for the mock and sim backends."""
+        button = self.buttons[pin]
+        if self.backend == 'sim':
+            button.drive(pressed)
+        elif self.backend == 'mock':
+            mock_pin = self.factory.pin(pin)
+            if pressed != button.pull_up:
+                mock_pin.drive_high()
+            else:
+                mock_pin.drive_low()
+        else:
+            raise RuntimeError('buttons on real pins are pressed by hand')
+
+    def press(self, pin, length=0.01):
+        self.drive(pin, True)
+        time.sleep(length)
+        self.drive(pin, False)
+
+    def active_outputs(self):
+        return [name for name, output in self.outputs.items() if output.value]
+
+
+################################################################################
+# Scripted input
+
+def parse_script(text):
+    """[(delay, switch)] from "1,1,1,2" or "1,1@4,1,2", a press waits delay seconds after the one before."""
+    presses = []
+    for item in text.split(','):
+        item = item.strip()
+        if item:
+            switch, _, delay = item.partition('@')
+            presses.append((float(delay) if delay else None, int(switch)))
+    return presses
+
+
+class ScriptedPresses(threading.Thread):
+    """Plays presses into the hardware, then calls "done" (for example sending SIGINT to stop the run)."""
+
+    def __init__(self, hardware, presses, switch_pins, interval=1.0, start_delay=1.0, settle=1.0, done=None):
+        super().__init__(name='ltb-script', daemon=True)
+        self.hardware = hardware
+        self.presses = presses
+        self.switch_pins = switch_pins      # switch number -> pin
+        self.interval = interval            # Delay for presses without their own
+        self.start_delay = start_delay
+        self.settle = settle                # Wait after the last press before "done"
+        self.done = done
+        self.pressed_ns = []                # Time of each press, to line up with the recorded outputs
+
+    def run(self):
+        for number, (delay, switch) in enumerate(self.presses):
+            if delay is None:
+                delay = self.interval if number else self.start_delay
+            time.sleep(delay)
+            self.pressed_ns.append(time.monotonic_ns())
+            self.hardware.press(self.switch_pins[switch])
+        time.sleep(self.settle)
+        if self.done is not None:
+            self.done()
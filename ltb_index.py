@@ -0,0 +1,176 @@
+# Little Time Buddy session index
+# Optional SQLite database next to the spreadsheet for answering questions about tracked time.
+#
+# The database runs in WAL mode. "sessions" has indexes on start time, (task, start) and duration,
+# and "daily" keeps one running total per local day and task that is updated with every insert.
+# "Total today" and "this week per task" read a handful of "daily" rows through the primary key,
+# "longest session" is one step down the duration index. Nothing re-reads Tracking_1.csv.
+#
+#   python3 ltb_index.py import sessions.db Tracking_1.csv
+#   python3 ltb_index.py report sessions.db
+
+import sqlite3
+import sys
+import time
+
+from ltb_logformat import read_tracking_csv
+from ltb_store import SessionRecord, read_records
+
+
+DAY = 86400
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    utc_offset INTEGER NOT NULL,
+    task INTEGER NOT NULL,
+    duration INTEGER NOT NULL,
+    note INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (start, task)
+);
+CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start);
+CREATE INDEX IF NOT EXISTS sessions_task_start ON sessions (task, start);
+CREATE INDEX IF NOT EXISTS sessions_duration ON sessions (duration);
+CREATE TABLE IF NOT EXISTS daily (
+    day INTEGER NOT NULL,
+    task INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (day, task)
+) WITHOUT ROWID;
+'''
+
+
+################################################################################
+# Support functions
+
+def local_day(epoch, utc_offset):
+    """Day number (days since 1970-01-01) of epoch in the zone the session was recorded in."""
+    return (epoch + utc_offset) // DAY
+
+
+def day_parts(record):
+    """(day, seconds) for every local day a session covers, a session past midnight is split."""
+    start = record.start + record.utc_offset
+    end = record.end + record.utc_offset
+    while start < end:
+        day = start // DAY
+        boundary = (day + 1) * DAY
+        yield day, min(end, boundary) - start
+        start = boundary
+
+
+def today(now=None):
+    now = time.time() if now is None else now
+    return local_day(int(now), time.localtime(now).tm_gmtoff)
+
+
+def week_start(day):
+    """Monday of the week containing day, 1970-01-01 was a Thursday."""
+    return day - (day + 3) % 7
+
+
+################################################################################
+# Index
+
+class SessionIndex(object):
+
+    def __init__(self, path):
+        # Created on the main thread, used from the writer thread afterwards
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')    # Safe in WAL mode, syncs at checkpoints only
+        self.db.executescript(SCHEMA)
+
+    def add(self, record, commit=True):
+        """Index one session, a session already present (same start and task) is ignored."""
+        cursor = self.db.execute(
+            'INSERT OR IGNORE INTO sessions (start, end, utc_offset, task, duration, note) VALUES (?, ?, ?, ?, ?, ?)',
+            (record.start, record.end, record.utc_offset, record.task, record.end - record.start, record.note))
+        if cursor.rowcount:
+            self.db.executemany(
+                'INSERT INTO daily (day, task, total) VALUES (?, ?, ?) '
+                'ON CONFLICT (day, task) DO UPDATE SET total = total + excluded.total',
+                [(day, record.task, seconds) for day, seconds in day_parts(record)])
+        if commit:
+            self.db.commit()
+        return cursor.rowcount
+
+    def import_records(self, records):
+        """Bulk import in one transaction, returns how many new sessions were added."""
+        added = 0
+        with self.db:
+            for record in records:
+                added += self.add(record, commit=False)
+        return added
+
+    def import_csv(self, path):
+        return self.import_records(read_tracking_csv(path))
+
+    def import_store(self, path):
+        return self.import_records(read_records(path))
+
+    # Queries
+
+    def total_for_day(self, day):
+        row = self.db.execute('SELECT COALESCE(SUM(total), 0) FROM daily WHERE day = ?', (day,)).fetchone()
+        return row[0]
+
+    def totals_per_task(self, first_day, last_day):
+        """{task: seconds} between two day numbers, both included."""
+        rows = self.db.execute('SELECT task, SUM(total) FROM daily WHERE day BETWEEN ? AND ? GROUP BY task',
+                               (first_day, last_day))
+        return dict(rows.fetchall())
+
+    def week_per_task(self, day):
+        first = week_start(day)
+        return self.totals_per_task(first, first + 6)
+
+    def longest(self, task=None):
+        """The longest session, of one task if given."""
+        if task is None:
+            row = self.db.execute('SELECT start, end, utc_offset, note, task FROM sessions ORDER BY duration DESC LIMIT 1')
+        else:
+            row = self.db.execute('SELECT start, end, utc_offset, note, task FROM sessions WHERE task = ? '
+                                  'ORDER BY duration DESC LIMIT 1', (task,))
+        row = row.fetchone()
+        return SessionRecord._make(row) if row else None
+
+    def sessions_between(self, start, end):
+        """Sessions that started in [start, end), through the start time index."""
+        rows = self.db.execute('SELECT start, end, utc_offset, note, task FROM sessions WHERE start >= ? AND start < ? '
+                               'ORDER BY start', (start, end))
+        return [SessionRecord._make(row) for row in rows]
+
+    def close(self):
+        self.db.close()
+
+
+################################################################################
+
+def main(argv):
+    if len(argv) >= 4 and argv[1] == 'import':
+        index = SessionIndex(argv[2])
+        for path in argv[3:]:
+            if path.endswith('.ltb'):
+                added = index.import_store(path)
+            else:
+                added = index.import_csv(path)
+            print('%s: %d new sessions' % (path, added))
+        index.close()
+    elif len(argv) == 3 and argv[1] == 'report':
+        index = SessionIndex(argv[2])
+        day = today()
+        print('Today: %d s' % index.total_for_day(day))
+        print('This week per task:', index.week_per_task(day))
+        print('Longest session:', index.longest())
+        index.close()
+    else:
+        print('usage: ltb_index.py import DB FILE... | report DB')
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
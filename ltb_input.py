@@ -0,0 +1,70 @@
+# Little Time Buddy input engine
+# Event driven button handling for the state machine.
+#
+# gpiozero calls "when_pressed"/"when_released" from its own pin thread the moment an edge is seen.
+# Each edge is timestamped and pushed into a queue, the state machine blocks on that queue so an
+# idle device does no work at all and a press is dispatched as soon as it arrives.
+
+import queue
+import time
+from collections import namedtuple
+
+
+################################################################################
+# Event codes
+
+SWITCH_1 = 1
+SWITCH_2 = 2
+
+PRESSED = 1
+RELEASED = 0
+
+# timestamp_ns is taken from time.monotonic_ns() inside the edge callback
+ButtonEvent = namedtuple('ButtonEvent', ['timestamp_ns', 'switch', 'edge'])
+
+
+################################################################################
+# Input engine
+
+class InputEngine(object):
+
+    def __init__(self, switch_1, switch_2, debounce=0.05, maxsize=64):
+        # debounce replaces the fixed pause that used to sit in "StateMachine.pressed",
+        # presses of the same switch closer together than this are treated as contact bounce
+        self.events = queue.Queue(maxsize)
+        self.debounce_ns = int(debounce * 1e9)
+        self.last_press_ns = {SWITCH_1: 0, SWITCH_2: 0}
+        self.dropped = 0
+        self.sink = None        # Optional callable that receives events instead of the queue, used by the asyncio runtime
+
+        self.attach(switch_1, SWITCH_1)
+        self.attach(switch_2, SWITCH_2)
+
+    def attach(self, button, switch):
+        button.when_pressed = lambda: self.edge(switch, PRESSED)
+        button.when_released = lambda: self.edge(switch, RELEASED)
+
+    def edge(self, switch, edge):
+        """Called from the gpiozero pin thread, keep it short."""
+        now = time.monotonic_ns()
+        if edge == PRESSED:
+            if now - self.last_press_ns[switch] < self.debounce_ns:
+                return
+            self.last_press_ns[switch] = now
+        if self.sink is not None:
+            self.sink(ButtonEvent(now, switch, edge))
+            return
+        try:
+            self.events.put_nowait(ButtonEvent(now, switch, edge))
+        except queue.Full:
+            self.dropped += 1       # Nobody is draining the queue, never block the pin thread
+
+    def get(self, timeout=None):
+        """Block until the next button event, None if the timeout runs out first."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def pending(self):
+        return not self.events.empty()
@@ -0,0 +1,113 @@
+# Little Time Buddy session journal
+# Group commit writer for the tracking spreadsheet.
+#
+# The file is opened once and kept open. Rows are built in memory and only complete rows are
+# written, several rows at a time in one write() call. How often the data is forced to the SD card
+# is the fsync policy:
+#   FSYNC_ROW       write and fsync every row as soon as it is appended
+#   FSYNC_INTERVAL  write and fsync at most every "interval_ms", armed on the scheduler
+#   FSYNC_IDLE      write and fsync when the state machine has no more input to handle
+# A group is also committed as soon as "group_size" rows are waiting.
+
+import os
+
+
+FSYNC_ROW = 'row'
+FSYNC_INTERVAL = 'interval'
+FSYNC_IDLE = 'idle'
+
+ROW_END = '\r\n'                # Same line ending the spreadsheet has always used
+
+
+################################################################################
+# Support functions
+
+def format_row(fields):
+    """One spreadsheet row from a list of field values."""
+    return ','.join(str(field) for field in fields) + ROW_END
+
+
+################################################################################
+# Journal
+
+class SessionJournal(object):
+
+    def __init__(self, path, fsync_policy=FSYNC_IDLE, interval_ms=1000, group_size=16, header=None, scheduler=None):
+        if fsync_policy not in (FSYNC_ROW, FSYNC_INTERVAL, FSYNC_IDLE):
+            raise ValueError('unknown fsync policy %r' % (fsync_policy,))
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.interval = interval_ms / 1000.0
+        self.group_size = group_size
+        self.scheduler = scheduler          # Needed for FSYNC_INTERVAL, anything with "call_later"
+        self.commit_timer = None
+
+        self.pending = []                   # Encoded rows waiting for the next commit
+
+        # Counters, read by the benchmark and the instrumentation
+        self.rows = 0
+        self.commits = 0
+        self.writes = 0
+        self.fsyncs = 0
+        self.bytes_written = 0
+
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if header is not None and os.fstat(self.fd).st_size == 0:
+            self.append_row(header)
+            self.commit()
+
+    def append_row(self, fields):
+        """Queue one complete row, commits according to the fsync policy."""
+        self.rows += 1
+        self.append_text(format_row(fields))
+
+    def append_text(self, text):
+        """Queue raw text, for the older scripts that write a row in several pieces."""
+        self.pending.append(text.encode())
+        if self.fsync_policy == FSYNC_ROW or len(self.pending) >= self.group_size:
+            self.commit()
+        elif self.fsync_policy == FSYNC_INTERVAL and self.commit_timer is None:
+            if self.scheduler is None:
+                self.commit()
+            else:
+                self.commit_timer = self.scheduler.call_later(self.interval, self.commit)
+
+    def idle(self):
+        """Called when there is no more input waiting, commits under FSYNC_IDLE."""
+        if self.pending and self.fsync_policy == FSYNC_IDLE:
+            self.commit()
+
+    def commit(self, sync=True):
+        """Write every pending row with a single write() and fsync it."""
+        if self.commit_timer is not None:
+            self.commit_timer.cancel()
+            self.commit_timer = None
+        if not self.pending:
+            return
+        data = b''.join(self.pending)
+        self.pending = []
+        view = memoryview(data)
+        while view:                         # os.write may be partial on a full card
+            written = os.write(self.fd, view)
+            self.writes += 1
+            view = view[written:]
+        self.bytes_written += len(data)
+        if sync:
+            os.fsync(self.fd)
+            self.fsyncs += 1
+        self.commits += 1
+
+    def close(self):
+        if self.fd is not None:
+            self.commit()
+            os.close(self.fd)
+            self.fd = None
+
+    def stats(self):
+        return {
+            'rows': self.rows,
+            'commits': self.commits,
+            'writes': self.writes,
+            'fsyncs': self.fsyncs,
+            'bytes': self.bytes_written,
+        }
@@ -0,0 +1,150 @@
+# Little Time Buddy log formats
+# Parsers that turn the spreadsheet rows written by the scripts back into session records.
+#
+# Tracking_1.csv (LTB_Release_Rev0.py):
+#   zone,YYYY-MM-DD_H:M:S,zone,YYYY-MM-DD_H:M:S,H:M:SS,voice note
+# The zone is either a tzname() string such as "PDT" or a numeric "UTC-07:00" (ltb_store.py export).
+#
+# stamp.csv (Integrated_SM_Rev1.py and Test_Pi_SM_TimeCalcs.py):
+#   M/D/YYYY, H:MM:SS, H:MM:SS, Delta Formula, Speech to text voice note
+#   M/D/YYYY, H:MM:SS, H:MM:SS, dH:dMM:dSS, 'Speech to text voice note'
+# The second form has a delta computed field by field, which goes negative; it is recomputed from
+# the in and out times, and an out time before the in time means the session crossed midnight.
+#
+# The scripts write a row in pieces and never ended it when no voice note was recorded, so one line
+# can hold several sessions back to back. The parsers walk the fields instead of trusting the line.
+
+import calendar
+import csv
+import time
+
+from ltb_store import SessionRecord, NOTE_NONE, NOTE_PLACEHOLDER
+
+
+TRACKING_TASK = 1               # Task id of rows from the "Tracking1" state
+
+
+################################################################################
+# Support functions
+
+def parse_offset(zone):
+    """Seconds east of UTC for "UTC+HH:MM", None for a zone name."""
+    if not zone.startswith('UTC') or len(zone) < 9:
+        return None
+    sign = -1 if zone[3] == '-' else 1
+    return sign * (int(zone[4:6]) * 3600 + int(zone[7:9]) * 60)
+
+
+def parse_stamp(stamp):
+    """(year, month, day, hour, minute, second) from "YYYY-MM-DD_H:M:S", None if it is not a stamp."""
+    day, sep, clock = stamp.partition('_')
+    if not sep:
+        return None
+    try:
+        year, month, mday = (int(part) for part in day.split('-'))
+        hour, minute, second = (int(part) for part in clock.split(':'))
+    except ValueError:
+        return None
+    return (year, month, mday, hour, minute, second)
+
+
+def to_epoch(fields, offset):
+    """(epoch, offset) for local wall clock fields. Without a numeric offset the Pi's own zone is used."""
+    if offset is None:
+        epoch = int(time.mktime(fields + (0, 0, -1)))
+        return epoch, time.localtime(epoch).tm_gmtoff
+    return calendar.timegm(fields + (0, 0, 0)) - offset, offset
+
+
+def parse_clock(text):
+    """(hour, minute, second) from "H:MM:SS", None unless all three are non-negative numbers."""
+    parts = text.split(':')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+    return tuple(int(part) for part in parts)
+
+
+def parse_us_date(text):
+    """(year, month, day) from "M/D/YYYY", None if it is not a date."""
+    parts = text.split('/')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+    month, day, year = (int(part) for part in parts)
+    return (year, month, day)
+
+
+def note_ref(text):
+    return NOTE_PLACEHOLDER if text.strip() else NOTE_NONE
+
+
+################################################################################
+# Tracking_1.csv
+
+def parse_tracking_fields(fields, task=TRACKING_TASK):
+    """Sessions in one line of Tracking_1.csv, skipping anything that does not parse."""
+    fields = [field.strip() for field in fields]
+    i = 0
+    while i + 5 <= len(fields):
+        stamp_in = parse_stamp(fields[i + 1])
+        stamp_out = parse_stamp(fields[i + 3])
+        if stamp_in is None or stamp_out is None:
+            i += 1                  # Header or a damaged fragment, resynchronise on the next field
+            continue
+        start, offset = to_epoch(stamp_in, parse_offset(fields[i]))
+        end, _ = to_epoch(stamp_out, parse_offset(fields[i + 2]))
+        i += 5
+        note = ''
+        if i < len(fields) and (i + 1 >= len(fields) or parse_stamp(fields[i + 1]) is None):
+            note = fields[i]        # The voice note column, unless it is the zone of the next session
+            i += 1
+        yield SessionRecord(start, end, offset, note_ref(note), task)
+
+
+def read_tracking_csv(path, task=TRACKING_TASK):
+    """Every session in a Tracking_1.csv file, one line in memory at a time."""
+    with open(path, newline='') as f:
+        for fields in csv.reader(f):
+            yield from parse_tracking_fields(fields, task)
+
+
+################################################################################
+# stamp.csv
+
+def parse_stamp_fields(fields, task=TRACKING_TASK):
+    """Sessions in one line of stamp.csv, in either the Rev1 or the delta form."""
+    fields = [field.strip() for field in fields]
+    i = 0
+    count = len(fields)
+    while i + 3 <= count:
+        day = parse_us_date(fields[i])
+        clock_in = parse_clock(fields[i + 1]) if day else None
+        clock_out = parse_clock(fields[i + 2]) if clock_in else None
+        if clock_out is None:
+            i += 1                  # Header, a session that never stopped, or a damaged fragment
+            continue
+        start, offset = to_epoch(day + clock_in, None)
+        end, _ = to_epoch(day + clock_out, None)
+        if end < start:
+            end += 86400            # Stopped after midnight
+        i += 3
+        note = ''
+        if i < count and parse_us_date(fields[i]) is None:
+            i += 1                  # "Delta Formula" or the field by field delta
+            if i < count and parse_us_date(fields[i]) is None:
+                note = fields[i]
+                i += 1
+        yield SessionRecord(start, end, offset, note_ref(note), task)
+
+
+################################################################################
+# Any of the formats
+
+def parse_fields(fields, task=TRACKING_TASK):
+    """Sessions in one line of any of the logs, the format is picked from the first field."""
+    for field in fields:
+        field = field.strip()
+        if field:
+            if field == 'Date' or parse_us_date(field):
+                return parse_stamp_fields(fields, task)
+            return parse_tracking_fields(fields, task)
+    return iter(())
@@ -0,0 +1,227 @@
+# Little Time Buddy metrics
+# Per state timings for the state machine, kept in fixed-bucket histograms.
+#
+# Every histogram has the same bucket bounds (1, 2, 5 steps from 1 us to 1 hour) and all of them
+# live in one array allocated up front, so recording a sample is a bisect over the bounds and two
+# array increments: no allocation and no locking on the state machine thread. Recorded are the
+# time spent in each state's "exit", "enter" and "pressed" (which includes any transition the press
+# starts), how long each state was active (from its own enter to its own exit, so a parent state
+# keeps counting while its children come and go), transitions per (from, to) edge, taken from
+# "go_to_state" so entering a child inside its parent is not an edge of its own, and the background
+# writer's job and commit times.
+#
+# Nothing is timed until "instrument_machine" wraps the states' methods, so with metrics off the
+# state machine runs exactly the code it always did.
+#
+# The numbers are read in the Prometheus text format, either from a file rewritten every few
+# seconds (for node_exporter's textfile collector) or from a Unix socket:
+#
+#   socat - UNIX-CONNECT:/tmp/ltb-metrics.sock
+
+import inspect
+import os
+import socket
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from ltb_checkpoint import atomic_write
+
+
+# Upper bounds of the buckets in nanoseconds, the last bucket is everything above
+BOUNDS = tuple(step * 10 ** exponent for exponent in range(3, 12) for step in (1, 2, 5)) + (10 ** 12, 3600 * 10 ** 9)
+BUCKETS = len(BOUNDS) + 1
+
+# Histograms kept for every state
+EXIT = 0
+ENTER = 1
+PRESSED = 2
+DWELL = 3
+STATE_KINDS = ('exit', 'enter', 'pressed', 'dwell')
+
+# Histograms of the writer thread
+WRITE = 0
+COMMIT = 1
+WRITER_KINDS = ('job', 'commit')
+
+
+################################################################################
+# Histograms
+
+class StateMetrics(object):
+
+    def __init__(self, state_names):
+        self.names = list(state_names)
+        self.ids = {name: number for number, name in enumerate(self.names)}
+        count = len(self.names)
+        histograms = count * len(STATE_KINDS) + len(WRITER_KINDS)
+        self.counts = array('Q', bytes(8 * histograms * BUCKETS))
+        self.sums = array('Q', bytes(8 * histograms))
+        self.edges = array('Q', bytes(8 * count * count))        # transitions, from * count + to
+        self.writer_base = count * len(STATE_KINDS)
+        self.entered_ns = array('q', bytes(8 * count))     # When each active state was entered, 0 while it is not
+
+    def record(self, histogram, nanoseconds):
+        self.counts[histogram * BUCKETS + bisect_left(BOUNDS, nanoseconds)] += 1
+        self.sums[histogram] += nanoseconds
+
+    def transition(self, from_id, to_id):
+        self.edges[from_id * len(self.names) + to_id] += 1
+
+    # Called on the writer thread
+
+    def write(self, nanoseconds):
+        self.record(self.writer_base + WRITE, nanoseconds)
+
+    def commit(self, nanoseconds):
+        self.record(self.writer_base + COMMIT, nanoseconds)
+
+    # Prometheus text format
+
+    def histogram_lines(self, metric, histogram, labels, counts, sums):
+        cumulative = 0
+        base = histogram * BUCKETS
+        for bucket, bound in enumerate(BOUNDS):
+            cumulative += counts[base + bucket]
+            yield '%s_bucket{%s,le="%g"} %d' % (metric, labels, bound / 1e9, cumulative)
+        cumulative += counts[base + len(BOUNDS)]
+        yield '%s_bucket{%s,le="+Inf"} %d' % (metric, labels, cumulative)
+        yield '%s_sum{%s} %.9f' % (metric, labels, sums[histogram] / 1e9)
+        yield '%s_count{%s} %d' % (metric, labels, cumulative)
+
+    def exposition(self):
+        # Copies first, the state machine keeps counting while the text is built
+        counts, sums, edges = array('Q', self.counts), array('Q', self.sums), array('Q', self.edges)
+        lines = ['# TYPE ltb_state_seconds histogram']
+        for state_id, name in enumerate(self.names):
+            for kind in (EXIT, ENTER, PRESSED):
+                lines.extend(self.histogram_lines('ltb_state_seconds', state_id * len(STATE_KINDS) + kind,
+                                                  'state="%s",phase="%s"' % (name, STATE_KINDS[kind]), counts, sums))
+        lines.append('# TYPE ltb_state_dwell_seconds histogram')
+        for state_id, name in enumerate(self.names):
+            lines.extend(self.histogram_lines('ltb_state_dwell_seconds', state_id * len(STATE_KINDS) + DWELL,
+                                              'state="%s"' % name, counts, sums))
+        lines.append('# TYPE ltb_transitions_total counter')
+        count = len(self.names)
+        for edge, total in enumerate(edges):
+            if total:
+                lines.append('ltb_transitions_total{from="%s",to="%s"} %d' % (self.names[edge // count],
+                                                                              self.names[edge % count], total))
+        lines.append('# TYPE ltb_writer_seconds histogram')
+        for kind, name in enumerate(WRITER_KINDS):
+            lines.extend(self.histogram_lines('ltb_writer_seconds', self.writer_base + kind, 'kind="%s"' % name,
+                                              counts, sums))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        atomic_write(path, self.exposition().encode())
+
+
+################################################################################
+# Instrumentation
+
+def instrument_state(state, metrics):
+    """Replaces enter, exit and pressed on the state object with timed versions."""
+    clock = time.perf_counter_ns
+    record = metrics.record
+    state_id = metrics.ids[state.name]
+    base = state_id * len(STATE_KINDS)
+    enter, exit, pressed = state.enter, state.exit, state.pressed
+
+    def timed_enter(machine):
+        start = clock()
+        metrics.entered_ns[state_id] = start
+        enter(machine)
+        record(base + ENTER, clock() - start)
+
+    def timed_exit(machine):
+        start = clock()
+        if metrics.entered_ns[state_id]:
+            record(base + DWELL, start - metrics.entered_ns[state_id])
+            metrics.entered_ns[state_id] = 0
+        exit(machine)
+        record(base + EXIT, clock() - start)
+
+    def timed_pressed(machine):
+        start = clock()
+        pressed(machine)
+        record(base + PRESSED, clock() - start)
+
+    state.enter, state.exit, state.pressed = timed_enter, timed_exit, timed_pressed
+
+
+def instrument_transitions(machine, metrics):
+    """Replaces go_to_state on machine with one counting the (current state, target) edge."""
+    go_to_state = machine.go_to_state
+
+    def edge(source, target):
+        if source is not None:
+            metrics.transition(metrics.ids[source.name], metrics.ids[target])
+
+    if inspect.iscoroutinefunction(go_to_state):        # ltb_async.AsyncStateMachine
+        async def counted_go_to_state(state_name, path=None):
+            source = machine.state
+            await go_to_state(state_name, path)
+            edge(source, state_name)
+    else:
+        def counted_go_to_state(state_name, path=None):
+            source = machine.state
+            go_to_state(state_name, path)
+            edge(source, state_name)
+
+    machine.go_to_state = counted_go_to_state
+
+
+def instrument_machine(machine, writer=None):
+    """Times every state of machine, and the jobs and commits of writer if given. Returns the StateMetrics."""
+    metrics = StateMetrics(machine.states)
+    for state in machine.states.values():
+        instrument_state(getattr(state, 'state', state), metrics)     # The sync state inside a SyncStateAdapter
+    instrument_transitions(machine, metrics)
+    if writer is not None:
+        writer.write_observer = metrics.write
+        writer.idle_observer = metrics.commit
+    return metrics
+
+
+################################################################################
+# Unix socket, every connection gets the current exposition and is closed
+
+class MetricsSocket(object):
+
+    def __init__(self, path, metrics):
+        self.path = path
+        self.metrics = metrics
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(4)
+        self.thread = threading.Thread(target=self.serve, name='ltb-metrics', daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except OSError:
+                return                  # Closed
+            with connection:
+                try:
+                    connection.sendall(self.metrics.exposition().encode())
+                except OSError:
+                    pass
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)    # Wakes the blocked accept
+        except OSError:
+            pass
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,143 @@
+# Little Time Buddy profiles
+# The profiles shown on the device, read from a JSON file instead of one class per profile.
+#
+#   {"profiles": [
+#       {"name": "Profile 1", "tasks": [1, 2], "focus": {"work": 1500, "break": 300, "rounds": 4}},
+#       {"name": "Profile 2"}
+#   ]}
+#
+# Each profile lists the task ids it tracks (ltb_tasks.py) and its focus timer settings in
+# seconds, and may name the screen pin it raises ("screen"). A profile without tasks or without a
+# focus timer has no such state, its button goes back to "Home". The states of the n-th profile
+# are called after it: its own name, "Tracking<n>" and "Focus Timer <n>".
+#
+# The list is checked at start up ("ProfileRegistry.check"): a state name used twice, by two
+# profiles or by a profile and one of the fixed states ("Home", ...), a screen that does not exist
+# or a task id missing from the task table is a ValueError then, not a wrong screen, a KeyError or
+# the wrong task tracked when the profile is first opened.
+#
+# Only the profile list is read at start up. The machine holds a LazyState for every state of a
+# profile, and the real state object is made the first time it is used and kept from then on, so
+# profiles that are never opened cost one small object each.
+
+import json
+from collections import namedtuple
+
+
+FocusSettings = namedtuple('FocusSettings', ['work', 'rest', 'rounds'])
+
+
+class ProfileSpec(namedtuple('ProfileSpec', ['name', 'number', 'screen', 'tasks', 'focus'])):
+    __slots__ = ()
+
+    @property
+    def tracking(self):
+        return 'Tracking%d' % self.number
+
+    @property
+    def focus_timer(self):
+        return 'Focus Timer %d' % self.number
+
+
+################################################################################
+# Profile file
+
+def parse_focus(entry):
+    if entry is None:
+        return None
+    return FocusSettings(int(entry['work']), int(entry.get('break', 0)), int(entry.get('rounds', 1)))
+
+
+def parse_profiles(data):
+    """[ProfileSpec] from the decoded JSON of a profile file, numbered from 1 in file order."""
+    return [ProfileSpec(str(entry['name']), number, entry.get('screen'), tuple(int(task) for task in entry.get('tasks', ())),
+                        parse_focus(entry.get('focus')))
+            for number, entry in enumerate(data['profiles'], 1)]
+
+
+def load_profiles(path, default):
+    """ProfileRegistry from the profile file at path, from default (the same layout, decoded) if there is no file."""
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(f.read())
+    except FileNotFoundError:
+        data = default
+    return ProfileRegistry(parse_profiles(data))
+
+
+################################################################################
+# Registry
+
+class ProfileRegistry(object):
+
+    def __init__(self, specs):
+        self.specs = list(specs)
+        self.by_name = {}
+        for spec in self.specs:
+            if spec.name in self.by_name:
+                raise ValueError('profile %r defined twice' % spec.name)
+            self.by_name[spec.name] = spec
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+    def state_names(self, spec):
+        """Names of the states made for spec, the profile's own first."""
+        return [spec.name] + ([spec.tracking] if spec.tasks else []) + ([spec.focus_timer] if spec.focus else [])
+
+    def check(self, reserved, screens, tasks):
+        """Raises ValueError, naming every problem, if a profile state takes the name of one in reserved or of another
+        profile's state, or a profile names a screen that is not in screens or a task that is not in tasks."""
+        problems = []
+        taken = dict.fromkeys(reserved, 'a fixed state')
+        for spec in self.specs:
+            for name in self.state_names(spec):
+                if name in taken:
+                    problems.append('profile %r: state %r is already %s' % (spec.name, name, taken[name]))
+                else:
+                    taken[name] = 'a state of profile %r' % spec.name
+            if spec.screen is not None and spec.screen not in screens:
+                problems.append('profile %r: unknown screen %r' % (spec.name, spec.screen))
+            unknown = [task for task in spec.tasks if task not in tasks]
+            if unknown:
+                problems.append('profile %r: unknown task %s' % (spec.name, ', '.join(str(task) for task in unknown)))
+        if problems:
+            raise ValueError('profiles: ' + '; '.join(problems))
+
+    def for_task(self, task_id):
+        """The first profile tracking task_id, None if no profile lists it."""
+        for spec in self.specs:
+            if task_id in spec.tasks:
+                return spec
+        return None
+
+
+################################################################################
+# States made on first use
+
+class LazyState(object):
+    """Stands in for a state in the machine, the state is made by factory() when first used and kept."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.instance = None
+        self.state_id = None            # Set by ltb_transitions.compile_transitions, handed on to the state
+
+    def get(self):
+        if self.instance is None:
+            self.instance = self.factory()
+            self.instance.state_id = self.state_id
+        return self.instance
+
+    def enter(self, machine):
+        self.get().enter(machine)
+
+    def exit(self, machine):
+        self.get().exit(machine)
+
+    def pressed(self, machine):
+        self.get().pressed(machine)
@@ -0,0 +1,379 @@
+# Little Time Buddy screen renderer
+# The screens drawn on the Pi as 1-bit framebuffers, sent to the M4 as the rectangles that changed.
+#
+# Each screen has a layout: static items (titles, labels, rules) and the regions its fields are
+# drawn into (ltb_display.py FIELD_*). The static part of every screen is rendered once and kept
+# in a cache file, the frames one after the other behind a header holding a hash of the layouts,
+# panel size and font. At start up the file is mapped with mmap if the hash matches, otherwise
+# the frames are rendered and the file written again, so a change to a layout rebuilds it by
+# itself.
+#
+# Showing a screen copies its frame, draws the fields and sends the whole panel with a full
+# refresh. A field update on the screen shown only redraws its region, works out the smallest
+# rectangle that changed (whole bytes across) and sends that with a partial refresh: the counter
+# going from 0:00:01 to 0:00:02 sends the last digit, not the panel.
+#
+# A field's text is clipped to its region, so a value longer than planned cannot draw over the rest
+# of the screen or be left behind by the next update. The regions are checked when the cache is
+# opened: each must hold the widest text its field is given (FIELD_CHARS) and lie on the panel.
+#
+# Pixels are one bit each, rows of width / 8 bytes, the leftmost pixel in the top bit, 1 is black.
+#
+#   python3 ltb_render.py           (build and load times, bytes sent for ten minutes of counter)
+
+import hashlib
+import json
+import mmap
+import os
+import time
+from collections import namedtuple
+from struct import Struct
+
+from ltb_display import FIELD_TIME, FIELD_PHASE, FIELD_TODAY, FIELD_WEEK, REFRESH_FULL, REFRESH_PARTIAL
+from ltb_hal import PinChange
+
+
+PANEL_WIDTH = 296               # 2.9" e-paper, landscape
+PANEL_HEIGHT = 128
+
+Rect = namedtuple('Rect', ['x', 'y', 'width', 'height'])     # x and width in multiples of 8
+
+# items: ('text', x, y, scale, text) and ('box', x, y, width, height)
+# regions: {field: (Rect, scale)}, the field text is drawn at the top left of its Rect and clipped to it
+Layout = namedtuple('Layout', ['items', 'regions'])
+
+LAYOUTS = {
+    'home_scrn': Layout(
+        [('text', 8, 8, 2, 'Home'), ('box', 8, 28, 280, 2),
+         ('text', 8, 48, 1, 'Today'), ('text', 8, 80, 1, 'This week')],
+        {FIELD_TODAY: (Rect(96, 44, 192, 16), 2), FIELD_WEEK: (Rect(96, 76, 192, 16), 2)}),
+    'profile1_scrn': Layout(
+        [('text', 8, 8, 2, 'Profile 1'), ('box', 8, 28, 280, 2),
+         ('text', 8, 100, 1, '1 Track'), ('text', 200, 100, 1, '2 Focus')], {}),
+    'profile2_scrn': Layout(
+        [('text', 8, 8, 2, 'Profile 2'), ('box', 8, 28, 280, 2),
+         ('text', 8, 100, 1, '1 Track'), ('text', 200, 100, 1, '2 Focus')], {}),
+    'track1_scrn': Layout(
+        [('text', 8, 8, 2, 'Tracking'), ('box', 8, 28, 280, 2), ('text', 8, 112, 1, '1 or 2 to stop')],
+        {FIELD_TIME: (Rect(16, 48, 264, 32), 4)}),
+    'focus1_scrn': Layout(
+        [('text', 8, 8, 2, 'Focus'), ('box', 8, 28, 280, 2), ('text', 8, 112, 1, '1 Pause   2 Home')],
+        {FIELD_PHASE: (Rect(96, 8, 192, 16), 2), FIELD_TIME: (Rect(16, 48, 264, 32), 4)}),
+    'voicenote_scrn': Layout(
+        [('text', 8, 8, 2, 'Voice note?'), ('box', 8, 28, 280, 2),
+         ('text', 8, 100, 2, '1 Yes'), ('text', 200, 100, 2, '2 No')], {}),
+    'record_scrn': Layout(
+        [('text', 8, 8, 2, 'Recording'), ('box', 8, 28, 280, 2)], {}),
+}
+
+# Widest text the states put in each field: "999:59:59" for the times, "break 999 paused" for the phase
+FIELD_CHARS = {FIELD_TIME: 9, FIELD_PHASE: 16, FIELD_TODAY: 9, FIELD_WEEK: 9}
+
+# 5x7 font, five columns per glyph, the top row in bit 0. Text is drawn in capitals
+FONT = {
+    ' ': '0000000000', '-': '0808080808', '.': '0060600000', '/': '2010080402', '?': '0201510906',
+    ':': '0036360000',
+    '0': '3e5149453e', '1': '00427f4000', '2': '4261514946', '3': '2141454b31',
+    '4': '1814127f10', '5': '2745454539', '6': '3c4a494930', '7': '0171090503', '8': '3649494936',
+    '9': '064949291e',
+    'A': '7e1111117e', 'B': '7f49494936', 'C': '3e41414122', 'D': '7f4141221c', 'E': '7f49494941',
+    'F': '7f09090101', 'G': '3e41415132', 'H': '7f0808087f', 'I': '00417f4100', 'J': '2040413f01',
+    'K': '7f08142241', 'L': '7f40404040', 'M': '7f0204027f', 'N': '7f0408107f', 'O': '3e4141413e',
+    'P': '7f09090906', 'Q': '3e4151215e', 'R': '7f09192946', 'S': '4649494931', 'T': '01017f0101',
+    'U': '3f4040403f', 'V': '1f2040201f', 'W': '7f2018207f', 'X': '6314081463', 'Y': '0304780403',
+    'Z': '6151494543',
+}
+GLYPHS = {char: bytes.fromhex(columns) for char, columns in FONT.items()}
+
+CACHE_MAGIC = b'LTBF'
+CACHE_HEADER = Struct('<4sHHH2x20s')     # magic, width, height, frame count, layout hash
+
+
+def layout_hash(layouts, width=PANEL_WIDTH, height=PANEL_HEIGHT):
+    """SHA-1 over everything a cached frame depends on."""
+    described = {'width': width, 'height': height, 'font': FONT,
+                 'layouts': {name: [layout.items, sorted((field, list(rect), scale) for field, (rect, scale) in layout.regions.items())]
+                             for name, layout in layouts.items()}}
+    return hashlib.sha1(json.dumps(described, sort_keys=True).encode('utf-8')).digest()
+
+
+def check_layouts(layouts, width=PANEL_WIDTH, height=PANEL_HEIGHT):
+    """Raises ValueError, naming every problem, for a region off the panel, not on whole bytes across, or too small
+    for the widest text of its field."""
+    problems = []
+    for name, layout in sorted(layouts.items()):
+        for field, (rect, scale) in sorted(layout.regions.items()):
+            if rect.x % 8 or rect.width % 8:
+                problems.append('%s, field %d: %r is not on whole bytes across' % (name, field, rect))
+            if rect.x < 0 or rect.y < 0 or rect.x + rect.width > width or rect.y + rect.height > height:
+                problems.append('%s, field %d: %r is off the panel' % (name, field, rect))
+            chars = FIELD_CHARS.get(field, 0)
+            if chars * 6 * scale > rect.width or 7 * scale > rect.height:
+                problems.append('%s, field %d: %r at scale %d does not hold %d characters' % (name, field, rect, scale, chars))
+    if problems:
+        raise ValueError('screen layouts: ' + '; '.join(problems))
+
+
+################################################################################
+# Framebuffer
+
+class Framebuffer(object):
+
+    def __init__(self, width=PANEL_WIDTH, height=PANEL_HEIGHT, data=None):
+        self.width = width
+        self.height = height
+        self.stride = width // 8
+        self.data = bytearray(self.stride * height) if data is None else bytearray(data)
+
+    def set(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.data[y * self.stride + (x >> 3)] |= 0x80 >> (x & 7)
+
+    def box(self, x, y, width, height, clip=None):
+        """Fills the box, only the part inside the Rect clip if given."""
+        left, top, right, bottom = x, y, x + width, y + height
+        if clip is not None:
+            left, top = max(left, clip.x), max(top, clip.y)
+            right, bottom = min(right, clip.x + clip.width), min(bottom, clip.y + clip.height)
+        for row in range(top, bottom):
+            for column in range(left, right):
+                self.set(column, row)
+
+    def text(self, x, y, scale, text, clip=None):
+        """Draws text with its top left at (x, y), each glyph 6 * scale pixels across, only inside clip if given."""
+        for char in text.upper():
+            for column, bits in enumerate(GLYPHS.get(char, GLYPHS['?'])):
+                for row in range(7):
+                    if bits >> row & 1:
+                        self.box(x + column * scale, y + row * scale, scale, scale, clip)
+            x += 6 * scale
+
+    def region(self, rect):
+        return crop(self.data, self.stride, rect)
+
+    def paste(self, rect, bits):
+        x, y, width, height = rect
+        start, size = x >> 3, width >> 3
+        for row in range(height):
+            offset = (y + row) * self.stride + start
+            self.data[offset:offset + size] = bits[row * size:(row + 1) * size]
+
+
+def crop(data, stride, rect):
+    """Bits of rect from the frame in data, rows of rect.width / 8 bytes."""
+    x, y, width, height = rect
+    start, size = x >> 3, width >> 3
+    return b''.join(data[row * stride + start:row * stride + start + size] for row in range(y, y + height))
+
+
+def changed_rect(rect, before, after):
+    """Smallest Rect inside rect, whole bytes across, where the bits before and after differ. None if none do."""
+    size = rect.width >> 3
+    rows = [row for row in range(rect.height) if before[row * size:(row + 1) * size] != after[row * size:(row + 1) * size]]
+    if not rows:
+        return None
+    left, right = size, 0
+    for row in rows:
+        line = row * size
+        changed = [byte for byte in range(size) if before[line + byte] != after[line + byte]]
+        left, right = min(left, changed[0]), max(right, changed[-1] + 1)
+    return Rect(rect.x + left * 8, rect.y + rows[0], (right - left) * 8, rows[-1] - rows[0] + 1)
+
+
+def render_layout(layout, width=PANEL_WIDTH, height=PANEL_HEIGHT):
+    """Framebuffer with the static items of layout."""
+    frame = Framebuffer(width, height)
+    for item in layout.items:
+        if item[0] == 'text':
+            frame.text(*item[1:])
+        else:
+            frame.box(*item[1:])
+    return frame
+
+
+################################################################################
+# Frame cache
+
+class FrameCache(object):
+    """The static frame of every layout, memory mapped from path and rebuilt there when the layouts change."""
+
+    def __init__(self, path, layouts=LAYOUTS, width=PANEL_WIDTH, height=PANEL_HEIGHT):
+        self.path = path
+        self.layouts = layouts
+        self.width = width
+        self.height = height
+        check_layouts(layouts, width, height)
+        self.names = sorted(layouts)
+        self.size = width // 8 * height
+        self.digest = layout_hash(layouts, width, height)
+        self.rebuilt = False
+        self.map = self.open()
+        if self.map is None:
+            self.build()
+            self.map = self.open()
+        view = memoryview(self.map)
+        self.frames = {name: view[CACHE_HEADER.size + number * self.size:CACHE_HEADER.size + (number + 1) * self.size]
+                       for number, name in enumerate(self.names)}
+
+    def open(self):
+        """The mapped file, None if it is missing or was made for other layouts."""
+        try:
+            with open(self.path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):     # ValueError for an empty file
+            return None
+        expected = (CACHE_MAGIC, self.width, self.height, len(self.names), self.digest)
+        if len(mapped) != CACHE_HEADER.size + len(self.names) * self.size or CACHE_HEADER.unpack_from(mapped) != expected:
+            mapped.close()
+            return None
+        return mapped
+
+    def build(self):
+        frames = [render_layout(self.layouts[name], self.width, self.height).data for name in self.names]
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, self.width, self.height, len(self.names), self.digest))
+            for frame in frames:
+                f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self.rebuilt = True
+
+
+################################################################################
+# Panel
+
+class Panel(object):
+    """The e-paper panel behind the serial link. Screens raised by the states stack up, the last one is drawn
+    when "commit" runs (after each flush of ltb_coalesce.ScreenCoalescer)."""
+
+    def __init__(self, link, cache):
+        self.link = link                # ltb_display.DisplayLink
+        self.cache = cache
+        self.frame = Framebuffer(cache.width, cache.height)
+        self.raised = []                # Names of the screens up, the last one is on the panel
+        self.fields = {}                # Name -> fields wanted
+        self.shown = None               # Name on the panel
+        self.shown_fields = {}
+        self.failed = link.failed       # A failed command leaves the M4 unknown, the next commit draws everything
+
+        # Statistics
+        self.full_refreshes = 0
+        self.partial_refreshes = 0
+        self.bytes_sent = 0
+
+    def output(self, hardware, name):
+        return BitmapOutput(self, hardware, name)
+
+    def commit(self):
+        name = self.raised[-1] if self.raised else None
+        if name is None:
+            return
+        fields = self.fields.get(name, {})
+        layout = self.cache.layouts[name]
+        if name != self.shown or self.link.failed != self.failed:
+            self.failed = self.link.failed
+            self.frame.data[:] = self.cache.frames[name]
+            for field, value in fields.items():
+                if field in layout.regions:
+                    rect, scale = layout.regions[field]
+                    self.frame.text(rect.x, rect.y, scale, value, clip=rect)
+            whole = Rect(0, 0, self.frame.width, self.frame.height)
+            self.send([(whole, self.frame.data)], REFRESH_FULL)
+            self.full_refreshes += 1
+        else:
+            rects = []
+            for field, value in fields.items():
+                if field not in layout.regions or self.shown_fields.get(field) == value:
+                    continue
+                rect, scale = layout.regions[field]
+                before = self.frame.region(rect)
+                self.frame.paste(rect, crop(self.cache.frames[name], self.frame.stride, rect))    # Back to the static frame
+                self.frame.text(rect.x, rect.y, scale, value, clip=rect)
+                dirty = changed_rect(rect, before, self.frame.region(rect))
+                if dirty is not None:
+                    rects.append((dirty, self.frame.region(dirty)))
+            if rects:
+                self.send(rects, REFRESH_PARTIAL)
+                self.partial_refreshes += 1
+        self.shown = name
+        self.shown_fields = dict(fields)
+
+    def send(self, rects, refresh):
+        self.bytes_sent += sum(len(bits) for rect, bits in rects)
+        self.link.draw(rects, refresh)
+
+    def stats(self):
+        return {
+            'full_refreshes': self.full_refreshes,
+            'partial_refreshes': self.partial_refreshes,
+            'bytes_sent': self.bytes_sent,
+            'cache_rebuilt': self.cache.rebuilt,
+        }
+
+
+class BitmapOutput(object):
+    """Stands in for a screen select pin: raising it puts the screen on top of the panel, "update" sets its fields."""
+
+    def __init__(self, panel, hardware, name):
+        self.panel = panel
+        self.hardware = hardware        # Records the changes like the pins do, see ltb_hal.py
+        self.name = name
+        self.pin = sorted(panel.cache.layouts).index(name) + 1
+
+    @property
+    def value(self):
+        return self.name in self.panel.raised
+
+    @value.setter
+    def value(self, value):
+        raised = self.panel.raised
+        if self.name in raised:
+            raised.remove(self.name)
+        if value:
+            raised.append(self.name)
+        else:
+            self.panel.fields.pop(self.name, None)
+        if self.hardware is not None and self.hardware.record:
+            self.hardware.changes.append(PinChange(time.monotonic_ns(), self.name, self.pin, bool(value)))
+
+    def update(self, fields):
+        self.panel.fields.setdefault(self.name, {}).update(fields)
+
+
+################################################################################
+
+def main():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'screens.cache')
+        start = time.perf_counter()
+        FrameCache(path)
+        built_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        cache = FrameCache(path)
+        loaded_ms = (time.perf_counter() - start) * 1000
+        print('%d screens: rendered and cached in %.1f ms, mapped from the cache in %.2f ms (rebuilt %s)'
+              % (len(cache.names), built_ms, loaded_ms, cache.rebuilt))
+
+        class Link(object):             # Counts what would go over the serial port
+            failed = 0
+
+            def draw(self, rects, refresh):
+                pass
+
+        panel = Panel(Link(), cache)
+        output = panel.output(None, 'track1_scrn')
+        output.value = True
+        for second in range(600):
+            output.update({FIELD_TIME: '0:%02d:%02d' % divmod(second, 60)})
+            panel.commit()
+        full = cache.size
+        print('ten minutes of counter: %d bytes sent (%d partial refreshes), %d bytes as full frames'
+              % (panel.bytes_sent, panel.partial_refreshes, full * 600))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Little Time Buddy report
+# Per day and per task totals from the session logs, read as a chain of generators:
+#
+#   read_lines -> parse_sessions -> split_days -> between -> Report.add
+#
+# Only one line of a file is in memory at a time and the totals grow with the number of days in
+# the report, not with the size of the logs. Tracking_1.csv, stamp.csv and the delta rows of
+# Test_Pi_SM_TimeCalcs.py can be mixed, the format is picked per line (see ltb_logformat.py).
+#
+#   python3 ltb_report.py Tracking_1.csv stamp.csv
+#   python3 ltb_report.py --from 2022-04-01 --to 2022-04-30 Tracking_1.csv
+
+import argparse
+import calendar
+import csv
+import sys
+import time
+
+from ltb_index import DAY, day_parts
+from ltb_logformat import TRACKING_TASK, parse_fields
+from ltb_store import format_duration
+
+
+################################################################################
+# Pipeline
+
+def read_lines(paths, counts=None):
+    """Fields of every line of every file, counting them in counts['lines'] if given."""
+    for path in paths:
+        with open(path, newline='') as f:
+            for fields in csv.reader(f):
+                if counts is not None:
+                    counts['lines'] += 1
+                yield fields
+
+
+def parse_sessions(lines, task=TRACKING_TASK):
+    for fields in lines:
+        yield from parse_fields(fields, task)
+
+
+def split_days(sessions):
+    """(day, task, seconds) per local day of each session, empty and backwards sessions are dropped."""
+    for record in sessions:
+        for day, seconds in day_parts(record):
+            yield day, record.task, seconds
+
+
+def between(parts, first_day=None, last_day=None):
+    for part in parts:
+        if (first_day is None or part[0] >= first_day) and (last_day is None or part[0] <= last_day):
+            yield part
+
+
+################################################################################
+# Totals
+
+def parse_day(text):
+    """Day number from "YYYY-MM-DD"."""
+    return calendar.timegm(time.strptime(text, '%Y-%m-%d')) // DAY
+
+
+def format_day(day):
+    return time.strftime('%Y-%m-%d %a', time.gmtime(day * DAY))
+
+
+class Report(object):
+
+    def __init__(self):
+        self.days = {}          # day number -> seconds
+        self.tasks = {}         # task id -> seconds
+        self.parts = 0
+
+    def add(self, parts):
+        for day, task, seconds in parts:
+            self.days[day] = self.days.get(day, 0) + seconds
+            self.tasks[task] = self.tasks.get(task, 0) + seconds
+            self.parts += 1
+        return self
+
+    def total(self):
+        return sum(self.days.values())
+
+    def write(self, out=sys.stdout):
+        out.write('Day                Total\n')
+        for day in sorted(self.days):
+            out.write('%-14s %9s\n' % (format_day(day), format_duration(self.days[day])))
+        out.write('\nTask               Total\n')
+        for task in sorted(self.tasks):
+            out.write('%-14d %9s\n' % (task, format_duration(self.tasks[task])))
+        out.write('\n%-14s %9s\n' % ('All', format_duration(self.total())))
+
+
+def build_report(paths, first_day=None, last_day=None, counts=None):
+    lines = read_lines(paths, counts)
+    return Report().add(between(split_days(parse_sessions(lines)), first_day, last_day))
+
+
+################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description='Per day and per task totals from the session logs')
+    parser.add_argument('files', nargs='+', help='Tracking_1.csv, stamp.csv or exported spreadsheets')
+    parser.add_argument('--from', dest='first', type=parse_day, help='first day, YYYY-MM-DD')
+    parser.add_argument('--to', dest='last', type=parse_day, help='last day, YYYY-MM-DD')
+    args = parser.parse_args()
+
+    build_report(args.files, args.first, args.last).write()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Little Time Buddy scheduler
+# Deferred and periodic actions for the state machine, driven by the monotonic clock.
+#
+# Timers live in a heap ordered by deadline. The main loop asks "next_timeout" how long it may
+# block on the input queue, then calls "run_due" to fire whatever has expired. Nothing sleeps.
+
+import heapq
+import itertools
+import time
+
+
+################################################################################
+# Timer handle returned to the caller so the action can be cancelled
+
+class Timer(object):
+
+    __slots__ = ('deadline', 'interval', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, interval, callback, args):
+        self.deadline = deadline
+        self.interval = interval        # None for a one shot action
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True           # Removed lazily when it reaches the top of the heap
+
+
+################################################################################
+# Scheduler
+
+class Scheduler(object):
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.sequence = itertools.count()   # Keeps equal deadlines in the order they were added
+
+    def call_at(self, deadline, callback, *args):
+        timer = Timer(deadline, None, callback, args)
+        self.push(timer)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) once, delay seconds from now."""
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        """Run callback(*args) every interval seconds until the timer is cancelled."""
+        timer = Timer(self.clock() + interval, interval, callback, args)
+        self.push(timer)
+        return timer
+
+    def push(self, timer):
+        heapq.heappush(self.heap, (timer.deadline, next(self.sequence), timer))
+
+    def next_timeout(self):
+        """Seconds until the next deadline, 0 if one is overdue, None if nothing is scheduled."""
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return max(0.0, heap[0][0] - self.clock())
+
+    def run_due(self):
+        """Fire every timer whose deadline has passed, returns how many ran."""
+        heap = self.heap
+        now = self.clock()
+        fired = 0
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)[2]
+            if timer.cancelled:
+                continue
+            if timer.interval is not None:
+                # Periodic actions keep their phase, a late wakeup does not drift the next one
+                timer.deadline += timer.interval
+                if timer.deadline <= now:
+                    timer.deadline = now + timer.interval
+                self.push(timer)
+            timer.callback(*timer.args)
+            fired += 1
+        return fired
+
+    def __len__(self):
+        return sum(1 for entry in self.heap if not entry[2].cancelled)
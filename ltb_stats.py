@@ -0,0 +1,25 @@
+# Little Time Buddy statistics helpers
+# Small summaries shared by the runtimes, the background writer and the benchmarks.
+
+import math
+
+
+def latency_report(samples):
+    """Summary of latencies in microseconds, samples are nanoseconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+    count = len(ordered)
+    return {
+        'count': count,
+        'mean_us': sum(ordered) / count / 1000,
+        'p50_us': percentile(ordered, 50) / 1000,
+        'p99_us': percentile(ordered, 99) / 1000,
+        'max_us': ordered[-1] / 1000,
+    }
+
+
+def percentile(ordered, pct):
+    """Nearest rank percentile of an already sorted list, the smallest sample with pct percent at or below it."""
+    rank = math.ceil(len(ordered) * pct / 100)
+    return ordered[min(len(ordered) - 1, max(0, rank - 1))]
@@ -0,0 +1,157 @@
+# Little Time Buddy session store
+# Fixed width binary records for tracked sessions, with the spreadsheet generated on demand.
+#
+# File layout: an 8 byte header (magic, version, record size) followed by packed records.
+# Every record is RECORD.size bytes, so the file is loaded with one read and struct.iter_unpack.
+# A record cut short by a power loss is simply ignored on load.
+#
+#   python3 ltb_store.py export sessions.ltb Tracking_1.csv
+#   python3 ltb_store.py load sessions.ltb
+
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+
+MAGIC = b'LTBS'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+
+# start epoch, end epoch, UTC offset in seconds, voice note reference, task id
+RECORD = struct.Struct('<qqiIH2x')
+
+SessionRecord = namedtuple('SessionRecord', ['start', 'end', 'utc_offset', 'note', 'task'])
+
+NOTE_NONE = 0                   # Voice note reference for "no note recorded"
+NOTE_PLACEHOLDER = 1            # The speech to text placeholder written by the "Record" state
+
+DEFAULT_NOTES = {NOTE_PLACEHOLDER: "'Speech to text voice note'"}
+
+CSV_HEADER = ['"Time In, Zone"', ' Timestamp In', '" Time Out, Zone "', 'Timestamp Out', 'Total Time', 'Voice Note']
+
+
+################################################################################
+# Support functions
+
+def format_offset(seconds):
+    """UTC offset as "UTC+HH:MM", the zone column of the spreadsheet."""
+    sign = '-' if seconds < 0 else '+'
+    minutes = abs(seconds) // 60
+    return 'UTC%s%02d:%02d' % (sign, minutes // 60, minutes % 60)
+
+
+def format_stamp(epoch, utc_offset):
+    """Local wall time as "YYYY-MM-DD_HH:MM:SS", zero padded so it sorts and parses cleanly."""
+    local = datetime.fromtimestamp(epoch, timezone(timedelta(seconds=utc_offset)))
+    return local.strftime('%Y-%m-%d_%H:%M:%S')
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+def csv_row(record, notes):
+    zone = format_offset(record.utc_offset)
+    return [zone, format_stamp(record.start, record.utc_offset),
+            zone, format_stamp(record.end, record.utc_offset),
+            format_duration(record.end - record.start),
+            notes.get(record.note, '') if record.note != NOTE_NONE else '']
+
+
+################################################################################
+# Store
+
+class SessionStore(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        size = os.fstat(self.fd).st_size
+        if size == 0:
+            os.write(self.fd, HEADER.pack(MAGIC, VERSION, RECORD.size))
+        else:
+            check_header(os.pread(self.fd, HEADER.size, 0), path)
+            tail = (size - HEADER.size) % RECORD.size
+            if tail:
+                os.ftruncate(self.fd, size - tail)      # Drop a record cut short by a power loss
+
+    def append(self, record):
+        """One write() per record, O_APPEND keeps it at the end of the file."""
+        os.write(self.fd, RECORD.pack(*record))
+
+    def sync(self):
+        os.fsync(self.fd)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def check_header(data, path):
+    if len(data) < HEADER.size:
+        raise ValueError('%s: not a session store' % path)
+    magic, version, size = HEADER.unpack(data[:HEADER.size])
+    if magic != MAGIC or version != VERSION or size != RECORD.size:
+        raise ValueError('%s: unsupported session store (version %d, record size %d)' % (path, version, size))
+
+
+def read_records(path, chunk_records=4096):
+    """Stream every complete record in the store, memory use stays at one chunk."""
+    with open(path, 'rb') as f:
+        check_header(f.read(HEADER.size), path)
+        chunk = chunk_records * RECORD.size
+        while True:
+            data = f.read(chunk)
+            usable = len(data) - len(data) % RECORD.size
+            for fields in RECORD.iter_unpack(data[:usable]):
+                yield SessionRecord._make(fields)
+            if len(data) < chunk:
+                return
+
+
+def load_records(path):
+    """Whole store as a list, one read."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    check_header(data, path)
+    usable = len(data) - (len(data) - HEADER.size) % RECORD.size
+    return [SessionRecord._make(fields) for fields in RECORD.iter_unpack(data[HEADER.size:usable])]
+
+
+def export_csv(store_path, csv_path, notes=None):
+    """Write the spreadsheet from the store, streaming one chunk of records at a time."""
+    notes = DEFAULT_NOTES if notes is None else notes
+    count = 0
+    with open(csv_path, 'w', newline='') as f:
+        f.write(','.join(CSV_HEADER) + '\r\n')
+        for record in read_records(store_path):
+            f.write(','.join(csv_row(record, notes)) + '\r\n')
+            count += 1
+    return count
+
+
+################################################################################
+
+def main(argv):
+    if len(argv) == 4 and argv[1] == 'export':
+        count = export_csv(argv[2], argv[3])
+        print('Exported %d sessions to %s' % (count, argv[3]))
+    elif len(argv) == 3 and argv[1] == 'load':
+        start = time.perf_counter()
+        records = load_records(argv[2])
+        elapsed = time.perf_counter() - start
+        print('Loaded %d sessions in %.2f ms' % (len(records), elapsed * 1000))
+    else:
+        print('usage: ltb_store.py export STORE CSV | load STORE')
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
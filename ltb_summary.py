@@ -0,0 +1,99 @@
+# Little Time Buddy running totals
+# Per day and per week tracked time, kept up to date as sessions close so "Home" can show today's
+# and this week's totals without reading the log.
+#
+# Adding a session touches one day entry and one week entry (two of each past midnight) and the
+# summary file is rewritten with write-temp-and-rename. Only the last KEEP_DAYS days are kept, so
+# the file stays a few hundred bytes. It is rebuilt from the session store, or the spreadsheet if
+# there is no store, only when it is missing or fails its checksum.
+
+import json
+import os
+import zlib
+
+from ltb_checkpoint import atomic_write
+from ltb_index import day_parts, today, week_start
+from ltb_logformat import read_tracking_csv
+from ltb_store import HEADER, read_records
+
+
+KEEP_DAYS = 14
+
+
+################################################################################
+# Summary
+
+class TimeSummary(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.days = {}          # day number -> seconds
+        self.weeks = {}         # day number of the week's Monday -> seconds
+
+    def add(self, record, save=True):
+        for day, seconds in day_parts(record):
+            self.days[day] = self.days.get(day, 0) + seconds
+            week = week_start(day)
+            self.weeks[week] = self.weeks.get(week, 0) + seconds
+        self.prune()
+        if save:
+            self.save()
+
+    def prune(self):
+        if len(self.days) > KEEP_DAYS:
+            newest = max(self.days)
+            for day in [day for day in self.days if day <= newest - KEEP_DAYS]:
+                del self.days[day]
+            for week in [week for week in self.weeks if week < week_start(newest) - 7]:
+                del self.weeks[week]
+
+    def today_total(self, day=None):
+        return self.days.get(today() if day is None else day, 0)
+
+    def week_total(self, day=None):
+        return self.weeks.get(week_start(today() if day is None else day), 0)
+
+    # Persistence
+
+    def save(self):
+        # Copies first, the totals are updated on the state machine thread and saved on the writer thread
+        days, weeks = dict(self.days), dict(self.weeks)
+        body = json.dumps({'days': days, 'weeks': weeks}, separators=(',', ':')).encode()
+        atomic_write(self.path, b'%08x\n' % zlib.crc32(body) + body)
+
+    def load(self):
+        """True if the summary file was present and intact."""
+        try:
+            with open(self.path, 'rb') as f:
+                crc, _, body = f.read().partition(b'\n')
+            if int(crc, 16) != zlib.crc32(body):
+                return False
+            data = json.loads(body)
+            self.days = {int(day): seconds for day, seconds in data['days'].items()}
+            self.weeks = {int(week): seconds for week, seconds in data['weeks'].items()}
+        except (OSError, ValueError, KeyError, AttributeError):
+            return False
+        return True
+
+    def rebuild(self, records):
+        self.days = {}
+        self.weeks = {}
+        oldest = today() - KEEP_DAYS
+        for record in records:
+            if record.end // 86400 >= oldest:       # Older sessions cannot reach the kept days
+                self.add(record, save=False)
+        self.save()
+
+
+def open_summary(path, store_path=None, csv_path=None):
+    """Load the summary, rebuilding it from the store or the spreadsheet if it is missing or damaged. A store without
+    records (just created) does not count, the spreadsheet may still hold the sessions from before it."""
+    summary = TimeSummary(path)
+    if not summary.load():
+        if store_path and os.path.exists(store_path) and os.path.getsize(store_path) > HEADER.size:
+            summary.rebuild(read_records(store_path))
+        elif csv_path and os.path.exists(csv_path):
+            summary.rebuild(read_tracking_csv(csv_path))
+        else:
+            summary.save()
+    return summary
@@ -0,0 +1,162 @@
+# Little Time Buddy tasks
+# The tasks that can be tracked, each with its own open session and running total.
+#
+# Tasks are defined in a JSON file as [id, name] pairs:
+#
+#   {"tasks": [[1, "Task 1"], [2, "Reading"], [3, "Exercise"]]}
+#
+# and loaded into a table of parallel arrays indexed by slot: start stamps of the open sessions,
+# UTC offsets, and the seconds tracked per task since start up. Starting, stopping and switching
+# are a dict lookup from task id to slot and a few array stores, so hundreds of tasks cost no more
+# per press than one. Any number of tasks may have a session open at the same time.
+#
+# Switching closes the running task's session and opens the next at the same instant, so the two
+# sessions meet without a gap and the only thing written is the one finished session.
+#
+#   python3 ltb_tasks.py 500        (time loading a file of 500 tasks)
+
+import json
+import time
+from array import array
+
+from ltb_checkpoint import Checkpoint
+from ltb_clock import Stamp, NS, HALF
+
+
+DEFAULT_TASKS = [(1, 'Task 1')]     # Without a task file there is only the task of "Tracking1"
+
+
+################################################################################
+# Task table
+
+class TaskTable(object):
+
+    def __init__(self, definitions):
+        definitions = list(definitions)
+        count = len(definitions)
+        self.ids = array('H', bytes(2 * count))
+        self.names = [''] * count
+        self.slots = {}                         # task id -> slot
+        for slot, (task_id, name) in enumerate(definitions):
+            if not 0 < task_id < 0x10000:
+                raise ValueError('task id %r out of range 1..65535' % (task_id,))
+            if task_id in self.slots:
+                raise ValueError('task id %d defined twice, %r and %r' % (task_id, self.names[self.slots[task_id]], name))
+            self.ids[slot] = task_id
+            self.names[slot] = name
+            self.slots[task_id] = slot
+        # Open sessions, start_ns is 0 while a task is not being tracked
+        self.start_wall = array('q', bytes(8 * count))
+        self.start_ns = array('q', bytes(8 * count))
+        self.offsets = array('i', bytes(4 * count))
+        self.totals = array('q', bytes(8 * count))      # Seconds of the sessions closed since start up
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, task_id):
+        return task_id in self.slots
+
+    def name(self, task_id):
+        return self.names[self.slots[task_id]]
+
+    def is_open(self, task_id):
+        return self.start_ns[self.slots[task_id]] != 0
+
+    def started(self, task_id):
+        """Stamp of the open session of task_id, None if it is not being tracked."""
+        slot = self.slots[task_id]
+        return Stamp(self.start_wall[slot], self.start_ns[slot]) if self.start_ns[slot] else None
+
+    def offset(self, task_id):
+        return self.offsets[self.slots[task_id]]
+
+    # Sessions
+
+    def start(self, task_id, stamp, utc_offset):
+        slot = self.slots[task_id]
+        if self.start_ns[slot]:
+            raise ValueError('task %d is already being tracked' % task_id)
+        self.start_wall[slot] = stamp.wall
+        self.start_ns[slot] = stamp.mono_ns or 1      # 0 means "not open"
+        self.offsets[slot] = utc_offset
+
+    def stop(self, task_id, stamp):
+        """Closes the session of task_id at stamp, returns the Stamp it started at."""
+        slot = self.slots[task_id]
+        if not self.start_ns[slot]:
+            raise ValueError('task %d is not being tracked' % task_id)
+        stamp_in = Stamp(self.start_wall[slot], self.start_ns[slot])
+        self.totals[slot] += max(0, (stamp.mono_ns - stamp_in.mono_ns + HALF) // NS)
+        self.start_ns[slot] = 0
+        return stamp_in
+
+    def switch(self, from_id, to_id, stamp, utc_offset):
+        """Stops from_id and starts to_id at the same stamp, returns the Stamp the stopped session started at."""
+        if to_id not in self.slots:                 # Nothing changes for an unknown task
+            raise KeyError(to_id)
+        stamp_in = self.stop(from_id, stamp)
+        self.start(to_id, stamp, utc_offset)
+        return stamp_in
+
+    def tracked(self, task_id, now_ns=None):
+        """Seconds tracked for task_id since start up, the open session included."""
+        slot = self.slots[task_id]
+        total = self.totals[slot]
+        if self.start_ns[slot]:
+            now_ns = time.monotonic_ns() if now_ns is None else now_ns
+            total += max(0, (now_ns - self.start_ns[slot] + HALF) // NS)
+        return total
+
+    def open_sessions(self):
+        """Checkpoint for every open session, for ltb_checkpoint.SessionCheckpoint.save_all."""
+        return [Checkpoint(self.start_wall[slot], 0, self.offsets[slot], self.ids[slot])
+                for slot in range(len(self.names)) if self.start_ns[slot]]
+
+
+################################################################################
+# Task file
+
+def parse_tasks(data):
+    """[(id, name)] from the decoded JSON of a task file."""
+    return [(int(task_id), str(name)) for task_id, name in data['tasks']]
+
+
+def load_tasks(path, default=DEFAULT_TASKS):
+    """TaskTable from the task file at path, from default if there is no file."""
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(f.read())
+    except FileNotFoundError:
+        return TaskTable(default)
+    return TaskTable(parse_tasks(data))
+
+
+################################################################################
+
+def main():
+    import os
+    import sys
+    import tempfile
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tasks.json')
+        with open(path, 'w') as f:
+            json.dump({'tasks': [[number, 'Task %d' % number] for number in range(1, count + 1)]}, f)
+        start = time.perf_counter_ns()
+        tasks = load_tasks(path)
+        load_us = (time.perf_counter_ns() - start) / 1000
+
+    stamp = Stamp(int(time.time()), time.monotonic_ns())
+    tasks.start(1, stamp, 0)
+    switches = 100000
+    start = time.perf_counter_ns()
+    for number in range(switches):
+        tasks.switch(number % count + 1, (number + 1) % count + 1, stamp, 0)
+    switch_us = (time.perf_counter_ns() - start) / switches / 1000
+    print('%d tasks loaded in %.0f us, switch %.2f us' % (len(tasks), load_us, switch_us))
+
+
+if __name__ == '__main__':
+    main()
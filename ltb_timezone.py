@@ -0,0 +1,164 @@
+# Little Time Buddy time zone
+# The local UTC offset, resolved once and cached until it can change.
+#
+# The zone is resolved from the C library (/etc/localtime, or TZ) together with its DST
+# transitions for the current year, found by bisecting time.localtime(). An offset lookup is then
+# a comparison against the current window, [last transition, next transition). Crossing a
+# transition moves the window along the cached list, the list is resolved again at the new year
+# or when the zone file changes ("timedatectl set-timezone" replaces it). The file is looked at
+# no more than every CHECK_INTERVAL seconds and time.tzset() reloads the zone before resolving.
+#
+#   python3 ltb_timezone.py
+
+import bisect
+import calendar
+import os
+import time
+from collections import namedtuple
+
+
+ZONE_FILE = '/etc/localtime'
+CHECK_INTERVAL = 60             # Seconds between looks at the zone file
+
+Transition = namedtuple('Transition', ['epoch', 'utc_offset', 'name'])
+
+
+################################################################################
+# Support functions
+
+def local_info(epoch):
+    """(UTC offset in seconds, zone name) the C library gives for epoch."""
+    tm = time.localtime(epoch)
+    return tm.tm_gmtoff, tm.tm_zone
+
+
+def find_transitions(first, last, step=7 * 86400):
+    """Changes of offset or zone name in [first, last), probing every step seconds and bisecting to the second."""
+    transitions = []
+    info = local_info(first)
+    start = first
+    while start < last:
+        end = min(start + step, last)
+        if local_info(end) == info:
+            start = end
+            continue
+        low, high = start, end
+        while high - low > 1:
+            middle = (low + high) // 2
+            if local_info(middle) == info:
+                low = middle
+            else:
+                high = middle
+        info = local_info(high)
+        if high < last:
+            transitions.append(Transition(high, *info))
+        start = high
+    return transitions
+
+
+def year_bounds(epoch):
+    """UTC epochs of the start of the year containing epoch and of the next year."""
+    year = time.gmtime(epoch).tm_year
+    return calendar.timegm((year, 1, 1, 0, 0, 0)), calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+
+
+################################################################################
+# Time zone service
+
+class TimeZone(object):
+
+    def __init__(self, zone_file=ZONE_FILE, clock=time.monotonic):
+        self.zone_file = zone_file
+        self.clock = clock
+        self.resolves = 0               # How often the zone was worked out, once a year plus zone changes
+        self.zone_id = self.zone_file_id()
+        self.next_check = clock() + CHECK_INTERVAL
+        self.resolve(int(time.time()))
+
+    def zone_file_id(self):
+        try:
+            st = os.stat(self.zone_file)
+        except OSError:
+            return os.environ.get('TZ'), None
+        return os.environ.get('TZ'), st.st_ino, st.st_mtime_ns
+
+    def resolve(self, epoch):
+        self.year_start, self.year_end = year_bounds(epoch)
+        transitions = find_transitions(self.year_start, self.year_end)
+        self.transitions = transitions
+        self.edges = [self.year_start] + [transition.epoch for transition in transitions]
+        self.infos = [local_info(self.year_start)] + [transition[1:] for transition in transitions]
+        self.move_window(epoch)
+        self.resolves += 1
+
+    def move_window(self, epoch):
+        i = bisect.bisect_right(self.edges, epoch) - 1
+        self.valid_from = self.edges[i]
+        self.valid_until = self.edges[i + 1] if i + 1 < len(self.edges) else self.year_end
+        self.current = self.infos[i]
+
+    def check_zone_file(self):
+        if self.clock() < self.next_check:
+            return
+        self.next_check = self.clock() + CHECK_INTERVAL
+        zone_id = self.zone_file_id()
+        if zone_id != self.zone_id:
+            self.zone_id = zone_id
+            time.tzset()
+            self.resolve(int(time.time()))
+
+    # Lookups
+
+    def lookup(self, epoch=None):
+        """(UTC offset in seconds, zone name) at epoch, now if not given."""
+        self.check_zone_file()
+        if epoch is None:
+            epoch = int(time.time())
+            if not self.valid_from <= epoch < self.valid_until:     # Crossed a transition or the new year
+                if self.year_start <= epoch < self.year_end:
+                    self.move_window(epoch)
+                else:
+                    self.resolve(epoch)
+        if self.valid_from <= epoch < self.valid_until:
+            return self.current
+        if self.year_start <= epoch < self.year_end:
+            return self.infos[bisect.bisect_right(self.edges, epoch) - 1]
+        return local_info(epoch)           # Another year, not worth caching
+
+    def offset(self, epoch=None):
+        return self.lookup(epoch)[0]
+
+    def name(self, epoch=None):
+        return self.lookup(epoch)[1]
+
+    def wall_fields(self, epoch, utc_offset=None):
+        """time.struct_time of the local wall clock at epoch, in the given offset or the zone's own."""
+        return time.gmtime(epoch + (self.offset(epoch) if utc_offset is None else utc_offset))
+
+
+################################################################################
+
+def main():
+    from datetime import datetime
+    from dateutil import tz
+
+    zone = TimeZone()
+    print('Zone %s, UTC offset %d s, resolved in window %d..%d' % (zone.name(), zone.offset(),
+                                                                 zone.valid_from, zone.valid_until))
+    for transition in zone.transitions:
+        print('  transition at %s UTC to %d s (%s)' % (time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(transition.epoch)),
+                                                       transition.utc_offset, transition.name))
+    count = 20000
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        zone.offset()
+    cached = (time.perf_counter_ns() - start) / count / 1000
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        datetime.now(tz=tz.tzlocal()).utcoffset()
+    tzlocal = (time.perf_counter_ns() - start) / count / 1000
+    print('offset(): %.2f us, datetime.now(tz=tz.tzlocal()).utcoffset(): %.2f us' % (cached, tzlocal))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# Little Time Buddy trace
+# Structured trace entries in a fixed in-memory ring, in place of the prints in the states.
+#
+# An entry is 32 bytes packed straight into a preallocated bytearray: monotonic timestamp, event
+# code, the id of the state shown at the time and two integer arguments. Recording one builds no
+# strings, the newest "size" entries are kept and older ones are overwritten. The text for an
+# event is only made when the ring is dumped: on request (SIGUSR1), when the program crashes, or
+# for every entry as it is recorded while "echo" is on (the old TESTING switch).
+
+import signal
+import sys
+import threading
+import time
+from struct import Struct
+
+
+# timestamp_ns, event code, state id, two arguments
+ENTRY = Struct('<QHH4xqq')
+
+EVENTS = {}                     # event code -> (name, text), text is a format string or a function
+
+
+def trace_event(code, name, text):
+    """Register an event code. text is a str.format string over state, a and b,
+    or a function taking (state, a, b) for arguments that need converting."""
+    if code in EVENTS:
+        raise ValueError('trace event %d is already %s' % (code, EVENTS[code][0]))
+    EVENTS[code] = (name, text)
+    return code
+
+
+# Events of the state machines, codes below 16 are kept for these
+TR_ENTER = trace_event(1, 'enter', 'Entering {state}')
+TR_EXIT = trace_event(2, 'exit', 'Exiting {state}')
+TR_PRESSED = trace_event(3, 'pressed', 'Switch {a} pressed, {b} us in queue')
+TR_DEFERRED = trace_event(4, 'deferred', 'Holding {state}, switch {a} press deferred')
+
+
+################################################################################
+# Ring
+
+class TraceRing(object):
+
+    def __init__(self, size=4096, echo=False):
+        self.size = size
+        self.buffer = bytearray(size * ENTRY.size)
+        self.count = 0                  # Entries ever recorded, the next one goes to count % size
+        self.state = 0                  # Id of the state being shown, stored with every entry
+        self.state_names = ['-']        # Id 0 is "no state yet"
+        self.state_ids = {}
+        self.echo = echo
+        self.pack_into = ENTRY.pack_into
+        self.clock = time.monotonic_ns
+
+    def name_states(self, names):
+        for name in names:
+            if name not in self.state_ids:
+                self.state_ids[name] = len(self.state_names)
+                self.state_names.append(name)
+
+    def enter(self, name):
+        self.state = self.state_ids.get(name, 0)
+
+    def emit(self, code, a=0, b=0):
+        self.pack_into(self.buffer, (self.count % self.size) * ENTRY.size, self.clock(), code, self.state, a, b)
+        self.count += 1
+        if self.echo:
+            print(self.format_entry(self.clock(), code, self.state, a, b, None))
+
+    # Reading, never on the hot path
+
+    def entries(self):
+        """(timestamp_ns, code, state id, a, b) from the oldest kept entry to the newest."""
+        count = self.count
+        first = max(0, count - self.size)
+        for number in range(first, count):
+            timestamp_ns, code, state, a, b = ENTRY.unpack_from(self.buffer, (number % self.size) * ENTRY.size)
+            yield timestamp_ns, code, state, a, b
+
+    def format_entry(self, timestamp_ns, code, state, a, b, origin_ns):
+        name, text = EVENTS.get(code, ('event %d' % code, 'a={a} b={b}'))
+        state_name = self.state_names[state] if state < len(self.state_names) else 'state %d' % state
+        try:
+            message = text(state_name, a, b) if callable(text) else text.format(state=state_name, a=a, b=b)
+        except Exception as error:     # A bad formatter must not hide the rest of the dump
+            message = 'a=%d b=%d (%r)' % (a, b, error)
+        if origin_ns is None:
+            return message
+        return '%12.6f  %-14s %-12s %s' % ((timestamp_ns - origin_ns) / 1e9, state_name, name, message)
+
+    def dump(self, out=None, reason='requested'):
+        out = sys.stderr if out is None else out
+        entries = list(self.entries())
+        now = self.clock()
+        out.write('---- trace, %s, %d of %d entries, seconds from now ----\n' % (reason, len(entries), self.count))
+        for timestamp_ns, code, state, a, b in entries:
+            out.write(self.format_entry(timestamp_ns, code, state, a, b, now) + '\n')
+        out.flush()
+
+
+################################################################################
+# Dumps on request and on a crash
+
+def install_dump_handlers(ring, dump_signal=signal.SIGUSR1):
+    """Dump the ring on dump_signal and before the traceback of an uncaught exception in any thread."""
+    if dump_signal is not None:
+        signal.signal(dump_signal, lambda signum, frame: ring.dump())
+
+    previous_excepthook = sys.excepthook
+    previous_threading_hook = threading.excepthook
+
+    def excepthook(kind, value, tb):
+        if not issubclass(kind, KeyboardInterrupt):
+            ring.dump(reason='crash')
+        previous_excepthook(kind, value, tb)
+
+    def threading_hook(args):
+        ring.dump(reason='crash in thread %s' % (args.thread.name if args.thread else '?'))
+        previous_threading_hook(args)
+
+    sys.excepthook = excepthook
+    threading.excepthook = threading_hook
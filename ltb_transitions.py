@@ -0,0 +1,154 @@
+# Little Time Buddy transitions
+# The state machine's transitions as one declarative table, compiled into flat arrays at startup.
+#
+# A row is (state, event, guard) -> (target, actions). The event is a small integer (the switch
+# number), the guard a function of the machine or None for "always", and the actions are functions
+# of the machine, run in order just before the transition. A row with the target None is an
+# internal transition: the actions run and the state stays, nothing is exited or entered.
+# Compiling gives every state an integer id and puts the rows for each (state id, event) in one
+# slot of a flat list, so a press is one index computation and at most a few guard calls. The
+# first row whose guard passes is taken, so an event fires exactly one transition or none.
+#
+# States may sit inside a parent state. Going from one state to another only exits the states
+# below their least common ancestor and enters the ones below it on the target's side, so the
+# parent's screen and anything it set up stay as they are while moving between its children. The
+# states to exit and enter are worked out once per row when compiling. A state without rows for an
+# event takes its parent's rows, the path still starting from the state itself.
+#
+# Compiling checks the table against the states added to the machine: unknown state, target or
+# event names, rows that can never be taken (after an unguarded row for the same slot) and states
+# that cannot be reached from the initial state are all a ValueError at startup instead of a
+# dead screen later.
+
+from collections import deque, namedtuple
+
+
+Transition = namedtuple('Transition', ['state', 'event', 'guard', 'target', 'actions'])
+
+Row = namedtuple('Row', ['guard', 'target', 'target_name', 'actions', 'path'])
+
+
+################################################################################
+# State hierarchy
+
+def ancestry(name, parents):
+    """name and the states it sits in, outermost first."""
+    chain = []
+    while name is not None:
+        chain.append(name)
+        name = parents.get(name)
+    chain.reverse()
+    return chain
+
+
+def state_path(source, target, parents):
+    """(exits, enters) going from source to target: names of the states left, innermost first, and of
+    the states entered, outermost first. Only states below the least common ancestor are in either.
+    Going to the state itself leaves and enters it again, going to one of its parents enters nothing."""
+    if source is None:
+        return (), tuple(ancestry(target, parents))
+    if source == target:
+        return (source,), (target,)
+    up, down = ancestry(source, parents), ancestry(target, parents)
+    common = 0
+    while common < min(len(up), len(down)) and up[common] == down[common]:
+        common += 1
+    return tuple(reversed(up[common:])), tuple(down[common:])
+
+
+################################################################################
+# Table
+
+
+class TransitionTable(object):
+
+    def __init__(self, transitions, state_names, events, initial, parents=None):
+        self.names = list(state_names)
+        self.ids = {name: number for number, name in enumerate(self.names)}
+        self.events = tuple(events)
+        self.width = max(self.events) + 1          # Slot of (state, event) is state * width + event
+        self.slots = [()] * (len(self.names) * self.width)
+        self.parents = dict(parents or {})
+        self.initial = initial
+
+        problems = []
+        for name, parent in self.parents.items():
+            if name not in self.ids or parent not in self.ids:
+                problems.append('unknown state in parent %r of %r' % (parent, name))
+                continue
+            seen = {name}
+            while parent is not None and parent not in seen:
+                seen.add(parent)
+                parent = self.parents.get(parent)
+            if parent is not None:
+                problems.append('%r is inside itself' % (parent,))
+                break
+        if problems:
+            raise ValueError('transition table: ' + '; '.join(problems))
+
+        declared = {}                   # (state, event) -> [(guard, target, actions)] as written
+        for transition in transitions:
+            state, event, guard, target, actions = transition
+            if state not in self.ids:
+                problems.append('unknown state %r' % (state,))
+                continue
+            if target is not None and target not in self.ids:
+                problems.append('%r: unknown target %r' % (state, target))
+                continue
+            if event not in self.events:
+                problems.append('%r: unknown event %r' % (state, event))
+                continue
+            rows = declared.setdefault((state, event), [])
+            if rows and rows[-1][0] is None:
+                problems.append('%r, event %r: row to %r follows one without a guard and is never taken' % (state, event, target))
+                continue
+            rows.append((guard, target, tuple(actions)))
+
+        for name in self.names:
+            chain = ancestry(name, self.parents)[::-1]
+            for event in self.events:
+                owner = next((state for state in chain if (state, event) in declared), None)
+                if owner is not None:
+                    self.slots[self.ids[name] * self.width + event] = tuple(
+                        Row(guard, self.ids[target], target, actions, state_path(name, target, self.parents)) if target is not None
+                        else Row(guard, -1, None, actions, None)
+                        for guard, target, actions in declared[(owner, event)])
+
+        if initial not in self.ids:
+            problems.append('unknown initial state %r' % (initial,))
+        else:
+            unreachable = [self.names[number] for number in sorted(set(range(len(self.names))) - self.reachable())]
+            if unreachable:
+                problems.append('not reachable from %r: %s' % (initial, ', '.join(unreachable)))
+        if problems:
+            raise ValueError('transition table: ' + '; '.join(problems))
+
+    def reachable(self):
+        """Ids of the states some sequence of events leads to from the initial state, guards assumed to pass.
+        Entering a state enters its parents, so they count as reached too."""
+        seen = set()
+        queue = deque([self.ids[self.initial]])
+        while queue:
+            state = queue.popleft()
+            if state in seen:
+                continue
+            for name in ancestry(self.names[state], self.parents):
+                seen.add(self.ids[name])
+            for rows in self.slots[state * self.width:(state + 1) * self.width]:
+                queue.extend(row.target for row in rows if row.target >= 0 and row.target not in seen)
+        return seen
+
+    def lookup(self, state_id, event, machine):
+        """The Row taken for event in state_id, None if no row matches."""
+        for row in self.slots[state_id * self.width + event]:
+            if row.guard is None or row.guard(machine):
+                return row
+        return None
+
+
+def compile_transitions(transitions, states, events, initial, parents=None):
+    """TransitionTable for the states dict (and parents) of a machine, and "state_id" set on every state object."""
+    table = TransitionTable(transitions, states, events, initial, parents)
+    for name, state in states.items():
+        getattr(state, 'state', state).state_id = table.ids[name]     # The sync state inside a SyncStateAdapter
+    return table
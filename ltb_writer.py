@@ -0,0 +1,161 @@
+# Little Time Buddy background writer
+# All file I/O runs on one dedicated thread fed by a bounded queue, so a slow SD card flush
+# never delays a screen change.
+#
+# What happens when the queue is full is the overflow policy:
+#   OVERFLOW_BLOCK        the caller waits for room (nothing is ever lost)
+#   OVERFLOW_DROP_OLDEST  the oldest waiting job is discarded to make room
+#   OVERFLOW_SPILL        jobs go to an unbounded list in RAM and are moved back in order
+# "close" lets the thread finish every queued job before it returns.
+
+import threading
+import time
+from collections import deque
+
+from ltb_scheduler import Scheduler
+from ltb_stats import latency_report
+
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_SPILL = 'spill'
+
+
+################################################################################
+# Writer thread
+
+class BackgroundWriter(object):
+
+    def __init__(self, maxsize=64, overflow=OVERFLOW_BLOCK, name='ltb-writer'):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL):
+            raise ValueError('unknown overflow policy %r' % (overflow,))
+        self.maxsize = maxsize
+        self.overflow = overflow
+
+        self.jobs = deque()
+        self.spill = deque()
+        self.condition = threading.Condition()
+        self.closing = False
+
+        # Timers that run on the writer thread, e.g. the journal's FSYNC_INTERVAL commit.
+        # Only touch it from jobs, it is not shared with the state machine's scheduler.
+        self.scheduler = Scheduler()
+        self.idle_hooks = []            # Run on the writer thread each time the queue drains
+
+        # Statistics
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.write_latencies = deque(maxlen=1024)   # Nanoseconds spent running each job
+        self.wait_latencies = deque(maxlen=1024)    # Nanoseconds each job waited in the queue
+        self.idle_latencies = deque(maxlen=1024)    # Nanoseconds spent in the idle hooks, where the journal commits
+        self.write_observer = None      # Optional callables given the same job and idle hook nanoseconds, see ltb_metrics.py
+        self.idle_observer = None
+
+        self.thread = threading.Thread(target=self.worker, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args):
+        """Queue func(*args) for the writer thread, returns False if a job had to be dropped."""
+        job = (time.perf_counter_ns(), func, args)
+        accepted = True
+        with self.condition:
+            if self.closing:
+                raise RuntimeError('writer is closed')
+            if self.spill or len(self.jobs) >= self.maxsize:
+                if self.overflow == OVERFLOW_BLOCK:
+                    while len(self.jobs) >= self.maxsize:
+                        self.condition.wait()
+                    self.jobs.append(job)
+                elif self.overflow == OVERFLOW_DROP_OLDEST:
+                    self.jobs.popleft()
+                    self.jobs.append(job)
+                    self.dropped += 1
+                    accepted = False
+                else:
+                    self.spill.append(job)
+                    self.spilled += 1
+            else:
+                self.jobs.append(job)
+            self.submitted += 1
+            depth = len(self.jobs) + len(self.spill)
+            self.depth_total += depth
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self.condition.notify_all()
+        return accepted
+
+    def on_idle(self, hook):
+        self.idle_hooks.append(hook)
+
+    def worker(self):
+        condition = self.condition
+        while True:
+            with condition:
+                while not self.jobs and not self.closing:
+                    condition.wait(self.scheduler.next_timeout())
+                    if not self.jobs:
+                        break               # Timed out for a timer, or woken to close
+                if self.jobs:
+                    job = self.jobs.popleft()
+                    if self.spill:
+                        self.jobs.append(self.spill.popleft())
+                    condition.notify_all()  # Room for a blocked "submit"
+                else:
+                    job = None
+                    if self.closing:
+                        return
+                drained = not self.jobs
+
+            if job is not None:
+                queued, func, args = job
+                start = time.perf_counter_ns()
+                self.guard(func, *args)
+                end = time.perf_counter_ns()
+                self.wait_latencies.append(start - queued)
+                self.write_latencies.append(end - start)
+                self.completed += 1
+                if self.write_observer is not None:
+                    self.write_observer(end - start)
+
+            self.guard(self.scheduler.run_due)
+            if drained and self.idle_hooks:
+                start = time.perf_counter_ns()
+                for hook in self.idle_hooks:
+                    self.guard(hook)
+                elapsed = time.perf_counter_ns() - start
+                self.idle_latencies.append(elapsed)
+                if self.idle_observer is not None:
+                    self.idle_observer(elapsed)
+
+    def guard(self, func, *args):
+        try:
+            func(*args)
+        except Exception as error:      # A failed write must not kill the thread
+            print('Writer job failed:', repr(error))
+
+    def close(self, timeout=None):
+        """Finish every queued job, then stop the thread."""
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+    def stats(self):
+        with self.condition:
+            depth = len(self.jobs) + len(self.spill)
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'depth': depth,
+            'max_depth': self.max_depth,
+            'mean_depth': self.depth_total / self.submitted if self.submitted else 0,
+            'write_latency': latency_report(self.write_latencies),
+            'wait_latency': latency_report(self.wait_latencies),
+            'idle_latency': latency_report(self.idle_latencies),
+        }